@@ -0,0 +1,175 @@
+import concurrent.futures
+import itertools
+import json
+import os
+
+import engine
+import search
+import transposition
+
+# How deep every position of a game is searched for its score
+ANALYSIS_DEPTH = 3
+# A move that loses this many centipawns compared to the best move is flagged as a blunder
+BLUNDER_THRESHOLD = 200
+# How many games are sent to a worker at once
+GAMES_PER_TASK = 8
+# the memory budget of the transposition table of each worker process, which is shared by the positions of a game
+ANALYSIS_TABLE_MEGABYTES = 16
+
+# The transposition table of this worker process, made by the first game that is analyzed in it
+_workerTable = None
+
+
+def scorePosition(controller: engine.GameController, depth, table):
+    """
+    Scores the position from the point of view of the player to move. A position where the game is over
+    scores a checkmate or a draw, the others are searched to the given depth.
+    """
+    if not controller.hasLegalMove():
+        return -search.MATE_SCORE if controller.inCheck() else 0
+    if controller.getDrawReason() is not None:
+        return 0
+    return search.Searcher(controller.copy(), depth, None, table).search().score
+
+
+def countPieces(board: engine.BitboardBoard, color: bool):
+    return bin(board.getOccupancy(color)).count("1")
+
+
+def analyzeGame(record, depth, table):
+    """
+    Replays the moves of a game from the match history and works out the statistics of every move:
+    how many legal moves the player had, whether it captured or gave check, and how much worse it scored
+    than the best move. Every position is searched once, since the score after a move is the score of the
+    next position from the other player's point of view.
+    """
+    controller = engine.GameController(engine.BitboardBoard)
+    moveStats = []
+    scores = []
+    for moveString in record["moves"]:
+        controller.calculateLegalMoves()
+        legalMoveCount = len(controller.getMoves())
+        scores.append(scorePosition(controller, depth, table))
+        color = controller.getActiveColor()
+        enemyPieces = countPieces(controller.getBoard(), not color)
+        try:
+            controller.processMove(moveString)
+        except engine.MoveErrors:
+            # a game that can't be replayed is only analyzed up to the move that can't be made
+            scores.pop()
+            break
+        controller.setActiveColor(not color)
+        moveStats.append({
+            "move": moveString,
+            "legalMoves": legalMoveCount,
+            "capture": countPieces(controller.getBoard(), not color) < enemyPieces,
+            "check": controller.inCheck(),
+        })
+    if moveStats:
+        scores.append(scorePosition(controller, depth, table))
+    for ply, stats in enumerate(moveStats):
+        # the best score the player could get, against the score they got from the other player's point of view
+        delta = scores[ply] + scores[ply + 1]
+        stats["score"] = scores[ply]
+        stats["delta"] = delta
+        stats["blunder"] = delta >= BLUNDER_THRESHOLD
+    return {"sequence": record["sequence"], "depth": depth, "moves": moveStats}
+
+
+def analyzeGames(records, depth):
+    """Analyzes a group of games one after another, this runs in a worker process."""
+    global _workerTable
+    if _workerTable is None:
+        _workerTable = transposition.TranspositionTable(ANALYSIS_TABLE_MEGABYTES)
+    results = []
+    for record in records:
+        _workerTable.clear()
+        results.append(analyzeGame(record, depth, _workerTable))
+    return results
+
+
+def iterHistoryGames(path, skippedSequences):
+    """Reads the games of the match history journal one at a time, leaving out the ones without moves."""
+    with open(path, "r") as journal:
+        for line in journal:
+            if not line.endswith("\n"):
+                break
+            record = json.loads(line)
+            if "moves" in record and record["sequence"] not in skippedSequences:
+                yield record
+
+
+def loadCheckpoint(path, depth):
+    """
+    Returns the sequence numbers of the games that are already in the results file, which is where the
+    analysis carries on from. A result that was only partly written when the analysis stopped is removed.
+    """
+    finishedSequences = set()
+    if not os.path.exists(path):
+        return finishedSequences
+    with open(path, "rb") as resultsFile:
+        validLength = 0
+        for line in resultsFile:
+            if not line.endswith(b"\n"):
+                break
+            result = json.loads(line)
+            if result["depth"] != depth:
+                raise ValueError(f"{path} was analyzed at depth {result['depth']}, use another results file")
+            finishedSequences.add(result["sequence"])
+            validLength += len(line)
+    if validLength != os.path.getsize(path):
+        with open(path, "r+b") as resultsFile:
+            resultsFile.truncate(validLength)
+    return finishedSequences
+
+
+def analyzeArchive(historyPath, resultsPath, depth=ANALYSIS_DEPTH, workers=None, gamesPerTask=GAMES_PER_TASK,
+                   limit=None):
+    """
+    Analyzes every game of the match history in a pool of worker processes, appending the result of every
+    game to the results file as soon as it is done, so stopping the analysis only loses the games that were
+    being worked on. Games that are already in the results file are skipped. Only a few groups of games
+    per worker are read ahead, so the archive is never loaded all at once.
+    Returns the number of games that were analyzed.
+    """
+    records = itertools.islice(iterHistoryGames(historyPath, loadCheckpoint(resultsPath, depth)), limit)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    analyzedCount = 0
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor, open(resultsPath, "a") as resultsFile:
+        pending = set()
+        while True:
+            # keeps every worker busy with one more group waiting behind it
+            while len(pending) < workers * 2:
+                group = list(itertools.islice(records, gamesPerTask))
+                if len(group) == 0:
+                    break
+                pending.add(executor.submit(analyzeGames, group, depth))
+            if not pending:
+                break
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                results = future.result()
+                resultsFile.write("".join(json.dumps(result) + "\n" for result in results))
+                resultsFile.flush()
+                analyzedCount += len(results)
+    return analyzedCount
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Analyzes every move of the games in the match history.")
+    parser.add_argument("--history", default="match_history.jsonl")
+    parser.add_argument("--output", default="analysis.jsonl", help="the results file, which is resumed if it exists")
+    parser.add_argument("--depth", type=int, default=ANALYSIS_DEPTH)
+    parser.add_argument("--workers", type=int, default=None, help="one per processor by default")
+    parser.add_argument("--games-per-task", type=int, default=GAMES_PER_TASK)
+    parser.add_argument("--limit", type=int, default=None, help="stops after this many games")
+    args = parser.parse_args()
+    startTime = time.perf_counter()
+    gameCount = analyzeArchive(args.history, args.output, args.depth, args.workers, args.games_per_task, args.limit)
+    seconds = time.perf_counter() - startTime
+    print(f"Analyzed {gameCount} games in {seconds:.1f}s ({gameCount / seconds if seconds else 0:.1f} games/s), "
+          f"results are in {args.output}")
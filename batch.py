@@ -0,0 +1,221 @@
+import array
+import random
+import time
+
+import engine
+
+# Every position takes the same number of 64 bit words, one record after another in a single array:
+#  0-11  the piece bitboards in piece index order
+#  12    bit 0 the active color, bits 1-4 the castling rights KQkq,
+#        bits 5-8 the column of the en passant pawn plus one (0 when there isn't one), bit 9 the color of that pawn
+#  13    the halfmove clock in the low 32 bits and the full move number in the high 32 bits
+#  14    where the hashes of the position history start in the history array
+#  15    how many hashes the position history has
+RECORD_WORDS = 16
+
+# The outcome codes of the analyzed positions
+OUTCOMES = (None, "checkmate", "stalemate", "threefold repetition", "the 50-move rule", "insufficient material")
+OUTCOME_CODES = dict((outcome, code) for code, outcome in enumerate(OUTCOMES))
+
+# The moves are packed into 16 bits each, the 12 bit move id with the 4 move flag bits above it
+MOVE_FLAG_SHIFT = 12
+
+
+def packMove(move: engine.Move) -> int:
+    return move.getMoveID() | (move.getFlags() << MOVE_FLAG_SHIFT)
+
+
+def unpackMove(packedMove: int):
+    """Returns the (origin square, target square, flags) of a packed move, the squares are row * 8 + col."""
+    return (packedMove >> 6) & 63, packedMove & 63, packedMove >> MOVE_FLAG_SHIFT
+
+
+class PositionBatch:
+    """
+    The positions of many games packed next to each other, so they can be sent to a worker together
+    and analyzed one after another without setting up a board or game controller for each of them.
+    The position histories of all of the games share one array.
+    """
+
+    def __init__(self, records=None, history=None):
+        self._records = records if records is not None else array.array("Q")
+        self._history = history if history is not None else array.array("Q")
+
+    def __len__(self):
+        return len(self._records) // RECORD_WORDS
+
+    def addController(self, controller: engine.GameController) -> int:
+        """Packs the current position and position history of the game controller, returning its index."""
+        board = controller.getBoard()
+        if isinstance(board, engine.BitboardBoard):
+            bitboards = board.getBitboards()
+        else:
+            bitboards = [0] * 12
+            for square in range(64):
+                piece = board.getPiece(square >> 3, square & 7)
+                if piece is not None:
+                    bitboards[piece.getIndex()] |= 1 << square
+        flags = 1 if controller.getActiveColor() else 0
+        for bit, available in enumerate(controller.getCastleAvailability(True) +
+                                        controller.getCastleAvailability(False)):
+            if available:
+                flags |= 2 << bit
+        enPassantSquare = controller.getEnPassantSquare()
+        if enPassantSquare != ():
+            flags |= (enPassantSquare[1] + 1) << 5
+            if enPassantSquare[2]:
+                flags |= 1 << 9
+        positionHistory = controller.getPositionHistory()
+        index = len(self)
+        self._records.extend(bitboards)
+        self._records.extend((flags, controller.getHalfmoveClock() | (controller.getFullmoveNumber() << 32),
+                              len(self._history), len(positionHistory)))
+        self._history.extend(positionHistory)
+        return index
+
+    def loadPosition(self, index, controller: engine.GameController, board: engine.BitboardBoard):
+        """Sets up the game controller with a position of the batch, reusing the same board for every position."""
+        records = self._records
+        start = index * RECORD_WORDS
+        board.loadBitboards(records[start:start + 12])
+        flags = records[start + 12]
+        enPassantCol = (flags >> 5) & 15
+        if enPassantCol == 0:
+            enPassantSquare = ()
+        elif flags & (1 << 9):
+            enPassantSquare = (4, enPassantCol - 1, True)
+        else:
+            enPassantSquare = (3, enPassantCol - 1, False)
+        historyStart = records[start + 14]
+        controller.setPosition(board, bool(flags & 1), (bool(flags & 2), bool(flags & 4)),
+                               (bool(flags & 8), bool(flags & 16)), enPassantSquare,
+                               records[start + 13] & 0xFFFFFFFF, records[start + 13] >> 32,
+                               self._history[historyStart:historyStart + records[start + 15]])
+
+    def toBytes(self):
+        """Returns the batch as two byte strings, which is all that is sent to a worker process."""
+        return self._records.tobytes(), self._history.tobytes()
+
+    @classmethod
+    def fromBytes(cls, recordBytes, historyBytes):
+        records = array.array("Q")
+        records.frombytes(recordBytes)
+        history = array.array("Q")
+        history.frombytes(historyBytes)
+        return cls(records, history)
+
+
+class BatchResult:
+    """
+    The legal moves and outcomes of every position of a batch. The packed moves of all of the positions
+    are in one array, and the moves of position i are the ones from offset i up to offset i + 1.
+    """
+
+    def __init__(self, moves, offsets, outcomes):
+        self._moves = moves
+        self._offsets = offsets
+        self._outcomes = outcomes
+
+    def __len__(self):
+        return len(self._outcomes)
+
+    def getMoves(self, index):
+        """Returns the packed legal moves of a position, see unpackMove."""
+        return self._moves[self._offsets[index]:self._offsets[index + 1]]
+
+    def getOutcome(self, index):
+        """Returns "checkmate", "stalemate", the reason for another kind of draw, or None if the game goes on."""
+        return OUTCOMES[self._outcomes[index]]
+
+    def toBytes(self):
+        return self._moves.tobytes(), self._offsets.tobytes(), bytes(self._outcomes)
+
+    @classmethod
+    def fromBytes(cls, moveBytes, offsetBytes, outcomeBytes):
+        moves = array.array("H")
+        moves.frombytes(moveBytes)
+        offsets = array.array("I")
+        offsets.frombytes(offsetBytes)
+        return cls(moves, offsets, array.array("B", outcomeBytes))
+
+
+def analyzeBatch(positions: PositionBatch) -> BatchResult:
+    """
+    Calculates the legal moves and the outcome of every position in the batch, with one game controller
+    and one board that are set up again for each position instead of being created for every game.
+    """
+    controller = engine.GameController(engine.BitboardBoard)
+    board = engine.BitboardBoard()
+    moves = array.array("H")
+    offsets = array.array("I", [0])
+    outcomes = array.array("B")
+    for index in range(len(positions)):
+        positions.loadPosition(index, controller, board)
+        controller.calculateLegalMoves()
+        legalMoves = controller.getMoves()
+        moves.extend(packMove(move) for move in legalMoves)
+        offsets.append(len(moves))
+        if len(legalMoves) == 0:
+            outcomes.append(OUTCOME_CODES["checkmate" if controller.inCheck() else "stalemate"])
+        else:
+            outcomes.append(OUTCOME_CODES[controller.getDrawReason()])
+    return BatchResult(moves, offsets, outcomes)
+
+
+def analyzePackedBatch(recordBytes, historyBytes):
+    """Analyzes a batch that was sent as bytes and sends the result back as bytes, this runs in a worker process."""
+    return analyzeBatch(PositionBatch.fromBytes(recordBytes, historyBytes)).toBytes()
+
+
+def randomPositions(count: int, seed=2022, maxHalfmoves=60, boardType=engine.BitboardBoard):
+    """
+    Plays random moves from the starting position and returns a game controller of its own for each of
+    the count positions reached, starting a new game when one ends or goes maxHalfmoves without a capture
+    or a pawn move. Promotions are to a random piece so every kind of piece shows up.
+    """
+    rng = random.Random(seed)
+    positions = []
+    controller = engine.GameController(boardType)
+    while len(positions) < count:
+        moves = controller.calculateLegalMoves()
+        if len(moves) == 0 or controller.getHalfmoveClock() >= maxHalfmoves:
+            controller = engine.GameController(boardType)
+            continue
+        controller.setPromotionType(rng.choice("nbrq"))
+        controller.makeMove(rng.choice(moves))
+        controller.setPromotionType(None)
+        controller.setActiveColor(not controller.getActiveColor())
+        positions.append(engine.GameController.fromState(controller.getState(), boardType))
+    return positions
+
+
+if __name__ == '__main__':
+    import sys
+
+    # compares the batch against analyzing the positions of random games one game state at a time
+    positionCount = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    controllers = randomPositions(positionCount)
+    states = [gameController.getState() for gameController in controllers]
+
+    startTime = time.perf_counter()
+    separateResults = []
+    for state in states:
+        gameController = engine.GameController.fromState(state, engine.BitboardBoard)
+        gameController.calculateLegalMoves()
+        separateResults.append(sorted(packMove(move) for move in gameController.getMoves()))
+    separateSeconds = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    batch = PositionBatch()
+    for gameController in controllers:
+        batch.addController(gameController)
+    packedResult = analyzePackedBatch(*batch.toBytes())
+    result = BatchResult.fromBytes(*packedResult)
+    batchSeconds = time.perf_counter() - startTime
+
+    for positionIndex in range(positionCount):
+        if sorted(result.getMoves(positionIndex)) != separateResults[positionIndex]:
+            raise AssertionError(f"The batch moves differ for position {positionIndex}")
+    print(f"{positionCount} positions, {len(batch.toBytes()[0]) + len(batch.toBytes()[1])} bytes sent")
+    print(f"One game state at a time: {separateSeconds:.3f}s ({positionCount / separateSeconds:.0f} positions/s)")
+    print(f"Batch:                    {batchSeconds:.3f}s ({positionCount / batchSeconds:.0f} positions/s)")
@@ -0,0 +1,109 @@
+import random
+import sys
+import time
+import tracemalloc
+
+import engine
+
+
+def calculateLegalMoves(controller: engine.GameController):
+    """Runs the same three step pipeline that the games use every turn"""
+    controller.calculateMoves()
+    controller.calculateSpecialMoves()
+    controller.calculateValidMoves()
+
+
+def moveSignature(controller: engine.GameController):
+    """A comparable summary of the moves a controller has calculated"""
+    move: engine.Move
+    return sorted((move.getMoveID(), move.getPieceType(), move.getFlags()) for move in controller.getMoves())
+
+
+def playRandomGames(games: int, maxPlies: int, seed: int):
+    """
+    Plays random games with a grid controller and a bitboard controller side by side,
+    timing the legal move generation of every position on both and making sure they agree.
+    """
+    rng = random.Random(seed)
+    gridTime = 0.0
+    bitboardTime = 0.0
+    positions = 0
+    for _ in range(games):
+        gridController = engine.GameController(engine.Board)
+        bitboardController = engine.GameController(engine.BitboardBoard)
+        for _ in range(maxPlies):
+            start = time.perf_counter()
+            calculateLegalMoves(gridController)
+            gridTime += time.perf_counter() - start
+            start = time.perf_counter()
+            calculateLegalMoves(bitboardController)
+            bitboardTime += time.perf_counter() - start
+            positions += 1
+            if moveSignature(gridController) != moveSignature(bitboardController):
+                raise AssertionError(f"Move generation differs on position:\n{gridController.getBoard()}")
+
+            if len(gridController.getMoves()) == 0:
+                break
+            moveID = rng.choice(gridController.getMoves()).getMoveID()
+            color = gridController.getActiveColor()
+            for controller in (gridController, bitboardController):
+                move = [move for move in controller.getMoves() if move.getMoveID() == moveID][0]
+                controller.setPromotionType("q")
+                controller.makeMove(move)
+                controller.setPromotionType(None)
+                controller.setActiveColor(not color)
+    return positions, gridTime, bitboardTime
+
+
+def measureMemory(games: int, maxPlies: int, seed: int, boardType=engine.BitboardBoard):
+    """
+    Plays random games and traces the memory allocated while generating the legal moves of every position,
+    giving the average number of moves, the bytes the finished move list keeps,
+    the peak bytes while generating and the number of memory blocks the move list keeps.
+    """
+    rng = random.Random(seed)
+    positions = 0
+    totalMoves = 0
+    keptBytes = 0
+    peakBytes = 0
+    keptBlocks = 0
+    tracemalloc.start()
+    for _ in range(games):
+        controller = engine.GameController(boardType)
+        for _ in range(maxPlies):
+            # the moves of the last position are freed first so only the new ones are counted
+            controller.calculateMoves()
+            controller.getMoves().clear()
+            tracemalloc.reset_peak()
+            startBytes = tracemalloc.get_traced_memory()[0]
+            startBlocks = sys.getallocatedblocks()
+            calculateLegalMoves(controller)
+            currentBytes, peak = tracemalloc.get_traced_memory()
+            keptBlocks += sys.getallocatedblocks() - startBlocks
+            keptBytes += currentBytes - startBytes
+            peakBytes += peak - startBytes
+            positions += 1
+            moves = controller.getMoves()
+            totalMoves += len(moves)
+            if len(moves) == 0:
+                break
+            controller.setPromotionType("q")
+            controller.makeMove(rng.choice(moves))
+            controller.setPromotionType(None)
+            controller.setActiveColor(not controller.getActiveColor())
+    tracemalloc.stop()
+    return totalMoves / positions, keptBytes / positions, peakBytes / positions, keptBlocks / positions
+
+
+if __name__ == '__main__':
+    gameCount = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    positionCount, gridSeconds, bitboardSeconds = playRandomGames(gameCount, 100, 2022)
+    print(f"Legal move generation over {positionCount} positions from {gameCount} random games")
+    print(f"Grid board:     {gridSeconds:.3f}s ({positionCount / gridSeconds:.0f} positions/s)")
+    print(f"Bitboard board: {bitboardSeconds:.3f}s ({positionCount / bitboardSeconds:.0f} positions/s)")
+    print(f"Speedup:        {gridSeconds / bitboardSeconds:.2f}x")
+    averageMoves, averageBytes, averagePeak, averageBlocks = measureMemory(gameCount, 100, 2022)
+    print(f"Memory per position with {averageMoves:.1f} legal moves on average (bitboard board)")
+    print(f"Move list:      {averageBytes:.0f} bytes, {averageBlocks:.0f} blocks "
+          f"({averageBytes / max(averageMoves, 1):.1f} bytes per move)")
+    print(f"Peak:           {averagePeak:.0f} bytes while generating")
@@ -0,0 +1,265 @@
+import bisect
+import json
+import mmap
+import os
+import random
+import struct
+
+import engine
+import storage
+
+# Every entry of the book takes 16 bytes, laid out like the entries of a Polyglot book and stored big endian:
+# the 64 bit hash of the position, the 16 bit move, the 16 bit weight of the move and 32 unused bits.
+# The entries are sorted by hash, so the moves of a position are next to each other and found by binary search.
+# The hash is this engine's zobrist hash, so books made for other engines can't be read even though the
+# layout is the same.
+ENTRY_FORMAT = ">QHHI"
+ENTRY_SIZE = struct.calcsize(ENTRY_FORMAT)
+KEY_FORMAT = ">Q"
+
+# The moves are packed like Polyglot moves, where the ranks count up from white's side:
+# bits 0-2 the target file, 3-5 the target rank, 6-8 the origin file, 9-11 the origin rank,
+# and 12-14 the promotion piece. Castling is written as the king moving onto its own rook.
+BOOK_PROMOTION_TYPES = " nbrq"
+
+# How many moves into a game are added to the book when it is built
+BOOK_MAX_PLY = 16
+
+# The file the bot reads the book from
+BOOK_PATH = "opening_book.bin"
+
+# Well known opening lines that the book is built from along with the games of the match history,
+# written in the notation that the game controller's processMove takes
+OPENING_LINES = (
+    "pe2e4 pe7e5 ng1f3 nb8c6 bf1b5 pa7a6 bb5a4 ng8f6 0-0 bf8e7",
+    "pe2e4 pe7e5 ng1f3 nb8c6 bf1c4 bf8c5 pc2c3 ng8f6 pd2d3 pd7d6",
+    "pe2e4 pe7e5 ng1f3 nb8c6 bf1c4 ng8f6 pd2d3 bf8e7",
+    "pe2e4 pe7e5 ng1f3 nb8c6 pd2d4 pe5d4 nf3d4 ng8f6",
+    "pe2e4 pe7e5 ng1f3 ng8f6 nf3e5 pd7d6 ne5f3 nf6e4",
+    "pe2e4 pc7c5 ng1f3 pd7d6 pd2d4 pc5d4 nf3d4 ng8f6 nb1c3 pa7a6",
+    "pe2e4 pc7c5 ng1f3 nb8c6 pd2d4 pc5d4 nf3d4 ng8f6 nb1c3 pe7e5",
+    "pe2e4 pe7e6 pd2d4 pd7d5 nb1c3 ng8f6 bc1g5 bf8e7",
+    "pe2e4 pc7c6 pd2d4 pd7d5 nb1c3 pd5e4 nc3e4 bc8f5 ne4g3 bf5g6",
+    "pe2e4 pd7d5 pe4d5 qd8d5 nb1c3 qd5a5",
+    "pd2d4 pd7d5 pc2c4 pe7e6 nb1c3 ng8f6 bc1g5 bf8e7 pe2e3 0-0",
+    "pd2d4 pd7d5 pc2c4 pc7c6 ng1f3 ng8f6 nb1c3 pd5c4",
+    "pd2d4 pd7d5 pc2c4 pd5c4 ng1f3 ng8f6 pe2e3 pe7e6 bf1c4 pc7c5",
+    "pd2d4 ng8f6 pc2c4 pg7g6 nb1c3 bf8g7 pe2e4 pd7d6 ng1f3 0-0",
+    "pd2d4 ng8f6 pc2c4 pe7e6 nb1c3 bf8b4 pe2e3 0-0",
+    "pd2d4 ng8f6 pc2c4 pe7e6 ng1f3 pb7b6 pg2g3 bc8b7",
+    "pd2d4 ng8f6 pc2c4 pg7g6 nb1c3 pd7d5 pc4d5 nf6d5 pe2e4 nd5c3 pb2c3 bf8g7",
+    "pd2d4 pd7d5 bc1f4 ng8f6 pe2e3 pe7e6 ng1f3 pc7c5",
+    "pc2c4 pe7e5 nb1c3 ng8f6 ng1f3 nb8c6 pg2g3 pd7d5",
+    "ng1f3 pd7d5 pg2g3 ng8f6 bf1g2 pe7e6 0-0 bf8e7",
+)
+
+
+def encodeMove(originRow, originCol, targetRow, targetCol, promotionType=None):
+    """Packs a move into the 16 bits of a book entry, the rows are the board's rows where row 0 is rank 8."""
+    bookMove = targetCol | ((7 - targetRow) << 3) | (originCol << 6) | ((7 - originRow) << 9)
+    if promotionType is not None:
+        bookMove |= BOOK_PROMOTION_TYPES.index(promotionType) << 12
+    return bookMove
+
+
+def decodeMove(bookMove):
+    """Returns the (origin row, origin col, target row, target col, promotion type) of a book move."""
+    promotionType = BOOK_PROMOTION_TYPES[(bookMove >> 12) & 7] if (bookMove >> 12) & 7 else None
+    return 7 - ((bookMove >> 9) & 7), (bookMove >> 6) & 7, 7 - ((bookMove >> 3) & 7), bookMove & 7, promotionType
+
+
+def encodeMoveString(moveString, color: bool):
+    """Packs a move that was given back by processMove, which is the full notation or castling."""
+    if moveString in ("0-0", "0-0-0"):
+        row = 7 if color else 0
+        return encodeMove(row, 4, row, 7 if moveString == "0-0" else 0)
+    originRow, originCol = engine.GameController.parseSquare(moveString[1:3])
+    targetRow, targetCol = engine.GameController.parseSquare(moveString[3:5])
+    return encodeMove(originRow, originCol, targetRow, targetCol, moveString[5] if len(moveString) == 6 else None)
+
+
+class OpeningBook:
+    """
+    An opening book that is read straight from the memory mapped file, nothing is parsed when it is opened.
+    Looking up a position is a binary search over the sorted entries, which only reads the few entries
+    that the search lands on.
+    """
+
+    def __init__(self, path=BOOK_PATH):
+        self._file = open(path, "rb")
+        self._entryCount = os.path.getsize(path) // ENTRY_SIZE
+        # an empty file can't be memory mapped
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._entryCount else None
+
+    def __len__(self):
+        return self._entryCount
+
+    def getKey(self, index):
+        return struct.unpack_from(KEY_FORMAT, self._map, index * ENTRY_SIZE)[0]
+
+    def findEntries(self, positionHash):
+        """Returns the (book move, weight) of every move that the book has for the position."""
+        low, high = 0, self._entryCount
+        while low < high:
+            middle = (low + high) // 2
+            if self.getKey(middle) < positionHash:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        while low < self._entryCount:
+            key, bookMove, weight, _ = struct.unpack_from(ENTRY_FORMAT, self._map, low * ENTRY_SIZE)
+            if key != positionHash:
+                break
+            entries.append((bookMove, weight))
+            low += 1
+        return entries
+
+    def getMoves(self, controller: engine.GameController):
+        """
+        Returns the (move string, weight) of the book moves of the controller's position that are legal,
+        as move strings that processMove takes. The moves of the controller are calculated again.
+        """
+        entries = self.findEntries(controller.getHash())
+        if len(entries) == 0:
+            return []
+        controller.calculateLegalMoves()
+        movesByID = controller.getMoveIndex()[1]
+        bookMoves = []
+        for bookMove, weight in entries:
+            originRow, originCol, targetRow, targetCol, promotionType = decodeMove(bookMove)
+            move = movesByID.get(originRow * 512 + originCol * 64 + targetRow * 8 + targetCol)
+            if move is None and originCol == 4 and targetCol in (0, 7) and originRow == targetRow:
+                # the king moving onto its own rook is castling, which the controller has as the king's move
+                move = movesByID.get(originRow * 512 + 4 * 64 + targetRow * 8 + (6 if targetCol == 7 else 2))
+                if move is not None and not move.getFlags() & engine.MOVE_FLAG_CASTLE:
+                    move = None
+            if move is None or weight == 0:
+                continue
+            moveString = repr(move)
+            if move.getFlags() & engine.MOVE_FLAG_PROMOTION:
+                moveString += promotionType if promotionType is not None else "q"
+            bookMoves.append((moveString, weight))
+        return bookMoves
+
+    def chooseMove(self, controller: engine.GameController, rng=random):
+        """Picks one of the book moves of the position at random by their weights, or None if there aren't any."""
+        bookMoves = self.getMoves(controller)
+        if len(bookMoves) == 0:
+            return None
+        return rng.choices([moveString for moveString, _ in bookMoves],
+                           [weight for _, weight in bookMoves])[0]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+
+def countBookMoves(games, maxPly=BOOK_MAX_PLY):
+    """
+    Plays the first moves of every game, a list of move strings, and counts how often every move was played
+    in every position. Returns a dictionary of (position hash, book move) to the count.
+    """
+    counts = {}
+    for moves in games:
+        controller = engine.GameController(engine.BitboardBoard)
+        for moveString in moves[:maxPly]:
+            controller.calculateLegalMoves()
+            positionHash = controller.getHash()
+            color = controller.getActiveColor()
+            try:
+                madeMove = controller.processMove(moveString)
+            except engine.MoveErrors:
+                # the rest of a game with a move that can't be made is left out
+                break
+            key = (positionHash, encodeMoveString(madeMove, color))
+            counts[key] = counts.get(key, 0) + 1
+            controller.setActiveColor(not controller.getActiveColor())
+    return counts
+
+
+def writeBook(path, counts):
+    """Writes the counted moves as a sorted book, the counts are scaled down to fit the 16 bit weights."""
+    highest = max(counts.values(), default=0)
+    scale = min(1.0, 65535 / highest) if highest else 1.0
+    # the moves of a position go from the most played to the least played
+    entries = sorted(counts.items(), key=lambda item: (item[0][0], -item[1], item[0][1]))
+    data = b"".join(struct.pack(ENTRY_FORMAT, positionHash, bookMove, max(1, int(count * scale)), 0)
+                    for (positionHash, bookMove), count in entries)
+    storage.writeFileAtomically(path, data)
+    return len(entries)
+
+
+def readHistoryGames(path):
+    """Returns the moves of every game in the match history journal that has them."""
+    games = []
+    with open(path, "r") as journal:
+        for line in journal:
+            if line.endswith("\n"):
+                record = json.loads(line)
+                if "moves" in record:
+                    games.append(record["moves"])
+    return games
+
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+    import time
+
+    parser = argparse.ArgumentParser(description="Builds the opening book, or measures looking up positions.")
+    parser.add_argument("action", choices=("build", "bench"))
+    parser.add_argument("--output", default=BOOK_PATH)
+    parser.add_argument("--history", default="match_history.jsonl",
+                        help="the match history whose games are added to the book when it exists")
+    parser.add_argument("--entries", type=int, default=1000000, help="the size of the book that is measured")
+    args = parser.parse_args()
+
+    if args.action == "build":
+        bookGames = [line.split() for line in OPENING_LINES]
+        if os.path.exists(args.history):
+            bookGames += readHistoryGames(args.history)
+        entryCount = writeBook(args.output, countBookMoves(bookGames))
+        print(f"Wrote {entryCount} moves from {len(bookGames)} games to {args.output}")
+    else:
+        with tempfile.TemporaryDirectory() as temporaryDirectory:
+            bookPath = os.path.join(temporaryDirectory, "bench.bin")
+            # a large book of random positions, with the positions of the opening lines in it as well
+            rng = random.Random(2022)
+            bookCounts = countBookMoves([line.split() for line in OPENING_LINES])
+            while len(bookCounts) < args.entries:
+                bookCounts[(rng.getrandbits(64), rng.getrandbits(12))] = rng.randrange(1, 100)
+            writeBook(bookPath, bookCounts)
+            startTime = time.perf_counter()
+            openingBook = OpeningBook(bookPath)
+            openSeconds = time.perf_counter() - startTime
+            hashes = [positionHash for positionHash, _ in bookCounts]
+            probes = [rng.choice(hashes) for _ in range(100000)]
+            startTime = time.perf_counter()
+            for probe in probes:
+                openingBook.findEntries(probe)
+            lookupSeconds = (time.perf_counter() - startTime) / len(probes)
+            # the same lookups with the whole book parsed into sorted lists first, instead of mapping it
+            startTime = time.perf_counter()
+            with open(bookPath, "rb") as bookFile:
+                parsed = list(struct.iter_unpack(ENTRY_FORMAT, bookFile.read()))
+            parsedKeys = [entry[0] for entry in parsed]
+            parseSeconds = time.perf_counter() - startTime
+            startTime = time.perf_counter()
+            for probe in probes:
+                bisect.bisect_left(parsedKeys, probe)
+            bisectSeconds = (time.perf_counter() - startTime) / len(probes)
+            gameController = engine.GameController(engine.BitboardBoard)
+            startTime = time.perf_counter()
+            for _ in range(1000):
+                openingBook.getMoves(gameController)
+            movesSeconds = (time.perf_counter() - startTime) / 1000
+            print(f"Book of {len(openingBook)} moves, {len(openingBook) * ENTRY_SIZE // 1024} KB")
+            print(f"Memory mapped: opened in {openSeconds * 1000:.2f}ms, "
+                  f"{lookupSeconds * 1000000:.1f}us per lookup")
+            print(f"Parsed:        loaded in {parseSeconds * 1000:.0f}ms, "
+                  f"{bisectSeconds * 1000000:.1f}us per lookup")
+            print(f"Legal book moves of the starting position: {movesSeconds * 1000000:.0f}us, "
+                  f"{openingBook.getMoves(gameController)}")
+            openingBook.close()
@@ -1,21 +1,42 @@
 import asyncio
-import datetime
+import book
+import clocks
 import discord
 from discord.ext import commands
 from discord.ext.commands.core import has_permissions
 import discordgame
 import dotenv
-import json
+import enginepool
+import io
 import os
+import ratings
+import render
+import storage
+import typing
 
 dotenv.load_dotenv()
 TOKEN = os.getenv("BOT_TOKEN")
 
 games = {}
-gameHistory = []
-elo = {}
+# the ratings of every player and the leaderboard, updated after every game
+ratingService = ratings.RatingService()
 challenges = {}
-moveTimers = {}
+# the opening book that the computer plays from and the book command shows, OPENING_BOOK sets where it is
+# (it is built with "python book.py build"), the book isn't used when the file doesn't exist
+bookPath = os.getenv("OPENING_BOOK", book.BOOK_PATH)
+if not os.path.exists(bookPath):
+    bookPath = None
+openingBook = book.OpeningBook(bookPath) if bookPath is not None else None
+# the engine work of every game runs in worker processes, ENGINE_WORKERS sets how many (one per processor by default)
+enginePool = enginepool.EnginePool(int(os.getenv("ENGINE_WORKERS")) if os.getenv("ENGINE_WORKERS") else None,
+                                   bookPath)
+lagMonitor = enginepool.LagMonitor()
+# finished games and ratings are written in the background instead of rewriting the files after every game
+gameStorage = storage.GameStorage()
+# the games that are going on are saved after every move, so they carry on when the bot is restarted
+activeGames = storage.ActiveGameStore()
+# the boards of positions that were already shown are reused instead of being drawn again
+boardRenderer = render.BoardRenderer()
 
 bot = commands.Bot(
     command_prefix=".",
@@ -25,11 +46,12 @@ bot = commands.Bot(
 
 def getGameEmbed(game: discordgame.Game):
     embed = discord.Embed(title=f"Chess: {game.player1.display_name} vs {game.player2.display_name}",
-                          description=f"```{game.getBoardString()}```", color=game.getHexColor())
+                          description=f"```{boardRenderer.getText(game.getBoard(), game.getPositionHash())}```",
+                          color=game.getHexColor())
     embed.add_field(name=f"{game.player1.display_name} remaining move time:",
-                    value=f"{game.moveTimes[game.player1.id] // 60} minutes {game.moveTimes[game.player1.id] % 60} seconds")
+                    value=clocks.formatMilliseconds(game.clock.getRemaining(game.player1.id)))
     embed.add_field(name=f"{game.player2.display_name} remaining move time:",
-                    value=f"{game.moveTimes[game.player2.id] // 60} minutes {game.moveTimes[game.player2.id] % 60} seconds")
+                    value=clocks.formatMilliseconds(game.clock.getRemaining(game.player2.id)))
     if game.getActivePlayer() == game.player1:
         color = "White"
     else:
@@ -38,29 +60,76 @@ def getGameEmbed(game: discordgame.Game):
     return embed
 
 
-def endGame(game: discordgame.Game, gameResult):
-    global games, gameHistory, elo, gameHistory
-    games.pop(game.player1.id)
-    games.pop(game.player2.id)
-    gameHistory.append(gameResult)
-    with open("elo.json", "w") as elojson:
-        json.dump(elo, elojson)
-    with open("match_history.json", "w") as historyjson:
-        json.dump(gameHistory, historyjson)
-    del moveTimers[game.player1.id]
-    del moveTimers[game.player2.id]
+async def showGame(game: discordgame.Game, contextOrChannel):
+    """
+    Shows the game in its one message, which is edited after every move instead of sending a new message,
+    the message is only sent again if it was deleted.
+    """
+    embed = getGameEmbed(game)
+    if game.message is not None:
+        try:
+            await game.message.edit(embed=embed)
+            return
+        except discord.NotFound:
+            pass
+    game.message = await contextOrChannel.send(embed=embed)
+
+
+# the number of games shown on one page of the history
+HISTORY_PAGE_SIZE = 10
+
+
+def describeRecord(record):
+    """Writes the result of a game in the match history as a sentence."""
+    if "result" not in record:
+        # the games of the old match history were only saved as the sentence
+        return record["summary"]
+    white, black, endedAt = record["whiteName"], record["blackName"], record["endedAt"]
+    termination = record["termination"]
+    if record["result"] == "1-0":
+        return f"{white} won against {black} by {termination} at {endedAt}"
+    if record["result"] == "0-1":
+        return f"{white} lost against {black} by {termination} at {endedAt}"
+    if termination == "stalemate":
+        return f"The game between {white} and {black} at {endedAt} resulted in stalemate"
+    return f"The game between {white} and {black} at {endedAt} resulted in a draw by {termination}"
+
+
+def endGame(game: discordgame.Game, result, termination):
+    global games
+    # the bot itself isn't kept in the games, since it can play more than one game at once
+    games.pop(game.player1.id, None)
+    games.pop(game.player2.id, None)
+    # both players' ratings change by how surprising the result was, from their ratings before the game
+    gameStorage.recordGame(game.createRecord(result, termination),
+                           ratingService.recordGame(game.player1.id, game.player2.id, result))
+    activeGames.remove(game.getSnapshotKey())
+    game.finished = True
+    clockService.stopClock(game.clock)
     del game
 
 
-async def actualMove(author, contextOrChannel, moveString, source):
-    global games, elo, moveTimers
-    if author.id not in games.keys():
-        if source == "command":
-            await contextOrChannel.send("You are currently not in a game.")
-        elif source == "onmessage":
-            await contextOrChannel.send("You have entered an invalid command.")
+async def computerMove(game: discordgame.Game, contextOrChannel):
+    """
+    Searches for the computer's move in the engine workers so the bot can keep responding to
+    other games in the meantime, then plays it like any other move.
+    """
+    moveString = (await enginePool.searchPosition(game.getState(), game.searchDepth, game.getSearchTimeLimit()))[0]
+    await actualMove(game.computerPlayer, contextOrChannel, moveString, "computer", game)
+
+
+async def actualMove(author, contextOrChannel, moveString, source, game=None):
+    global games
+    if game is None:
+        if author.id not in games.keys():
+            if source == "command":
+                await contextOrChannel.send("You are currently not in a game.")
+            elif source == "onmessage":
+                await contextOrChannel.send("You have entered an invalid command.")
+            return
+        game: discordgame.Game = games[author.id]
+    if game.finished:
         return
-    game: discordgame.Game = games[author.id]
     if game.getActivePlayer() != author:
         await contextOrChannel.send("It is not your turn to move yet.")
         return
@@ -70,79 +139,119 @@ async def actualMove(author, contextOrChannel, moveString, source):
         otherPlayer = game.player1
     if moveString == "resign":
         await contextOrChannel.send(f"{author.display_name} resigned the chess game.")
-        elo[author.id] -= 5
-        elo[otherPlayer.id] += 5
-        time = datetime.datetime.now()
-        if author == game.player2:
-            result = f"{game.player1.display_name} won against {game.player2.display_name} at {time}"
-        else:
-            result = f"{game.player1.display_name} lost against {game.player2.display_name} at {time}"
-    # only makes move if there is no error, otherwise the error is returned
-    error = game.attemptMove(moveString)
-    if error is not None:
-        await contextOrChannel.send(error)
+        endGame(game, "1-0" if author == game.player2 else "0-1", "resignation")
         return
-    outcome = game.processTurn()
-    if author.id in moveTimers.keys():
-        moveTimers[author.id].cancel()
-    await contextOrChannel.send(f"Your move is: {moveString}")
-    await contextOrChannel.send(embed=getGameEmbed(game))
-    moveTimers[otherPlayer.id] = asyncio.create_task(asyncio.sleep(game.moveTimes[otherPlayer.id]))
-    startingMoveTime = datetime.datetime.now()
+    if game.movePending:
+        await contextOrChannel.send("Your last move is still being made.")
+        return
+    # the move is made by the engine workers, only makes the move if there is no error
+    game.movePending = True
     try:
-        await(moveTimers[otherPlayer.id])
-        await contextOrChannel.send(f"{author.display_name} has won the chess game with a time advantage.")
-        time = str(datetime.datetime.now())
-        time = time[:-10]
-        elo[author.id] += 5
-        elo[otherPlayer.id] -= 5
-        if author == game.player1:
-            result = f"{game.player1.display_name} won against {game.player2.display_name} at {time}"
-        else:
-            result = f"{game.player1.display_name} lost against {game.player2.display_name} at {time}"
-        endGame(game, result)
-    except asyncio.CancelledError:
-        endingMoveTime = datetime.datetime.now()
-        delta: datetime.timedelta = endingMoveTime - startingMoveTime
-        # print(f"delta = {delta.seconds}")
-        game.moveTimes[otherPlayer.id] -= delta.seconds - game.timeIncrement
-        # print(game.moveTimes)
+        state, lastMove, outcome, error = await enginePool.playMove(game.getState(), moveString)
+    finally:
+        game.movePending = False
+    # the player might have run out of time while the move was being made
+    if game.finished:
+        return
+    if error is not None:
+        await contextOrChannel.send(discordgame.MOVE_ERROR_MESSAGES[type(error)])
+        return
+    outcome = game.applyMoveResult(state, lastMove, outcome)
+    if outcome is None:
+        # the mover gets their increment and the other player's clock starts
+        clockService.switchTurn(game.clock, otherPlayer.id)
+    else:
+        clockService.stopClock(game.clock)
+    # the last move is in the footer of the game message
+    await showGame(game, contextOrChannel)
+    if outcome is None:
+        activeGames.save(game.getSnapshotKey(), game.toSnapshot())
+    # the game ends right away when it is over, instead of after the other player's timer runs out
     if isinstance(outcome, discord.Member):
         outcome: discord.Member
         await contextOrChannel.send(f"{outcome.display_name} has won the chess game with a checkmate!")
-        time = str(datetime.datetime.now())
-        time = time[:-10]
-        if outcome == game.player1:
-            result = f"{game.player1.display_name} won against {game.player2.display_name} at {time}"
-            elo[game.player1.id] += 5
-            elo[game.player2.id] -= 5
-        else:
-            result = f"{game.player1.display_name} lost against {game.player2.display_name} at {time}"
-            elo[game.player1.id] -= 5
-            elo[game.player2.id] += 5
-        endGame(game, result)
+        endGame(game, "1-0" if outcome == game.player1 else "0-1", "checkmate")
+        return
     elif outcome == "stalemate":
-        time = str(datetime.datetime.now())
-        time = time[:-10]
         await contextOrChannel.send("The game has resulted in a stalemate.")
-        result = f"The game between {game.player1.display_name} and {game.player2.display_name} at {time} resulted in stalemate"
-        endGame(game, result)
+        endGame(game, "1/2-1/2", "stalemate")
+        return
+    elif outcome is not None:
+        # threefold repetition, the 50-move rule or insufficient material
+        await contextOrChannel.send(f"The game has resulted in a draw by {outcome}.")
+        endGame(game, "1/2-1/2", outcome)
+        return
+    if otherPlayer == game.computerPlayer:
+        asyncio.create_task(computerMove(game, contextOrChannel))
+
+
+async def onFlagFall(game: discordgame.Game, playerID):
+    """Ends the game when the clock service finds that a player has run out of time."""
+    if game.finished:
+        return
+    if playerID == game.player1.id:
+        loser, winner = game.player1, game.player2
+    else:
+        loser, winner = game.player2, game.player1
+    endGame(game, "1-0" if winner == game.player1 else "0-1", "time")
+    if game.channel is not None:
+        await game.channel.send(f"{winner.display_name} has won the chess game with a time advantage.")
+
+
+# every clock of every game is run by this one service, which calls onFlagFall when a player runs out of time
+clockService = clocks.ClockService(lambda clock, playerID: onFlagFall(clock.owner, playerID))
+
+
+async def restoreGames():
+    """
+    Carries on the games that were going on when the bot stopped, from their snapshots. The clock of the player
+    to move starts again from where it was, and games whose channel or players can't be found are dropped.
+    """
+    for key, snapshot in (await activeGames.load()).items():
+        channel = bot.get_channel(snapshot["channel"]) if snapshot["channel"] is not None else None
+        players = []
+        for playerID in snapshot["players"]:
+            if playerID == bot.user.id:
+                players.append(bot.user)
+            elif channel is not None and getattr(channel, "guild", None) is not None:
+                players.append(channel.guild.get_member(playerID))
+            else:
+                players.append(None)
+        if channel is None or None in players:
+            activeGames.remove(key)
+            continue
+        computerPlayer = bot.user if snapshot["computerPlayer"] == bot.user.id else None
+        game = discordgame.Game.fromSnapshot(snapshot, players[0], players[1], computerPlayer)
+        game.channel = channel
+        if snapshot["message"] is not None:
+            try:
+                game.message = await channel.fetch_message(snapshot["message"])
+            except discord.HTTPException:
+                # the message is sent again by showGame
+                pass
+        for player in players:
+            if player != computerPlayer:
+                games[player.id] = game
+        # the clock only runs once the first move has been made
+        if snapshot["clock"]["activePlayer"] is not None:
+            clockService.switchTurn(game.clock, snapshot["clock"]["activePlayer"])
+        await channel.send("The bot was restarted, this game carries on from where it was.")
+        await showGame(game, channel)
+        if game.isComputerTurn():
+            asyncio.create_task(computerMove(game, channel))
 
 
 @bot.event
 async def on_ready():
-    global elo, gameHistory
     print("Syncing json data...")
-    try:
-        with open("elo.json", "r") as elofile:
-            elo = dict(json.load(elofile))
-    except json.JSONDecodeError:
-        print("Elo loading error, skipping...")
-    try:
-        with open("match_history.json", "r") as historyjson:
-            gameHistory = list(json.load(historyjson))
-    except json.JSONDecodeError:
-        print("Game history loading error, skipping...")
+    # on_ready runs again after reconnecting, when the games in memory are newer than the files
+    if not gameStorage.isRunning():
+        ratingService.load(await gameStorage.load())
+        gameStorage.start()
+        await restoreGames()
+        activeGames.start()
+    clockService.start()
+    lagMonitor.start()
     print("Bot is connected to discord services.")
 
 
@@ -152,22 +261,23 @@ async def on_message(message: discord.Message):
         return
     text: str = message.content
     if text[0] == ".":
-        if (text[1:].split(" "))[0].lower() in ["c", "chess", "challenge", "m", "move", "i", "info", "h", "history", "a", "accept", "d", "decline", "r", "resign", "die", "e", "elo"]:
+        if (text[1:].split(" "))[0].lower() in ["c", "chess", "challenge", "m", "move", "i", "info", "h", "history", "a", "accept", "d", "decline", "r", "resign", "die", "e", "elo", "rating", "lb", "leaderboard", "lag", "b", "board", "book"]:
             await bot.process_commands(message)
         else:
             await actualMove(message.author, message.channel, text[1:], "onmessage")
 
 
 @bot.command(aliases=["c", "Chess", "C", "challenge", "Challenge"])
-async def chess(ctx: commands.Context, otherUser: discord.Member, color="w", startingMoveTime=600, increments=0):
-    global games, challenges, elo
+async def chess(ctx: commands.Context, otherUser: discord.Member, color="w", startingMoveTime=600, increments=0,
+                depth=4, thinkTime=10):
+    global games, challenges
     messageUser: discord.Member = ctx.author
-    if otherUser == bot.user:
-        await ctx.send("You cannot challenge the bot to a game!")
-        return
     if color not in "wb":
         await ctx.send("Please specify a valid colour you would like to use.")
         return
+    if otherUser == bot.user:
+        await playComputer(ctx, color, startingMoveTime, increments, depth, thinkTime)
+        return
     if messageUser.id in games.keys() or otherUser.id in games.keys():
         await ctx.send("You or the user you have challenged is currently in another game.")
         return
@@ -185,15 +295,36 @@ async def chess(ctx: commands.Context, otherUser: discord.Member, color="w", sta
             game = discordgame.Game(otherUser, messageUser, startingMoveTime, increments)
         else:
             game = discordgame.Game(messageUser, otherUser, startingMoveTime, increments)
-        if messageUser.id not in elo.keys():
-            elo[messageUser.id] = 1000
-        if otherUser.id not in elo.keys():
-            elo[otherUser.id] = 1000
+        game.channel = ctx.channel
         games[messageUser.id] = game
         games[otherUser.id] = game
         await ctx.send(f"Chess game created between {messageUser.display_name} and {otherUser.display_name}")
-        await ctx.send(embed=getGameEmbed(game))
+        await showGame(game, ctx)
         game.processTurn()
+        activeGames.save(game.getSnapshotKey(), game.toSnapshot())
+
+
+async def playComputer(ctx: commands.Context, color, startingMoveTime, increments, depth, thinkTime):
+    """Starts a game against the bot right away, the bot doesn't need to accept the challenge."""
+    global games
+    messageUser: discord.Member = ctx.author
+    if messageUser.id in games.keys():
+        await ctx.send("You are currently in another game.")
+        return
+    if not 1 <= depth <= 6:
+        await ctx.send("Please specify a search depth between 1 and 6.")
+        return
+    if color == "b":
+        game = discordgame.Game(bot.user, messageUser, startingMoveTime, increments, bot.user, depth, thinkTime)
+    else:
+        game = discordgame.Game(messageUser, bot.user, startingMoveTime, increments, bot.user, depth, thinkTime)
+    game.channel = ctx.channel
+    games[messageUser.id] = game
+    await ctx.send(f"Chess game created between {messageUser.display_name} and {bot.user.display_name}")
+    await showGame(game, ctx)
+    activeGames.save(game.getSnapshotKey(), game.toSnapshot())
+    if game.isComputerTurn():
+        asyncio.create_task(computerMove(game, ctx))
 
 
 def respondToChallenge(ctx, offer):
@@ -228,14 +359,23 @@ async def move(ctx: commands.Context, moveString: str):
 
 
 @bot.command(aliases=["h", "History", "H"])
-async def history(ctx: commands.Context):
-    global gameHistory
-    embed = discord.Embed(title="Game History", color=0xffffff)
-    for i, game in enumerate(gameHistory):
-        embed.add_field(name=f"Game #{i+1}", value=game, inline=False)
-    if len(gameHistory) == 0:
+async def history(ctx: commands.Context, user: typing.Optional[discord.Member] = None, page=1):
+    """Shows one page of the finished games, newest first, of everyone or of one player."""
+    playerID = None if user is None else user.id
+    pageCount = max((gameStorage.getGameCount(playerID) + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE, 1)
+    page = min(max(page, 1), pageCount)
+    title = "Game History" if user is None else f"Game History of {user.display_name}"
+    embed = discord.Embed(title=title, color=0xffffff)
+    for record in await gameStorage.getHistoryPage(page - 1, HISTORY_PAGE_SIZE, playerID):
+        value = describeRecord(record)
+        if "moves" in record:
+            startingTime, increment = record["timeControl"]
+            value += f"\n{(len(record['moves']) + 1) // 2} moves, {startingTime // 60}+{increment}"
+        embed.add_field(name=f"Game #{record['sequence']}", value=value, inline=False)
+    if gameStorage.getGameCount(playerID) == 0:
         embed.add_field(name="No games have been played yet.",
                         value="Go play some games", inline=False)
+    embed.set_footer(text=f"Page {page} of {pageCount}, use .history [user] [page] to see other pages")
     await ctx.send(embed=embed)
 
 
@@ -243,13 +383,13 @@ async def history(ctx: commands.Context):
 async def info(ctx: commands.Context):
     embed = discord.Embed(title="Chess Bot Info", color=0xffffff)
     embed.add_field(name="What this bot is",
-                    value="This is a simple discord bot made for you to play chess with right in your chat. It fully supports all standard rules of chess (with the exception of the threefold repetition and the 50-move draw)",
+                    value="This is a simple discord bot made for you to play chess with right in your chat. It fully supports all standard rules of chess, including draws by threefold repetition, the 50-move rule and insufficient material",
                     inline=False)
     embed.add_field(name="How to play",
-                    value="All you have to do is to start a new game with `.c user color`, where `user` is the user you would like to challenge and color is either `w` or `b` to select what color you want to play. Moves can then be made by first putting in a `.` followed by a valid move, OR by doing `.m`/`.move` followed by the move notation. Ex. `.e4` OR `.move e4`\n\nPawn moves (except promotion) can be specified by 2 characters.\nEx. `.e4` for pawn to e4\n\nNormal unambiguous moves can be specified by 3 characters.\nEx. `.bc4` for bishop to c4\n\nPawn promotion must be specified by 4 characters.\nEx. `.pe8q` for pawn to e8 + promote to queen\n\nAmbiguous moves must be specified by 5 characters.\nEx. `.ng1f3` for knight on g1 to f3\n\nThe 5 character notation can always be used in place of the 2 or 3 character notation.",
+                    value="All you have to do is to start a new game with `.c user color`, where `user` is the user you would like to challenge and color is either `w` or `b` to select what color you want to play. Moves can then be made by first putting in a `.` followed by a valid move, OR by doing `.m`/`.move` followed by the move notation. Ex. `.e4` OR `.move e4`\n\nPawn moves (except promotion) can be specified by 2 characters.\nEx. `.e4` for pawn to e4\n\nNormal unambiguous moves can be specified by 3 characters.\nEx. `.bc4` for bishop to c4\n\nPawn promotion must be specified by 4 characters.\nEx. `.pe8q` for pawn to e8 + promote to queen\nIf two pawns can promote on the same square, the starting position is added.\nEx. `.pd7c8q` for pawn on d7 to c8 + promote to queen\n\nAmbiguous moves must be specified by 5 characters.\nEx. `.ng1f3` for knight on g1 to f3\n\nThe 5 character notation can always be used in place of the 2 or 3 character notation.",
                     inline=False)
     embed.add_field(name="Other Commands",
-                    value="`.info` shows this message.\n`.accept` will let you accept a challenge.\n`.decline` will let you decline a challenge.\n`.history` will show a game history of all matches that have been played.\n\nYou can also use only the first letters of each command to run them. For example shortening `.accept` to `.a`",
+                    value="`.info` shows this message.\n`.accept` will let you accept a challenge.\n`.decline` will let you decline a challenge.\n`.history user page` shows the matches that have been played 10 at a time, newest first, of everyone or only of `user`.\n`.elo user` shows the rating of `user` and their rank.\n`.leaderboard page` shows the players with the highest ratings 10 at a time.\n`.board` shows the board of your game as an image, seen from your side.\n`.book` shows the opening book moves of your game's position and how often they are played.\n`.lag` shows how long the bot has been kept busy.\n`.c @bot color time increment depth seconds` starts a game against the bot, which searches `depth` moves ahead (1 to 6, 4 by default) and thinks for at most `seconds` per move (10 by default).\n\nYou can also use only the first letters of each command to run them. For example shortening `.accept` to `.a`",
                     inline=False)
     await ctx.send(embed=embed)
 
@@ -257,12 +397,11 @@ async def info(ctx: commands.Context):
 @bot.command()
 @has_permissions(administrator=True)
 async def die(ctx: commands.Context):
-    global elo, gameHistory
     await ctx.send("Killing the bot process...")
-    with open("elo.json", "w") as elojson:
-        json.dump(elo, elojson)
-    with open("match_history.json", "w") as historyjson:
-        json.dump(gameHistory, historyjson)
+    # the games that are still waiting to be written are saved before stopping
+    await gameStorage.close()
+    # the games that are going on are carried on when the bot is started again
+    await activeGames.close()
     exit()
 
 
@@ -271,15 +410,83 @@ async def resign(ctx: commands.Context):
     await actualMove(ctx.author, ctx, "resign", "command")
 
 
-@bot.command(aliases=["e", "ELO", "E"])
-async def elo(ctx: commands.Context, user: discord.Member=None):
-    global elo
+@bot.command(aliases=["b", "Board", "B"])
+async def board(ctx: commands.Context):
+    """Shows the board of the game you are in as an image, seen from your side."""
+    if ctx.author.id not in games.keys():
+        await ctx.send("You are currently not in a game.")
+        return
+    game: discordgame.Game = games[ctx.author.id]
+    whiteAtBottom = ctx.author != game.player2
+    image = boardRenderer.getImage(game.getBoard(), game.getPositionHash(), whiteAtBottom)
+    if image is None:
+        # the images can't be drawn without Pillow, so the text board is shown instead
+        await ctx.send(f"```{boardRenderer.getText(game.getBoard(), game.getPositionHash(), whiteAtBottom)}```")
+        return
+    await ctx.send(file=discord.File(io.BytesIO(image), filename="board.png"))
+
+
+# the function has another name so it doesn't hide the book module
+@bot.command(name="book", aliases=["Book"])
+async def showBookMoves(ctx: commands.Context):
+    """Shows the moves that the opening book has for the position of the game you are in."""
+    if ctx.author.id not in games.keys():
+        await ctx.send("You are currently not in a game.")
+        return
+    if openingBook is None:
+        await ctx.send("There is no opening book.")
+        return
+    bookMoves = games[ctx.author.id].getBookMoves(openingBook)
+    if len(bookMoves) == 0:
+        await ctx.send("This position isn't in the opening book.")
+        return
+    totalWeight = sum(weight for _, weight in bookMoves)
+    await ctx.send("Book moves: " + ", ".join(f"{moveString} ({weight * 100 // totalWeight}%)"
+                                              for moveString, weight in bookMoves))
+
+
+@bot.command(aliases=["Lag"])
+async def lag(ctx: commands.Context):
+    """Shows how long the bot has been kept from responding by the work it does."""
+    stats = lagMonitor.getStats()
+    await ctx.send(f"Event loop lag over the last {stats['samples']} checks: last {stats['last']:.1f}ms, "
+                   f"average {stats['average']:.1f}ms, 99th percentile {stats['p99']:.1f}ms, "
+                   f"highest {stats['max']:.1f}ms")
+
+
+# the function has another name so it doesn't hide the rating service
+@bot.command(name="elo", aliases=["e", "ELO", "E", "rating"])
+async def showRating(ctx: commands.Context, user: discord.Member = None):
+    """Shows the rating of a player and where they are on the leaderboard."""
     if user is None:
         user = ctx.author
-    if elo[str(user.id)] is None:
+    rating = ratingService.getRating(user.id)
+    if rating is None:
         await ctx.send("The player you want to see rating for has not played a game yet.")
         return
-    await ctx.send(f"{user.display_name}'s rating is: {elo[str(user.id)]}")
+    await ctx.send(f"{user.display_name}'s rating is: {round(rating.rating)} (±{round(rating.deviation * 2)}), "
+                   f"rank {ratingService.getRank(user.id)} of {ratingService.getPlayerCount()}")
+
+
+# the number of players shown on one page of the leaderboard
+LEADERBOARD_PAGE_SIZE = 10
+
+
+@bot.command(aliases=["lb", "Leaderboard", "LB"])
+async def leaderboard(ctx: commands.Context, page=1):
+    """Shows one page of the players with the highest ratings."""
+    pageCount = max((ratingService.getPlayerCount() + LEADERBOARD_PAGE_SIZE - 1) // LEADERBOARD_PAGE_SIZE, 1)
+    page = min(max(page, 1), pageCount)
+    lines = []
+    for rank, playerID, rating in ratingService.getLeaderboardPage(page - 1, LEADERBOARD_PAGE_SIZE):
+        member = ctx.guild.get_member(playerID) if ctx.guild is not None else None
+        name = member.display_name if member is not None else f"Player {playerID}"
+        lines.append(f"{rank}. {name}: {round(rating.rating)} (±{round(rating.deviation * 2)})")
+    embed = discord.Embed(title="Leaderboard", description="\n".join(lines) or "No games have been played yet.",
+                          color=0xffffff)
+    embed.set_footer(text=f"Page {page} of {pageCount}, use .leaderboard [page] to see other pages")
+    await ctx.send(embed=embed)
+
 
 if __name__ == '__main__':
     bot.run(TOKEN)
@@ -0,0 +1,256 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+# the heap is never compacted while it has fewer deadlines than this
+MIN_COMPACT_SIZE = 64
+
+
+def monotonicMilliseconds():
+    """The current time in milliseconds from a clock that never goes backwards, unlike the wall clock."""
+    return time.monotonic_ns() // 1000000
+
+
+class GameClock:
+    """
+    The chess clock of one game, which keeps the remaining time of both players in milliseconds.
+    Only the clock of the player to move runs, and a player gets the increment after each of their moves.
+    The clock is owned by a game, and run by the clock service.
+    """
+
+    def __init__(self, owner, playerIDs, startingMilliseconds, incrementMilliseconds):
+        self.owner = owner
+        self._remaining = dict((playerID, startingMilliseconds) for playerID in playerIDs)
+        self._increment = incrementMilliseconds
+        # the player whose clock is running and when their turn started, None when the clock is stopped
+        self._activePlayer = None
+        self._turnStart = 0
+        # goes up whenever the running clock changes, so older flag fall deadlines can be told apart
+        self._version = 0
+
+    def getRemaining(self, playerID, now=None):
+        """Returns the remaining milliseconds of the player, counting the time of the turn that is going on."""
+        remaining = self._remaining[playerID]
+        if playerID == self._activePlayer:
+            if now is None:
+                now = monotonicMilliseconds()
+            remaining -= now - self._turnStart
+        return max(remaining, 0)
+
+    def getActivePlayer(self):
+        return self._activePlayer
+
+    def getIncrement(self):
+        return self._increment
+
+    def isRunning(self):
+        return self._activePlayer is not None
+
+    def stop(self, now=None):
+        """Stops the running clock, taking the time of the turn from the player that was to move."""
+        if self._activePlayer is None:
+            return
+        if now is None:
+            now = monotonicMilliseconds()
+        self._remaining[self._activePlayer] = self.getRemaining(self._activePlayer, now)
+        self._activePlayer = None
+        self._version += 1
+
+    def startTurn(self, playerID, now):
+        """Starts the clock of the player and returns the deadline when their time runs out."""
+        self._activePlayer = playerID
+        self._turnStart = now
+        self._version += 1
+        return now + self._remaining[playerID]
+
+    def endTurn(self, now):
+        """Stops the clock of the player that just moved and gives them the increment."""
+        playerID = self._activePlayer
+        self.stop(now)
+        if playerID is not None:
+            self._remaining[playerID] += self._increment
+
+    def getVersion(self):
+        return self._version
+
+    def getSnapshot(self, now=None):
+        """
+        Returns the remaining time of both players as it is right now, along with the increment and the player
+        whose clock is running, in a form that can be saved as json.
+        """
+        if now is None:
+            now = monotonicMilliseconds()
+        return {
+            "remaining": [[playerID, self.getRemaining(playerID, now)] for playerID in self._remaining],
+            "increment": self._increment,
+            "activePlayer": self._activePlayer,
+        }
+
+    def restore(self, snapshot):
+        """
+        Sets the remaining times from a snapshot, leaving the clock stopped. The clock service starts it again,
+        so the time the bot was down isn't taken from anyone.
+        """
+        self.stop()
+        self._remaining = dict((playerID, remaining) for playerID, remaining in snapshot["remaining"])
+        self._increment = snapshot["increment"]
+
+
+class ClockService:
+    """
+    Runs the clocks of every game from a single task. The deadlines when the running clocks run out are kept
+    in a heap, so the task only sleeps until the earliest one. Deadlines that were replaced by a move are
+    skipped when they come up instead of being removed from the heap, and once the heap has grown to twice
+    the deadlines that are still live, the out of date ones are dropped all at once.
+
+    When a player runs out of time, the clock is stopped and the flag fall callback is run with the clock
+    and the player, as a separate task so a slow callback doesn't hold up the other clocks.
+    """
+
+    def __init__(self, onFlagFall):
+        self._onFlagFall = onFlagFall
+        # (deadline, order, clock, clock version) of every running clock
+        self._deadlines = []
+        self._order = itertools.count()
+        # the heap is compacted when it grows past this size
+        self._compactSize = MIN_COMPACT_SIZE
+        self._wakeup = None
+        self._task = None
+        # how late the flag falls were noticed in milliseconds, the highest and the total
+        self._flagFalls = 0
+        self._maxLateness = 0
+        self._totalLateness = 0
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def switchTurn(self, clock: GameClock, nextPlayerID):
+        """
+        Ends the turn of the player that just moved, giving them the increment, and starts the clock
+        of the next player. The first move of the game starts the clock without ending a turn.
+        """
+        now = monotonicMilliseconds()
+        clock.endTurn(now)
+        self.schedule(clock, clock.startTurn(nextPlayerID, now))
+
+    def stopClock(self, clock: GameClock):
+        """Stops the clock of a game that has ended, its deadline is skipped when it comes up."""
+        clock.stop()
+
+    def schedule(self, clock: GameClock, deadline):
+        earliest = self._deadlines[0][0] if self._deadlines else None
+        heapq.heappush(self._deadlines, (deadline, next(self._order), clock, clock.getVersion()))
+        if len(self._deadlines) > self._compactSize:
+            self.compact()
+        # the task only has to wake up early when this deadline comes before the one it is sleeping until
+        if self._wakeup is not None and (earliest is None or deadline < earliest):
+            self._wakeup.set()
+
+    def compact(self):
+        """
+        Drops the deadlines of clocks that were switched or stopped since they were scheduled. The heap is
+        changed in place since the task holds on to it, and the next compaction waits until it has doubled.
+        """
+        self._deadlines[:] = self.getLiveDeadlines()
+        heapq.heapify(self._deadlines)
+        self._compactSize = max(2 * len(self._deadlines), MIN_COMPACT_SIZE)
+
+    def getLiveDeadlines(self):
+        """Returns the deadlines that are still up to date, the ones a flag can actually fall on."""
+        return [entry for entry in self._deadlines if entry[3] == entry[2].getVersion()]
+
+    async def run(self):
+        deadlines = self._deadlines
+        while True:
+            self._wakeup.clear()
+            if deadlines:
+                timeout = (deadlines[0][0] - monotonicMilliseconds()) / 1000
+                if timeout > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            else:
+                await self._wakeup.wait()
+            now = monotonicMilliseconds()
+            while deadlines and deadlines[0][0] <= now:
+                deadline, _, clock, version = heapq.heappop(deadlines)
+                # the deadline is out of date if the clock was switched or stopped after it was scheduled
+                if version != clock.getVersion():
+                    continue
+                playerID = clock.getActivePlayer()
+                clock.stop(now)
+                lateness = now - deadline
+                self._flagFalls += 1
+                self._totalLateness += lateness
+                self._maxLateness = max(self._maxLateness, lateness)
+                asyncio.create_task(self._onFlagFall(clock, playerID))
+
+    def getStats(self):
+        """
+        Returns the number of live deadlines, the size of the heap including the out of date ones,
+        and how late the flag falls were noticed in milliseconds.
+        """
+        return {
+            "deadlines": len(self.getLiveDeadlines()),
+            "heapSize": len(self._deadlines),
+            "flagFalls": self._flagFalls,
+            "averageLateness": self._totalLateness / self._flagFalls if self._flagFalls else 0.0,
+            "maxLateness": self._maxLateness,
+        }
+
+
+def formatMilliseconds(milliseconds):
+    """Shows the remaining time as minutes and seconds, with tenths of a second in the last 10 seconds."""
+    minutes, seconds = divmod(milliseconds / 1000, 60)
+    if milliseconds < 10000:
+        return f"{int(minutes)} minutes {seconds:.1f} seconds"
+    return f"{int(minutes)} minutes {int(seconds)} seconds"
+
+
+if __name__ == '__main__':
+    import argparse
+    import random
+
+    parser = argparse.ArgumentParser(description="Runs the clocks of many games at once and measures the flag falls.")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=2.0, help="the starting time of every player")
+    args = parser.parse_args()
+
+    async def simulate():
+        flagged = []
+
+        async def onFlagFall(clock, playerID):
+            flagged.append((clock.owner, playerID))
+
+        service = ClockService(onFlagFall)
+        service.start()
+        rng = random.Random(2022)
+        clocks = [GameClock(number, ("white", "black"), int(args.seconds * 1000), 100) for number in range(args.games)]
+        for clock in clocks:
+            service.switchTurn(clock, "white")
+        tasks = len(asyncio.all_tasks())
+        # both players move quickly a few times before one of them stops moving, so every game flags eventually
+        for _ in range(5):
+            await asyncio.sleep(0.05)
+            for clock in clocks:
+                if rng.random() < 0.5:
+                    service.switchTurn(clock, "black" if clock.getActivePlayer() == "white" else "white")
+        scheduled = service.getStats()
+        await asyncio.sleep(args.seconds + 0.5)
+        stats = service.getStats()
+        service.stop()
+        print(f"{args.games} games on {tasks} tasks, {scheduled['deadlines']} live deadlines in a heap of "
+              f"{scheduled['heapSize']} after the moves")
+        print(f"{len(flagged)} flag falls, noticed on average "
+              f"{stats['averageLateness']:.2f}ms late and at most {stats['maxLateness']}ms late")
+
+    asyncio.run(simulate())
@@ -1,31 +1,55 @@
+import base64
+import clocks
 import engine
 import discord
 import colorsys
+import datetime
 import random
+import search
+
+# the message shown to the player for every kind of move error
+MOVE_ERROR_MESSAGES = {
+    engine.AmbiguousMoveError: "Please input a move that indicates the starting position.",
+    engine.InvalidMoveError: "Please input a valid move.",
+    engine.IncorrectMoveStringLengthError: "Please use either the 3 character notation or the 5 character notation",
+    engine.SpecifyPromotionError: "Please specify the type of piece you would like to promote your pawn to.",
+    engine.ImpossiblePromotionError: "You cannot promote to a king or pawn."
+}
 
 class Game:
 
-    def __init__(self, p1: discord.Member, p2: discord.Member, time, inc):
+    def __init__(self, p1: discord.Member, p2: discord.Member, time, inc, computerPlayer=None, searchDepth=4,
+                 maxThinkTime=10):
         h,s,l = random.random(), 0.75 + random.random() / 4, 0.4 + random.random() / 5.0
         rgb = colorsys.hls_to_rgb(h,l,s)
         self._hexColor = int(rgb[0]*255) * 65536 + int(rgb[1]*255) * 256 + int(rgb[2]*255)
         self._turnNum = 1
-        self._controller = engine.GameController()
+        self._controller = engine.GameController(engine.BitboardBoard)
         self._lastMove = "No moves have been made yet."
+        # every move made in the game, as processMove gives them back
+        self._moveList = []
         self.player1 = p1
         self.player2 = p2
         self.processTurn()
-        self.moveTimes = {
-            p1.id: time,
-            p2.id: time
-        }
+        # the clock keeps the remaining time of both players in milliseconds, time and inc are in seconds
+        self.clock = clocks.GameClock(self, (p1.id, p2.id), int(time * 1000), int(inc * 1000))
+        self.startingMoveTime = time
         self.timeIncrement = inc
+        # the player that is played by the bot itself, if there is one, and how hard it searches
+        self.computerPlayer = computerPlayer
+        self.searchDepth = searchDepth
+        self.maxThinkTime = maxThinkTime
+        # set while a move of this game is being made by the engine workers
+        self.movePending = False
+        # the channel the game is played in, where the end of the game is announced when a player runs out of time
+        self.channel = None
+        # the one message that shows the game, which is edited after every move instead of sending a new one
+        self.message = None
+        self.finished = False
 
     def processTurn(self):
-        self._controller.calculateMoves()
-        self._controller.calculateSpecialMoves()
-        self._controller.calculateValidMoves()
-        if len(self._controller.getMoves()) == 0:
+        # only whether the player has any legal move is needed, not the whole list of moves
+        if not self._controller.hasLegalMove():
             mate = self._controller.inCheck()
             if mate:
                 if not self._controller.getActiveColor():
@@ -34,23 +58,111 @@ class Game:
                     return self.player2
             else:
                 return "stalemate"
+        # draws that can happen even when the player still has moves to make
+        return self._controller.getDrawReason()
 
     def attemptMove(self, moveString):
+        self._controller.calculateMoves()
+        self._controller.calculateSpecialMoves()
+        self._controller.calculateValidMoves()
         try:
             self._lastMove = self._controller.processMove(moveString)
+            self._moveList.append(self._lastMove)
             if not self._controller.getActiveColor():
                 self._turnNum += 1
             self._controller.setActiveColor(not self._controller.getActiveColor())
-        except engine.AmbiguousMoveError:
-            return "Please input a move that indicates the starting position."
-        except engine.InvalidMoveError:
-            return "Please input a valid move."
-        except engine.IncorrectMoveStringLengthError:
-            return "Please use either the 3 character notation or the 5 character notation"
-        except engine.SpecifyPromotionError:
-            return "Please specify the type of piece you would like to promote your pawn to."
-        except engine.ImpossiblePromotionError:
-            return "You cannot promote to a king or pawn."
+        except engine.MoveErrors as error:
+            return MOVE_ERROR_MESSAGES[type(error)]
+
+    def getState(self):
+        """Returns the compact state of the game that is sent to the engine workers."""
+        return self._controller.getState()
+
+    def getSnapshotKey(self):
+        """The name of the game's snapshot, a player can only be in one game unless it is the bot itself."""
+        return f"{self.player1.id}-{self.player2.id}"
+
+    def toSnapshot(self):
+        """
+        Returns everything needed to carry on the game after the bot restarts, in a form that can be saved as json.
+        The position is kept as the compact state, and the players, channel and message as their ids.
+        """
+        fenString, historyBytes = self._controller.getState()
+        return {
+            "players": [self.player1.id, self.player2.id],
+            "computerPlayer": self.computerPlayer.id if self.computerPlayer is not None else None,
+            "searchDepth": self.searchDepth,
+            "maxThinkTime": self.maxThinkTime,
+            "state": [fenString, base64.b64encode(historyBytes).decode()],
+            "moves": list(self._moveList),
+            "lastMove": self._lastMove,
+            "turnNum": self._turnNum,
+            "hexColor": self._hexColor,
+            "startingMoveTime": self.startingMoveTime,
+            "timeIncrement": self.timeIncrement,
+            "clock": self.clock.getSnapshot(),
+            "channel": self.channel.id if self.channel is not None else None,
+            "message": self.message.id if self.message is not None else None,
+        }
+
+    @classmethod
+    def fromSnapshot(cls, snapshot, p1: discord.Member, p2: discord.Member, computerPlayer=None):
+        """
+        Sets the game up again from a snapshot made by toSnapshot, with the players looked up from their ids.
+        The clock is left stopped, and the channel and message are set by the bot.
+        """
+        game = cls(p1, p2, snapshot["startingMoveTime"], snapshot["timeIncrement"], computerPlayer,
+                   snapshot["searchDepth"], snapshot["maxThinkTime"])
+        fenString, historyText = snapshot["state"]
+        game._controller = engine.GameController.fromState((fenString, base64.b64decode(historyText)),
+                                                           engine.BitboardBoard)
+        game._moveList = list(snapshot["moves"])
+        game._lastMove = snapshot["lastMove"]
+        game._turnNum = snapshot["turnNum"]
+        game._hexColor = snapshot["hexColor"]
+        game.clock.restore(snapshot["clock"])
+        return game
+
+    def applyMoveResult(self, state, lastMove, outcome):
+        """
+        Takes the new state of the game after a move that was made by the engine workers,
+        and gives back the outcome the same way processTurn does.
+        """
+        self._controller = engine.GameController.fromState(state, engine.BitboardBoard)
+        self._lastMove = lastMove
+        self._moveList.append(lastMove)
+        # black has just moved when it is white's turn again
+        if self._controller.getActiveColor():
+            self._turnNum += 1
+        if outcome == "checkmate":
+            # the player who made the move has won
+            return self.getNotActivePlayer()
+        return outcome
+
+    def createRecord(self, result, termination):
+        """
+        Makes the record of the finished game that is saved in the match history. The result is "1-0" when white
+        (player 1) won, "0-1" when black won or "1/2-1/2" for a draw, and the termination is how the game ended.
+        """
+        return {
+            "white": self.player1.id,
+            "black": self.player2.id,
+            "whiteName": self.player1.display_name,
+            "blackName": self.player2.display_name,
+            "result": result,
+            "termination": termination,
+            "timeControl": [self.startingMoveTime, self.timeIncrement],
+            "endedAt": str(datetime.datetime.now())[:-10],
+            "moves": list(self._moveList),
+        }
+
+    def isComputerTurn(self):
+        return self.computerPlayer is not None and self.getActivePlayer() == self.computerPlayer
+
+    def getSearchTimeLimit(self):
+        """Works out how long the computer can search for its move, keeping it well within its remaining time."""
+        return search.calculateTimeLimit(self.clock.getRemaining(self.computerPlayer.id) / 1000, self.timeIncrement,
+                                         self.maxThinkTime)
 
     def getActivePlayer(self):
         if self._controller.getActiveColor():
@@ -67,6 +179,17 @@ class Game:
     def getBoardString(self):
         return str(self._controller.getBoard())
 
+    def getBoard(self):
+        return self._controller.getBoard()
+
+    def getBookMoves(self, openingBook):
+        """Returns the (move string, weight) of the opening book moves of the current position."""
+        return openingBook.getMoves(self._controller)
+
+    def getPositionHash(self):
+        """Returns the hash of the current position, which the board drawings are kept by."""
+        return self._controller.getHash()
+
     def getHexColor(self):
         return self._hexColor
 
@@ -74,4 +197,7 @@ class Game:
         return self._turnNum
 
     def getLastMove(self):
-        return self._lastMove
\ No newline at end of file
+        return self._lastMove
+
+    def getMoveList(self):
+        return self._moveList
\ No newline at end of file
@@ -1,4 +1,5 @@
-import copy
+import array
+import random
 
 
 class Piece:
@@ -6,11 +7,16 @@ class Piece:
     Piece class has two attributes:
      - Color: Boolean
      - Piece Type: String
+    It also keeps its piece index, which is the position of the type in PIECE_TYPES plus 6 for white pieces.
+    Pieces are never modified, so the board only uses the shared pieces in PIECE_OBJECTS.
     """
 
+    __slots__ = ("_color", "_pieceType", "_index")
+
     def __init__(self, color: bool, pieceType: str):
         self._color = color
         self._pieceType = pieceType
+        self._index = PIECE_TYPES.index(pieceType) + (6 if color else 0)
 
     def __repr__(self):
         if self._color:
@@ -24,6 +30,9 @@ class Piece:
     def getType(self):
         return self._pieceType
 
+    def getIndex(self):
+        return self._index
+
 
 class Board:
     # A fenstring is a custom notation that can represent the entire board with a simple string.
@@ -34,24 +43,35 @@ class Board:
         self._grid: list = [[None for _ in range(8)] for _ in range(8)]
 
     def __str__(self):
-        boardStr = "    A   B   C   D   E   F   G   H\n  ╔═══╦═══╦═══╦═══╦═══╦═══╦═══╦═══╗\n"
-        for i, row in enumerate(self._grid):
-            boardStr += f"{8-i} ║"
-            piece: Piece
-            for j, piece in enumerate(row):
-                if piece is None:
-                    if (i + j) % 2 == 0:
-                        boardStr += "   ║"
-                    else:
-                        boardStr += "░░░║"
+        return self.toText()
+
+    def toText(self, whiteAtBottom=True):
+        """
+        Draws the board with box drawing characters, seen from white's side or from black's side.
+        The rows are built as lists of cells and joined once, instead of adding to the string cell by cell.
+        """
+        letters = [" "] * 64
+        for index, square in self.getPieceSquares():
+            letters[square] = PIECE_LETTERS[index]
+        rows = range(8) if whiteAtBottom else range(7, -1, -1)
+        cols = range(8) if whiteAtBottom else range(7, -1, -1)
+        lines = ["    " + "   ".join("ABCDEFGH"[col] for col in cols),
+                 "  ╔═══╦═══╦═══╦═══╦═══╦═══╦═══╦═══╗"]
+        for row in rows:
+            cells = []
+            for col in cols:
+                letter = letters[row * 8 + col]
+                if letter != " ":
+                    cells.append(f" {letter} ")
+                elif (row + col) % 2 == 0:
+                    cells.append("   ")
                 else:
-                    # boardStr += f" {piece} ║"
-                    boardStr += f" {piece} ║"
-            boardStr += "\n"
-            if i < 7:
-                boardStr += "  ╠═══╬═══╬═══╬═══╬═══╬═══╬═══╬═══╣\n"
-        boardStr += "  ╚═══╩═══╩═══╩═══╩═══╩═══╩═══╩═══╝"
-        return boardStr
+                    cells.append("░░░")
+            lines.append(f"{8 - row} ║" + "║".join(cells) + "║")
+            lines.append("  ╠═══╬═══╬═══╬═══╬═══╬═══╬═══╬═══╣")
+        # the last row has the bottom edge instead of a separator
+        lines[-1] = "  ╚═══╩═══╩═══╩═══╩═══╩═══╩═══╩═══╝"
+        return "\n".join(lines)
 
     def popCell(self, row: int, col: int) -> Piece:
         """Returns and removes element from the specified position on the board"""
@@ -63,27 +83,50 @@ class Board:
         """Overwrites the specified cell with the specified piece."""
         self._grid[row][col] = piece
 
-    def initializeBoard(self):
+    def getPiece(self, row: int, col: int) -> Piece:
+        """Returns the piece on the specified position without removing it"""
+        return self._grid[row][col]
+
+    def getPieceSquares(self):
+        """Returns the (piece index, square) of every piece on the board, where the square is row * 8 + col."""
+        return [(piece.getIndex(), row * 8 + col) for row, rowPieces in enumerate(self._grid)
+                for col, piece in enumerate(rowPieces) if piece is not None]
+
+    def initializeBoard(self, fenString=None):
         """
         Fills the board for the start of the game with the pieces
-        in the starting position by using the starting fenstring.
+        in the starting position by using the starting fenstring,
+        or with the pieces of the piece placement part of another fenstring.
         """
+        if fenString is None:
+            fenString = self.startingFenString
         fillPointer: int = 0
         selectedRow: int = 0
-        for ch in self.startingFenString:
+        lastCh = ""
+        for ch in fenString:
             if ch != "/":
                 if ch.isalpha():
-                    if ch.isupper():
-                        newPiece = Piece(True, ch.lower())
-                    else:
-                        newPiece = Piece(False, ch)
-                    self._grid[selectedRow][fillPointer] = newPiece
+                    if ch.lower() not in PIECE_TYPES:
+                        raise ValueError(f"{ch} is not a piece")
+                    if fillPointer >= 8:
+                        raise ValueError("Every row must have 8 squares")
+                    self.editCell(selectedRow, fillPointer, PIECE_OBJECTS[FEN_PIECE_INDEXES[ch]])
                     fillPointer += 1
-                elif ch.isnumeric():
+                elif ch in EMPTY_SQUARE_DIGITS:
+                    # two digits in a row would be one number of empty squares written as two
+                    if lastCh.isdigit():
+                        raise ValueError("Empty squares must be a single digit")
                     fillPointer += int(ch)
+                else:
+                    raise ValueError(f"{ch} is not a piece")
             else:
+                if fillPointer != 8:
+                    raise ValueError("Every row must have 8 squares")
                 fillPointer = 0
                 selectedRow += 1
+            lastCh = ch
+        if fillPointer != 8:
+            raise ValueError("Every row must have 8 squares")
 
     def prettyPrint(self):
         """
@@ -112,6 +155,476 @@ class Board:
     def getGrid(self):
         return self._grid
 
+    def findKing(self, color: bool):
+        """Returns the position of the king of the given color, or None if it is not on the board."""
+        for rowNum, row in enumerate(self._grid):
+            for colNum, piece in enumerate(row):
+                if piece is not None and piece.getType() == "k" and piece.getColor() == color:
+                    return rowNum, colNum
+        return None
+
+    def isSquareAttacked(self, row: int, col: int, byColor: bool) -> bool:
+        """
+        Checks if any piece of the given color attacks the square by looking outwards from it,
+        along the rays for sliding pieces, at the knight jumps and at the pawn diagonals.
+        """
+        grid = self._grid
+        # white pawns attack towards row 0, so they would be one row below the square
+        pawnRow = row + 1 if byColor else row - 1
+        if 0 <= pawnRow < 8:
+            for pawnCol in (col - 1, col + 1):
+                if 0 <= pawnCol < 8:
+                    piece = grid[pawnRow][pawnCol]
+                    if piece is not None and piece.getColor() == byColor and piece.getType() == "p":
+                        return True
+        for rowOffset, colOffset in KNIGHT_OFFSETS:
+            targetRow, targetCol = row + rowOffset, col + colOffset
+            if 0 <= targetRow < 8 and 0 <= targetCol < 8:
+                piece = grid[targetRow][targetCol]
+                if piece is not None and piece.getColor() == byColor and piece.getType() == "n":
+                    return True
+        for directions, sliders in ((ROOK_DIRECTIONS, "rq"), (BISHOP_DIRECTIONS, "bq")):
+            for rowOffset, colOffset in directions:
+                targetRow, targetCol = row + rowOffset, col + colOffset
+                distance = 1
+                while 0 <= targetRow < 8 and 0 <= targetCol < 8:
+                    piece = grid[targetRow][targetCol]
+                    if piece is not None:
+                        if piece.getColor() == byColor and (piece.getType() in sliders or
+                                                            (distance == 1 and piece.getType() == "k")):
+                            return True
+                        break
+                    targetRow, targetCol = targetRow + rowOffset, targetCol + colOffset
+                    distance += 1
+        return False
+
+    def calculatePins(self, kingRow: int, kingCol: int, color: bool) -> dict:
+        """
+        Finds the pieces of the given color that are pinned to their king, which is when the
+        only piece between the king and an enemy sliding piece on the same line is an allied piece.
+        Returns a dictionary of the pinned piece positions to the direction of the pin.
+        """
+        pins = {}
+        for directions, sliders in ((ROOK_DIRECTIONS, "rq"), (BISHOP_DIRECTIONS, "bq")):
+            for direction in directions:
+                pinnedPos = None
+                targetRow, targetCol = kingRow + direction[0], kingCol + direction[1]
+                while 0 <= targetRow < 8 and 0 <= targetCol < 8:
+                    piece = self.getPiece(targetRow, targetCol)
+                    if piece is not None:
+                        if piece.getColor() == color:
+                            if pinnedPos is not None:
+                                # two allied pieces in a row means neither of them is pinned
+                                break
+                            pinnedPos = (targetRow, targetCol)
+                        else:
+                            if pinnedPos is not None and piece.getType() in sliders:
+                                pins[pinnedPos] = direction
+                            break
+                    targetRow, targetCol = targetRow + direction[0], targetCol + direction[1]
+        return pins
+
+
+# Bitboards store one bit for each square of the board, the square index is row * 8 + col
+# so bit 0 is a8 and bit 63 is h1, the same orientation as the grid.
+PIECE_TYPES = "pnbrqk"
+# the piece index of every fenstring letter, lowercase letters are black pieces
+FEN_PIECE_INDEXES = dict([(pieceType, index) for index, pieceType in enumerate(PIECE_TYPES)] +
+                         [(pieceType.upper(), index + 6) for index, pieceType in enumerate(PIECE_TYPES)])
+# the letter of every piece index, uppercase for white like in fenstrings
+PIECE_LETTERS = PIECE_TYPES + PIECE_TYPES.upper()
+# One shared piece object for every piece index
+PIECE_OBJECTS = [Piece(False, pieceType) for pieceType in PIECE_TYPES] + \
+                [Piece(True, pieceType) for pieceType in PIECE_TYPES]
+FULL_BOARD = (1 << 64) - 1
+# the digits of a fenstring that stand for a number of empty squares
+EMPTY_SQUARE_DIGITS = "12345678"
+NOT_A_FILE = sum(1 << (row * 8 + col) for row in range(8) for col in range(1, 8))
+NOT_H_FILE = sum(1 << (row * 8 + col) for row in range(8) for col in range(7))
+# the direction offsets in (row, col) form for the sliding pieces
+ROOK_DIRECTIONS = ((-1, 0), (1, 0), (0, 1), (0, -1))
+BISHOP_DIRECTIONS = ((-1, 1), (1, 1), (-1, -1), (1, -1))
+KNIGHT_OFFSETS = ((-2, 1), (-1, 2), (1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1))
+
+
+def _offsetAttacks(offsets):
+    """Builds a table with the attacked squares of a non sliding piece for every square of the board."""
+    table = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        attacks = 0
+        for rowOffset, colOffset in offsets:
+            if 0 <= row + rowOffset < 8 and 0 <= col + colOffset < 8:
+                attacks |= 1 << ((row + rowOffset) * 8 + col + colOffset)
+        table.append(attacks)
+    return table
+
+
+def _rayTable(direction):
+    """Builds a table with every square reachable on an empty board in one direction from every square."""
+    table = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        ray = 0
+        targetRow, targetCol = row + direction[0], col + direction[1]
+        while 0 <= targetRow < 8 and 0 <= targetCol < 8:
+            ray |= 1 << (targetRow * 8 + targetCol)
+            targetRow, targetCol = targetRow + direction[0], targetCol + direction[1]
+        table.append(ray)
+    return table
+
+
+KNIGHT_ATTACKS = _offsetAttacks(KNIGHT_OFFSETS)
+KING_ATTACKS = _offsetAttacks(ROOK_DIRECTIONS + BISHOP_DIRECTIONS)
+# indexed by the color of the pawn, white pawns attack towards row 0
+PAWN_ATTACKS = (_offsetAttacks(((1, 1), (1, -1))), _offsetAttacks(((-1, 1), (-1, -1))))
+# rays are split into the ones that go towards higher square indexes (the nearest blocker is the lowest set bit)
+# and the ones that go towards lower square indexes (the nearest blocker is the highest set bit)
+POSITIVE_ROOK_RAYS = (_rayTable((1, 0)), _rayTable((0, 1)))
+NEGATIVE_ROOK_RAYS = (_rayTable((-1, 0)), _rayTable((0, -1)))
+POSITIVE_BISHOP_RAYS = (_rayTable((1, 1)), _rayTable((1, -1)))
+NEGATIVE_BISHOP_RAYS = (_rayTable((-1, 1)), _rayTable((-1, -1)))
+# the same rays as (table, goes towards higher square indexes) pairs, for looking along each line on its own
+ROOK_RAY_TABLES = tuple((rays, True) for rays in POSITIVE_ROOK_RAYS) + \
+    tuple((rays, False) for rays in NEGATIVE_ROOK_RAYS)
+BISHOP_RAY_TABLES = tuple((rays, True) for rays in POSITIVE_BISHOP_RAYS) + \
+    tuple((rays, False) for rays in NEGATIVE_BISHOP_RAYS)
+
+
+def _slidingAttacks(square, occupied, positiveRays, negativeRays):
+    """Looks up the attacked squares along the given rays, stopping at (and including) the first blocker."""
+    attacks = 0
+    for rays in positiveRays:
+        ray = rays[square]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[(blockers & -blockers).bit_length() - 1]
+        attacks |= ray
+    for rays in negativeRays:
+        ray = rays[square]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+
+# Zobrist hashing gives every piece on every square, every castling right, every en passant file and
+# the side to move a random 64 bit key. The hash of a position is all of its keys xor-ed together,
+# so a move only has to xor out the keys that it removes and xor in the keys that it adds.
+_zobristRandom = random.Random(20211231)
+ZOBRIST_PIECE_KEYS = [[_zobristRandom.getrandbits(64) for _ in range(64)] for _ in range(12)]
+# white king side, white queen side, black king side, black queen side
+ZOBRIST_CASTLING_KEYS = [_zobristRandom.getrandbits(64) for _ in range(4)]
+ZOBRIST_EN_PASSANT_KEYS = [_zobristRandom.getrandbits(64) for _ in range(8)]
+ZOBRIST_BLACK_TO_MOVE_KEY = _zobristRandom.getrandbits(64)
+
+
+def calculateCastlingHash(whiteCastleAvailability, blackCastleAvailability):
+    castlingHash = 0
+    for available, key in zip(tuple(whiteCastleAvailability) + tuple(blackCastleAvailability),
+                              ZOBRIST_CASTLING_KEYS):
+        if available:
+            castlingHash ^= key
+    return castlingHash
+
+
+def rookAttacks(square, occupied):
+    return _slidingAttacks(square, occupied, POSITIVE_ROOK_RAYS, NEGATIVE_ROOK_RAYS)
+
+
+def bishopAttacks(square, occupied):
+    return _slidingAttacks(square, occupied, POSITIVE_BISHOP_RAYS, NEGATIVE_BISHOP_RAYS)
+
+
+class BitboardBoard(Board):
+    """
+    Alternative board that stores the position as 12 piece bitboards (one for each
+    color and piece type) plus occupancy masks for each color. A 64 square mailbox
+    is kept alongside so the piece on a square can be found without searching the bitboards.
+
+    The piece index is the position of the type in PIECE_TYPES, plus 6 for the white pieces.
+    """
+
+    pieceObjects = PIECE_OBJECTS
+
+    def __init__(self):
+        self._bitboards = [0] * 12
+        # indexed by color, so index 0 is black and index 1 is white
+        self._occupancy = [0, 0]
+        self._mailbox = [-1] * 64
+
+    def __deepcopy__(self, memo):
+        board = BitboardBoard()
+        board._bitboards = self._bitboards[:]
+        board._occupancy = self._occupancy[:]
+        board._mailbox = self._mailbox[:]
+        return board
+
+    def initializeBoard(self, fenString=None):
+        """
+        Fills the bitboards straight from the starting fenstring, or from the piece placement
+        part of another fenstring, without going through piece objects.
+        """
+        if fenString is None:
+            fenString = self.startingFenString
+        square = 0
+        rowStart = 0
+        lastCh = ""
+        for ch in fenString:
+            if ch == "/":
+                if square - rowStart != 8:
+                    raise ValueError("Every row must have 8 squares")
+                rowStart = square
+            elif ch in EMPTY_SQUARE_DIGITS:
+                if lastCh.isdigit():
+                    raise ValueError("Empty squares must be a single digit")
+                square += int(ch)
+            else:
+                index = FEN_PIECE_INDEXES.get(ch)
+                if index is None:
+                    raise ValueError(f"{ch} is not a piece")
+                if square - rowStart >= 8 or square >= 64:
+                    raise ValueError("Every row must have 8 squares")
+                bit = 1 << square
+                self._bitboards[index] |= bit
+                self._occupancy[index >= 6] |= bit
+                self._mailbox[square] = index
+                square += 1
+            lastCh = ch
+        if square != 64 or square - rowStart != 8:
+            raise ValueError("Every row must have 8 squares")
+
+    def loadBitboards(self, bitboards):
+        """Replaces the position with the 12 piece bitboards, given in piece index order."""
+        self._bitboards = list(bitboards)
+        self._occupancy = [0, 0]
+        self._mailbox = [-1] * 64
+        for index, pieces in enumerate(self._bitboards):
+            self._occupancy[index >= 6] |= pieces
+            while pieces:
+                bit = pieces & -pieces
+                pieces ^= bit
+                self._mailbox[bit.bit_length() - 1] = index
+
+    @staticmethod
+    def pieceIndex(piece: Piece) -> int:
+        return piece.getIndex()
+
+    def popCell(self, row: int, col: int) -> Piece:
+        """Returns and removes element from the specified position on the board"""
+        square = row * 8 + col
+        index = self._mailbox[square]
+        if index == -1:
+            return None
+        bit = 1 << square
+        self._bitboards[index] ^= bit
+        self._occupancy[index >= 6] ^= bit
+        self._mailbox[square] = -1
+        return self.pieceObjects[index]
+
+    def editCell(self, row, col, piece):
+        """Overwrites the specified cell with the specified piece."""
+        self.popCell(row, col)
+        if piece is None:
+            return
+        square = row * 8 + col
+        index = self.pieceIndex(piece)
+        bit = 1 << square
+        self._bitboards[index] |= bit
+        self._occupancy[index >= 6] |= bit
+        self._mailbox[square] = index
+
+    def getPiece(self, row: int, col: int) -> Piece:
+        """Returns the piece on the specified position without removing it"""
+        index = self._mailbox[row * 8 + col]
+        if index == -1:
+            return None
+        return self.pieceObjects[index]
+
+    def getPieceSquares(self):
+        """Returns the (piece index, square) of every piece on the board, where the square is row * 8 + col."""
+        return [(index, square) for square, index in enumerate(self._mailbox) if index != -1]
+
+    def getGrid(self):
+        """Builds the grid form of the board, this is slow and only meant for displaying the board."""
+        return [[self.getPiece(row, col) for col in range(8)] for row in range(8)]
+
+    def findKing(self, color: bool):
+        """Returns the position of the king of the given color, or None if it is not on the board."""
+        kings = self._bitboards[11 if color else 5]
+        if kings == 0:
+            return None
+        return divmod((kings & -kings).bit_length() - 1, 8)
+
+    def getBitboard(self, color: bool, pieceType: str) -> int:
+        return self._bitboards[PIECE_TYPES.index(pieceType) + (6 if color else 0)]
+
+    def getBitboards(self) -> list:
+        """Returns a copy of all 12 piece bitboards in piece index order."""
+        return self._bitboards[:]
+
+    def getOccupancy(self, color: bool) -> int:
+        return self._occupancy[color]
+
+    def isSquareAttacked(self, row: int, col: int, byColor: bool, occupied=None) -> bool:
+        """
+        Checks if any piece of the given color attacks the square, by looking up the
+        attacks of every piece type from the square itself and intersecting them with
+        the enemy pieces of that type. The sliding pieces are blocked by the occupied squares,
+        which are the squares with pieces on them unless others are given.
+        """
+        square = row * 8 + col
+        offset = 6 if byColor else 0
+        bitboards = self._bitboards
+        # a pawn of the other color on this square would attack the squares our pawns attack it from
+        if PAWN_ATTACKS[not byColor][square] & bitboards[offset]:
+            return True
+        if KNIGHT_ATTACKS[square] & bitboards[offset + 1]:
+            return True
+        if KING_ATTACKS[square] & bitboards[offset + 5]:
+            return True
+        if occupied is None:
+            occupied = self._occupancy[0] | self._occupancy[1]
+        queens = bitboards[offset + 4]
+        if bishopAttacks(square, occupied) & (bitboards[offset + 2] | queens):
+            return True
+        if rookAttacks(square, occupied) & (bitboards[offset + 3] | queens):
+            return True
+        return False
+
+    def isKingMoveSafe(self, origin, target, color: bool) -> bool:
+        """
+        Checks that the king of the given color on the origin square isn't attacked on the target square.
+        The king is taken off the board first, since it would otherwise hide the squares behind it from
+        a sliding piece that is checking it.
+        """
+        occupied = (self._occupancy[0] | self._occupancy[1]) ^ (1 << origin)
+        return not self.isSquareAttacked(target >> 3, target & 7, not color, occupied)
+
+    def calculateChecksAndPins(self, kingRow: int, kingCol: int, color: bool):
+        """
+        Works out the checks and pins on the king of the given color from the attack tables, by looking along
+        each line from the king for the first two pieces on it. Returns if the king is in check, the check mask
+        and a dictionary of the pinned piece positions to the squares they can move to, which are the line
+        between the king and the pinning piece. The check mask has the squares where a piece other than the
+        king can stop the check: the checking piece and the squares between it and the king, every square when
+        the king isn't in check, or none in a double check.
+        """
+        king = kingRow * 8 + kingCol
+        offset = 0 if color else 6
+        bitboards = self._bitboards
+        own = self._occupancy[color]
+        occupied = own | self._occupancy[not color]
+        checkers = (PAWN_ATTACKS[color][king] & bitboards[offset]) | (KNIGHT_ATTACKS[king] & bitboards[offset + 1])
+        checkMask = checkers
+        pins = {}
+        queens = bitboards[offset + 4]
+        for rayTables, sliders in ((ROOK_RAY_TABLES, bitboards[offset + 3] | queens),
+                                   (BISHOP_RAY_TABLES, bitboards[offset + 2] | queens)):
+            for rays, positive in rayTables:
+                ray = rays[king]
+                # a line without an enemy sliding piece on it can't check or pin
+                if not ray & sliders:
+                    continue
+                blockers = ray & occupied
+                first = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+                firstBit = 1 << first
+                if firstBit & sliders:
+                    checkers |= firstBit
+                    checkMask |= ray ^ rays[first]
+                elif firstBit & own:
+                    blockers ^= firstBit
+                    second = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+                    if second >= 0 and (1 << second) & sliders:
+                        pins[(first >> 3, first & 7)] = ray ^ rays[second]
+        if checkers == 0:
+            return False, FULL_BOARD, pins
+        if checkers & (checkers - 1):
+            return True, 0, pins
+        return True, checkMask, pins
+
+    def calculateMoves(self, color: bool, promotionSquareList: list) -> list:
+        """
+        Calculates the same pseudo legal moves as the grid move functions of the game controller
+        for every piece of the given color, the pawn squares that lead to promotion are added
+        to the promotion square list.
+        """
+        return list(self.iterMoves(color, FULL_BOARD, FULL_BOARD, promotionSquareList))
+
+    def iterMoves(self, color: bool, targetMask, pushMask, promotionSquareList: list):
+        """
+        Generates the pseudo legal moves of the given color one at a time, only the moves onto the squares
+        of the target mask, and for pawn pushes the squares of the push mask. The bitboards are read as the
+        generation goes on, so the board has to be the same whenever the next move is asked for.
+        """
+        offset = 6 if color else 0
+        bitboards = self._bitboards
+        own = self._occupancy[color]
+        enemy = self._occupancy[not color]
+        empty = ~(own | enemy) & FULL_BOARD
+        notOwn = ~own & FULL_BOARD & targetMask
+        captureMask = enemy & targetMask
+        pushMask &= empty
+
+        # pawns, all pawns of one color are pushed at once by shifting the whole bitboard
+        pawns = bitboards[offset]
+        if color:
+            singlePushes = (pawns >> 8) & empty
+            # pawns that got to row 5 with a single push came from the starting row 6
+            doublePushes = ((singlePushes & (0xFF << 40)) >> 8) & pushMask
+            pawnMoves = ((singlePushes & pushMask, 8, 0), (doublePushes, 16, 0),
+                         (((pawns & NOT_H_FILE) >> 7) & captureMask, 7, MOVE_FLAG_CAPTURE),
+                         (((pawns & NOT_A_FILE) >> 9) & captureMask, 9, MOVE_FLAG_CAPTURE))
+            promotionRow = 0
+        else:
+            singlePushes = (pawns << 8) & empty
+            doublePushes = ((singlePushes & (0xFF << 16)) << 8) & pushMask
+            pawnMoves = ((singlePushes & pushMask, -8, 0), (doublePushes, -16, 0),
+                         (((pawns & NOT_A_FILE) << 7) & captureMask, -7, MOVE_FLAG_CAPTURE),
+                         (((pawns & NOT_H_FILE) << 9) & captureMask, -9, MOVE_FLAG_CAPTURE))
+            promotionRow = 7
+        for targets, shift, flags in pawnMoves:
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+                target = bit.bit_length() - 1
+                origin = target + shift
+                targetRow, targetCol = divmod(target, 8)
+                if targetRow == promotionRow:
+                    promotionSquareList.append((targetRow, targetCol))
+                    yield Move(origin >> 3, origin & 7, targetRow, targetCol, "p", flags | MOVE_FLAG_PROMOTION)
+                else:
+                    yield Move(origin >> 3, origin & 7, targetRow, targetCol, "p", flags)
+
+        # every other piece looks up its attacked squares and removes the squares with allied pieces on them
+        occupied = own | enemy
+        for pieceIndex in range(1, 6):
+            pieceType = PIECE_TYPES[pieceIndex]
+            pieces = bitboards[offset + pieceIndex]
+            while pieces:
+                bit = pieces & -pieces
+                pieces ^= bit
+                origin = bit.bit_length() - 1
+                if pieceIndex == 1:
+                    targets = KNIGHT_ATTACKS[origin]
+                elif pieceIndex == 2:
+                    targets = bishopAttacks(origin, occupied)
+                elif pieceIndex == 3:
+                    targets = rookAttacks(origin, occupied)
+                elif pieceIndex == 4:
+                    targets = bishopAttacks(origin, occupied) | rookAttacks(origin, occupied)
+                else:
+                    targets = KING_ATTACKS[origin]
+                targets &= notOwn
+                originRow, originCol = origin >> 3, origin & 7
+                while targets:
+                    targetBit = targets & -targets
+                    targets ^= targetBit
+                    target = targetBit.bit_length() - 1
+                    yield Move(originRow, originCol, target >> 3, target & 7, pieceType,
+                               MOVE_FLAG_CAPTURE if targetBit & enemy else 0)
+
 
 class MoveErrors(Exception):
     """Super Class for errors while processing the move"""
@@ -137,35 +650,55 @@ class ImpossiblePromotionError(MoveErrors):
     """If the player tries to promote to a pawn or king"""
 
 
+class InvalidFenError(Exception):
+    """The fenstring that was given does not describe a valid position"""
+
+
+# The flag bits of a move, so the kind of move can be checked without looking at the board or the move class
+MOVE_FLAG_CAPTURE = 1
+MOVE_FLAG_PROMOTION = 2
+MOVE_FLAG_EN_PASSANT = 4
+MOVE_FLAG_CASTLE = 8
+
+
 class Move:
     """
     The move class has various attributes to determine the starting
     and ending positions of a move, it also holds info about the
-    type of piece that it wants to move.
+    type of piece that it wants to move, and flag bits for captures,
+    promotions, en passant and castling.
 
     A special integer called move id is calculated through using the four
     positional integers. This is used to compare if two moves are the same.
+    The positions are only stored inside the move id, since thousands of moves are made every turn.
     """
 
-    def __init__(self, oR, oC, tR, tC, pieceType):
-        self._originRow = oR
-        self._originCol = oC
-        self._targetRow = tR
-        self._targetCol = tC
-        self._moveID = self._originRow * 512 + self._originCol * 64 + self._targetRow * 8 + self._targetCol
+    __slots__ = ("_moveID", "_pieceType", "_flags")
+
+    def __init__(self, oR, oC, tR, tC, pieceType, flags=0):
+        self._moveID = oR * 512 + oC * 64 + tR * 8 + tC
         self._pieceType = pieceType
+        self._flags = flags
 
     def getOriginRow(self):
-        return self._originRow
+        return self._moveID >> 9
 
     def getOriginCol(self):
-        return self._originCol
+        return (self._moveID >> 6) & 7
 
     def getTargetRow(self):
-        return self._targetRow
+        return (self._moveID >> 3) & 7
 
     def getTargetCol(self):
-        return self._targetCol
+        return self._moveID & 7
+
+    def getOriginSquare(self):
+        """Returns the origin position as a square index, row * 8 + col."""
+        return self._moveID >> 6
+
+    def getTargetSquare(self):
+        """Returns the target position as a square index, row * 8 + col."""
+        return self._moveID & 63
 
     def getMoveID(self):
         return self._moveID
@@ -173,6 +706,9 @@ class Move:
     def getPieceType(self):
         return self._pieceType
 
+    def getFlags(self):
+        return self._flags
+
     def __eq__(self, other):
         """To check if the moves are equal, the move id of the two moves is compared"""
         other: Move
@@ -186,8 +722,8 @@ class Move:
         the string representation of the move is the piece type followed by the starting position
         and then the target position, both shown in chess notation.
         """
-        originString = chr(self._originCol + 97) + str(8 - self._originRow)
-        targetString = chr(self._targetCol + 97) + str(8 - self._targetRow)
+        originString = chr(self.getOriginCol() + 97) + str(8 - self.getOriginRow())
+        targetString = chr(self.getTargetCol() + 97) + str(8 - self.getTargetRow())
         return f"{self._pieceType}{originString}{targetString}"
 
 
@@ -197,8 +733,10 @@ class EnPassantMove(Move):
     where the enemy pawn to be taken is doing the en passant.
     """
 
+    __slots__ = ("_enemyRow", "_enemyCol")
+
     def __init__(self, oR, oC, tR, tC, eR, eC, pieceType):
-        super().__init__(oR, oC, tR, tC, pieceType)
+        super().__init__(oR, oC, tR, tC, pieceType, MOVE_FLAG_CAPTURE | MOVE_FLAG_EN_PASSANT)
         self._enemyRow = eR
         self._enemyCol = eC
 
@@ -209,38 +747,436 @@ class EnPassantMove(Move):
         return self._enemyCol
 
 
-class GameController:
+class CastleMove(Move):
+    """
+    CastleMove is the king's part of castling, with the additional starting and ending
+    columns of the rook that moves along with it on the same row.
+    """
+
+    __slots__ = ("_rookOriginCol", "_rookTargetCol")
+
+    def __init__(self, oR, oC, tR, tC, rookOC, rookTC):
+        super().__init__(oR, oC, tR, tC, "k", MOVE_FLAG_CASTLE)
+        self._rookOriginCol = rookOC
+        self._rookTargetCol = rookTC
+
+    def getRookOriginCol(self):
+        return self._rookOriginCol
+
+    def getRookTargetCol(self):
+        return self._rookTargetCol
+
+    def __repr__(self):
+        """Castling is shown in the usual castling notation instead of the king's move."""
+        if self.getTargetCol() == 6:
+            return "0-0"
+        return "0-0-0"
+
+
+class UndoRecord:
+    """
+    An undo record stores everything that makeMove changes besides the board itself,
+    along with the pieces that were moved or captured, so that the move can be taken back.
+    """
+
+    __slots__ = ("move", "movedPiece", "capturedPiece", "enPassantSquare", "whiteCastleAvailability",
+                 "blackCastleAvailability", "whiteKingPos", "blackKingPos", "halfmoveClock", "fullmoveNumber",
+                 "hash", "enPassantHash")
+
+    def __init__(self, move, enPassantSquare, whiteCastleAvailability, blackCastleAvailability,
+                 whiteKingPos, blackKingPos, halfmoveClock, fullmoveNumber):
+        self.move = move
+        # the piece that was on the origin square, which is different from the target piece after promotion
+        self.movedPiece = None
+        self.capturedPiece = None
+        self.enPassantSquare = enPassantSquare
+        self.whiteCastleAvailability = tuple(whiteCastleAvailability)
+        self.blackCastleAvailability = tuple(blackCastleAvailability)
+        self.whiteKingPos = whiteKingPos
+        self.blackKingPos = blackKingPos
+        self.halfmoveClock = halfmoveClock
+        self.fullmoveNumber = fullmoveNumber
+        self.hash = 0
+        self.enPassantHash = 0
+
+
+class IncrementalMoveGenerator:
+    """
+    Keeps the pseudo legal moves of every piece from the last time its color was to move, and only
+    calculates the moves again for the pieces that a change on the board can affect. Along with its moves,
+    every piece keeps a mask of the squares its moves depend on: its own square, the squares it can jump to
+    and the squares of its rays up to and including the first blocker. A piece whose mask doesn't contain
+    any square that changed since then still has the same moves.
+
+    The game controller marks the squares that makeMove and unmakeMove touch, and the generator compares
+    those squares with its copy of the board to find the squares that really changed,
+    since a move that is made and taken back again leaves the board as it was.
+    """
 
     def __init__(self):
-        # Chess board is initalized as self._board
-        self._board = Board()
-        # Fill it
-        self._board.initializeBoard()
+        self.reset()
+
+    def reset(self):
+        """Forgets every piece, so the next moves are calculated from the whole board."""
+        # the piece index on every square (-1 for empty squares) the last time the board was looked at
+        self._mailbox = [-1] * 64
+        # indexed by color, so index 0 is black and index 1 is white
+        self._occupancy = [0, 0]
+        # square: (moves, dependency mask) of the pieces of each color, and the squares that have changed
+        # since the moves of each color were last calculated
+        self._pieceMoves = ({}, {})
+        self._changedSquares = [0, 0]
+        self._synced = False
+        self._regenerated = 0
+        self._reused = 0
+
+    def getStats(self):
+        """Returns how many pieces had their moves calculated again and how many kept their moves."""
+        return {"regenerated": self._regenerated, "reused": self._reused}
+
+    def syncBoard(self, board: Board, touchedSquares):
+        """Finds the touched squares that have a different piece on the board than before."""
+        mailbox = self._mailbox
+        if not self._synced:
+            touchedSquares = FULL_BOARD
+            self._synced = True
+        changed = 0
+        while touchedSquares:
+            bit = touchedSquares & -touchedSquares
+            touchedSquares ^= bit
+            square = bit.bit_length() - 1
+            piece = board.getPiece(square >> 3, square & 7)
+            index = -1 if piece is None else piece.getIndex()
+            if index != mailbox[square]:
+                if mailbox[square] != -1:
+                    self._occupancy[mailbox[square] >= 6] ^= bit
+                if index != -1:
+                    self._occupancy[index >= 6] |= bit
+                mailbox[square] = index
+                changed |= bit
+        self._changedSquares[0] |= changed
+        self._changedSquares[1] |= changed
+
+    def calculateMoves(self, board: Board, color: bool, touchedSquares, promotionSquareList: list) -> list:
+        """
+        Calculates the same pseudo legal moves as the full move generation for every piece of the given color,
+        reusing the moves of the pieces that weren't affected by the changes on the touched squares.
+        """
+        self.syncBoard(board, touchedSquares)
+        pieceMoves = self._pieceMoves[color]
+        changed = self._changedSquares[color]
+        self._changedSquares[color] = 0
+        own = self._occupancy[color]
+        if changed:
+            for square, (_, dependencies) in list(pieceMoves.items()):
+                if dependencies & changed:
+                    del pieceMoves[square]
+        # the pieces without moves are the ones that were affected or are on a square that changed
+        missing = own
+        for square in pieceMoves:
+            missing ^= 1 << square
+        self._reused += len(pieceMoves)
+        while missing:
+            bit = missing & -missing
+            missing ^= bit
+            square = bit.bit_length() - 1
+            pieceMoves[square] = self.calculatePieceMoves(square, color)
+            self._regenerated += 1
+        moves = []
+        for squareMoves, _ in pieceMoves.values():
+            moves += squareMoves
+        promotionSquareList += [(move.getTargetRow(), move.getTargetCol()) for move in moves
+                                if move.getFlags() & MOVE_FLAG_PROMOTION]
+        return moves
+
+    def calculatePieceMoves(self, square, color: bool):
+        """Calculates the pseudo legal moves of the piece on the square, along with the squares they depend on."""
+        pieceIndex = self._mailbox[square] % 6
+        pieceType = PIECE_TYPES[pieceIndex]
+        own = self._occupancy[color]
+        enemy = self._occupancy[not color]
+        occupied = own | enemy
+        row, col = square >> 3, square & 7
+        moves = []
+        if pieceIndex == 0:
+            # pawns move forward to an empty square and capture diagonally, a pawn on the last row can't move
+            if row == (0 if color else 7):
+                return moves, 1 << square
+            forward = -8 if color else 8
+            captures = PAWN_ATTACKS[color][square]
+            dependencies = (1 << square) | captures | (1 << (square + forward))
+            flags = MOVE_FLAG_PROMOTION if row == (1 if color else 6) else 0
+            if not occupied & (1 << (square + forward)):
+                moves.append(Move(row, col, row + forward // 8, col, "p", flags))
+                if row == (6 if color else 1):
+                    dependencies |= 1 << (square + 2 * forward)
+                    if not occupied & (1 << (square + 2 * forward)):
+                        moves.append(Move(row, col, row + forward // 4, col, "p"))
+            targets = captures & enemy
+            while targets:
+                targetBit = targets & -targets
+                targets ^= targetBit
+                target = targetBit.bit_length() - 1
+                moves.append(Move(row, col, target >> 3, target & 7, "p", MOVE_FLAG_CAPTURE | flags))
+            return moves, dependencies
+        if pieceIndex == 1:
+            attacks = KNIGHT_ATTACKS[square]
+        elif pieceIndex == 2:
+            attacks = bishopAttacks(square, occupied)
+        elif pieceIndex == 3:
+            attacks = rookAttacks(square, occupied)
+        elif pieceIndex == 4:
+            attacks = bishopAttacks(square, occupied) | rookAttacks(square, occupied)
+        else:
+            attacks = KING_ATTACKS[square]
+        targets = attacks & ~own
+        while targets:
+            targetBit = targets & -targets
+            targets ^= targetBit
+            target = targetBit.bit_length() - 1
+            moves.append(Move(row, col, target >> 3, target & 7, pieceType,
+                              MOVE_FLAG_CAPTURE if targetBit & enemy else 0))
+        return moves, attacks | (1 << square)
+
+
+class GameController:
+
+    def __init__(self, boardType=Board, fenString=None, debug=False, incremental=False):
+        # Chess board is initalized as self._board, either the grid Board or the BitboardBoard can be used
+        self._board = boardType()
+        self._useBitboards = isinstance(self._board, BitboardBoard)
+        # With incremental move generation only the moves of the pieces affected by the moves made since the
+        # last calculation are calculated again, the squares touched by makeMove and unmakeMove are marked for it.
+        # In debug mode the incremental moves are checked against the full move generation every time.
+        self._moveGenerator = IncrementalMoveGenerator() if incremental else None
+        self._touchedSquares = 0
         # White goes first
         self._activeColor = True
         # The moves list that stores all the possible moves a player can make
         self._moves = []
+        # The same moves grouped for looking up the moves that players enter, built by getMoveIndex
+        self._moveIndex = None
 
         # These are information attributes to be used through the move calculating and move making process
         self._attackedSquares = set()
         self._enPassantSquare = tuple()
-        self._tempEnPassantSquare = tuple()
         self._promotionType = None
         self._promotionSquares = []
+        # Every move made on the board pushes an undo record here so it can be taken back with unmakeMove
+        self._undoStack = []
         # These king position
         self._whiteKingPos = (7, 4)
-        self._tempWhiteKingPos = tuple()
         self._whiteCastleAvailability = [True, True]
         self._whiteCanCastleThisTurn = [False, False]
         self._blackKingPos = (0, 4)
-        self._tempBlackKingPos = tuple()
         self._blackCastleAvailability = [True, True]
         self._blackCanCastleThisTurn = [False, False]
+        # Pins and checks of the current position, calculated once before the moves are validated
+        self._kingInCheck = False
+        self._pinnedPieces = {}
+        # the squares a piece other than the king has to move to, which only the bitboard board works out
+        self._checkMask = FULL_BOARD
+        # The number of moves since the last capture or pawn move, and the number of the full move being played
+        self._halfmoveClock = 0
+        self._fullmoveNumber = 1
+        # The zobrist hash of the position, and the part of it that comes from the en passant square.
+        # In debug mode the hash is checked against a hash calculated from scratch after every change.
+        self._hash = 0
+        self._enPassantHash = 0
+        self._debug = debug
+        # The hashes of every position in the game so far, and how many times each of them has happened,
+        # along with how many of each type of piece there are, for detecting draws.
+        self._positionHistory = array.array("Q")
+        self._repetitionCounts = {}
+        self._materialCounts = [0] * 12
+        self._bishopSquareColors = [0, 0]
+        # Fill the board, with the starting position unless a different position was given
+        if fenString is None:
+            self._board.initializeBoard()
+            self._hash = self.calculateHash()
+            self.startPositionHistory()
+        else:
+            self.loadFen(fenString)
+
+    @classmethod
+    def fromFen(cls, fenString, boardType=Board, debug=False, incremental=False):
+        """Creates a game controller that starts from the position of a full fenstring."""
+        return cls(boardType, fenString, debug, incremental)
+
+    def copy(self):
+        """
+        Makes a separate game controller with the same position and position history,
+        so that moves can be tried out on it without touching the game.
+        """
+        return GameController.fromState(self.getState(), type(self._board), self._moveGenerator is not None)
+
+    def getState(self):
+        """
+        Returns the game as a small state that can be sent to another process instead of the board:
+        the full fenstring, and the hashes of every position so far as bytes for detecting repetitions.
+        """
+        return self.toFen(), self._positionHistory.tobytes()
+
+    @classmethod
+    def fromState(cls, state, boardType=Board, incremental=False):
+        """Creates a game controller from a state made by getState."""
+        fenString, historyBytes = state
+        controller = cls.fromFen(fenString, boardType, incremental=incremental)
+        if historyBytes:
+            positionHistory = array.array("Q")
+            positionHistory.frombytes(historyBytes)
+            controller.startPositionHistory(positionHistory)
+        return controller
+
+    def loadFen(self, fenString):
+        """
+        Replaces the current position with the one in the full fenstring, which has the piece placement,
+        the active color, the castling rights, the en passant target square and the move counters.
+        """
+        fields = fenString.split()
+        if len(fields) == 4:
+            # the move counters are optional, like in the fenstrings of most opening collections
+            fields += ["0", "1"]
+        if len(fields) != 6:
+            raise InvalidFenError
+        placement, activeColor, castling, enPassant, halfmoveClock, fullmoveNumber = fields
+        if placement.count("/") != 7 or activeColor not in ("w", "b"):
+            raise InvalidFenError
+        board = type(self._board)()
+        try:
+            board.initializeBoard(placement)
+            halfmoveClock = int(halfmoveClock)
+            fullmoveNumber = int(fullmoveNumber)
+        except (IndexError, ValueError):
+            raise InvalidFenError
+        if halfmoveClock < 0 or fullmoveNumber < 1:
+            raise InvalidFenError
+        if enPassant == "-":
+            enPassantSquare = ()
+        else:
+            # the engine stores the position of the pawn that moved two squares and its color,
+            # instead of the square behind it that the fenstring has.
+            # the square is behind a pawn of the player who just moved, so it is on the 3rd rank with black to move
+            # or on the 6th rank with white to move.
+            col = ord(enPassant[0]) - 97
+            if len(enPassant) != 2 or not 0 <= col < 8:
+                raise InvalidFenError
+            if enPassant[1] == "3" and activeColor == "b":
+                enPassantSquare = (4, col, True)
+            elif enPassant[1] == "6" and activeColor == "w":
+                enPassantSquare = (3, col, False)
+            else:
+                raise InvalidFenError
+        self.setPosition(board, activeColor == "w", ["K" in castling, "Q" in castling],
+                         ["k" in castling, "q" in castling], enPassantSquare, halfmoveClock, fullmoveNumber)
+
+    def setPosition(self, board, activeColor, whiteCastleAvailability, blackCastleAvailability, enPassantSquare,
+                    halfmoveClock, fullmoveNumber, positionHistory=None):
+        """
+        Replaces the current position with a board that is already filled and the rest of the state of the game,
+        the en passant square is given the same way the controller stores it. The position history is the hashes
+        of the earlier positions ending with this one, and starts over from this position if it isn't given.
+        InvalidFenError is raised if either king is missing, a pawn is on the first or last row, the player who
+        isn't moving is in check (which includes the kings being next to each other), or there is no pawn behind
+        the en passant square. A castling right is dropped when the king or the rook isn't on its starting square.
+        """
+        whiteKingPos = board.findKing(True)
+        blackKingPos = board.findKing(False)
+        if whiteKingPos is None or blackKingPos is None:
+            raise InvalidFenError
+        for row in (0, 7):
+            for col in range(8):
+                piece = board.getPiece(row, col)
+                if piece is not None and piece.getType() == "p":
+                    raise InvalidFenError
+        # the king of the player who just moved can't be left in check, or it could be captured
+        kingPos = blackKingPos if activeColor else whiteKingPos
+        if board.isSquareAttacked(kingPos[0], kingPos[1], activeColor):
+            raise InvalidFenError
+        if enPassantSquare != ():
+            pawn = board.getPiece(enPassantSquare[0], enPassantSquare[1])
+            if pawn is None or pawn.getType() != "p" or pawn.getColor() != enPassantSquare[2]:
+                raise InvalidFenError
+        self._board = board
+        self._useBitboards = isinstance(board, BitboardBoard)
+        self._whiteKingPos = whiteKingPos
+        self._blackKingPos = blackKingPos
+        self._activeColor = activeColor
+        self._whiteCastleAvailability = self.checkCastleAvailability(board, True, whiteCastleAvailability)
+        self._blackCastleAvailability = self.checkCastleAvailability(board, False, blackCastleAvailability)
+        self._enPassantSquare = enPassantSquare
+        self._halfmoveClock = halfmoveClock
+        self._fullmoveNumber = fullmoveNumber
+        self._moves = []
+        self._moveIndex = None
+        self._undoStack = []
+        self._promotionType = None
+        self._whiteCanCastleThisTurn = [False, False]
+        self._blackCanCastleThisTurn = [False, False]
+        self._enPassantHash = self.calculateEnPassantHash()
+        self._hash = self.calculateHash()
+        self.startPositionHistory(positionHistory)
+        if self._moveGenerator is not None:
+            self._moveGenerator.reset()
+
+    @staticmethod
+    def checkCastleAvailability(board, color, castleAvailability):
+        """
+        Returns the castling rights of a color as [kingside, queenside], keeping only the ones where the king
+        and the rook are still on their starting squares, since a fenstring can give any castling rights.
+        """
+        row = 7 if color else 0
+        king = board.getPiece(row, 4)
+        if king is None or king.getType() != "k" or king.getColor() != color:
+            return [False, False]
+        availability = []
+        for available, rookCol in zip(castleAvailability, (7, 0)):
+            rook = board.getPiece(row, rookCol)
+            availability.append(bool(available) and rook is not None and rook.getType() == "r"
+                                and rook.getColor() == color)
+        return availability
+
+    def toFen(self):
+        """Writes the whole state of the game as a full fenstring."""
+        rows = []
+        for row in range(8):
+            rowString = ""
+            emptyCount = 0
+            for col in range(8):
+                piece = self._board.getPiece(row, col)
+                if piece is None:
+                    emptyCount += 1
+                else:
+                    if emptyCount != 0:
+                        rowString += str(emptyCount)
+                        emptyCount = 0
+                    rowString += repr(piece)
+            if emptyCount != 0:
+                rowString += str(emptyCount)
+            rows.append(rowString)
+        castling = ""
+        for available, letter in zip(self._whiteCastleAvailability + self._blackCastleAvailability, "KQkq"):
+            if available:
+                castling += letter
+        # the en passant square is only kept until the end of the other player's turn,
+        # so it is only written while it belongs to the last move.
+        if self._enPassantSquare != () and self._enPassantSquare[2] != self._activeColor:
+            if self._enPassantSquare[2]:
+                enPassant = chr(self._enPassantSquare[1] + 97) + "3"
+            else:
+                enPassant = chr(self._enPassantSquare[1] + 97) + "6"
+        else:
+            enPassant = "-"
+        activeColor = "w" if self._activeColor else "b"
+        return f"{'/'.join(rows)} {activeColor} {castling or '-'} {enPassant} " \
+               f"{self._halfmoveClock} {self._fullmoveNumber}"
 
     def getActiveColor(self):
         return self._activeColor
 
     def setActiveColor(self, color):
+        if color != self._activeColor:
+            self._hash ^= ZOBRIST_BLACK_TO_MOVE_KEY
         self._activeColor = color
 
     def getBoard(self):
@@ -249,193 +1185,426 @@ class GameController:
     def getMoves(self):
         return self._moves
 
+    def setPromotionType(self, promotionType):
+        """Sets the piece type that a pawn reaching the last row is promoted to by the next move made."""
+        self._promotionType = promotionType
+
     def processMove(self, moveString):
-        finalizedMove = None  # single move to be made for most cases
-        finalizedMoves = []  # move list for things castling
+        finalizedMove = None  # single move to be made
         moveString = moveString.lower()
         returnedString =""
-        # when castling happens, theres 2 moves that happen simultaneously
-        # the rook moves to a position 1 square away from the king, and then the king hops over the rook.
+        # when castling happens, the king hops two squares towards the rook
+        # and the rook moves to the square the king passed over.
         if moveString == "0-0":
             if self._activeColor:
                 if self._whiteCanCastleThisTurn[0]:
                     # predefined values because there can be only one type of white king side castle.
-                    finalizedMoves.append(Move(7, 7, 7, 5, "r"))
-                    finalizedMoves.append(Move(7, 4, 7, 6, "k"))
+                    finalizedMove = CastleMove(7, 4, 7, 6, 7, 5)
                 else:
                     raise InvalidMoveError
             else:
                 if self._blackCanCastleThisTurn[0]:
-                    finalizedMoves.append(Move(0, 7, 0, 5, "r"))
-                    finalizedMoves.append(Move(0, 4, 0, 6, "k"))
+                    finalizedMove = CastleMove(0, 4, 0, 6, 7, 5)
                 else:
                     raise InvalidMoveError
-            returnedString = "0-0"
         elif moveString == "0-0-0":
             # queenside castling
             if self._activeColor:
                 if self._whiteCanCastleThisTurn[1]:
-                    finalizedMoves.append(Move(7, 0, 7, 3, "r"))
-                    finalizedMoves.append(Move(7, 4, 7, 2, "k"))
+                    finalizedMove = CastleMove(7, 4, 7, 2, 0, 3)
+                else:
+                    raise InvalidMoveError
             else:
                 if self._blackCanCastleThisTurn[1]:
-                    finalizedMoves.append(Move(0, 0, 0, 3, "r"))
-                    finalizedMoves.append(Move(0, 4, 0, 2, "k"))
-            returnedString = "0-0-0"
+                    finalizedMove = CastleMove(0, 4, 0, 2, 0, 3)
+                else:
+                    raise InvalidMoveError
         elif len(moveString) == 2:
-            try:
-                targetRow = 8 - int(moveString[1])
-                targetCol = ord(moveString[0].lower()) - 97
-                targetType = "p"
-            except ValueError:
-                raise InvalidMoveError
-            if (self._activeColor and targetRow == 0) or (not self._activeColor and targetRow == 7):
+            # a pawn move that only has the target position
+            targetRow, targetCol = self.parseSquare(moveString[0:2])
+            if self.isLastRow(targetRow):
                 raise SpecifyPromotionError
-            move: Move
-            possibleMove = [move for move in self._moves if
-                            move.getTargetRowAndCol() == (targetRow, targetCol) and move.getPieceType() == targetType]
-            if len(possibleMove) == 1:
-                # only make the move if there is one option
-                finalizedMove = possibleMove[0]
-            elif len(possibleMove) > 1:
-                raise AmbiguousMoveError
-            else:
-                raise InvalidMoveError
+            finalizedMove = self.findMove("p", targetRow, targetCol)
         elif len(moveString) == 3:
             # This is a move entered without the starting position
-            # The program searches through all available moves to see if there are any moves
-            # that match the end target location of the move the user specified.
-            # If there is more than one match a AmbiguousMoveError is raised.
-            try:
-                targetRow = 8 - int(moveString[2])
-                targetCol = ord(moveString[1].lower()) - 97
-                targetType = moveString[0]
-            except ValueError:
-                raise InvalidMoveError
+            # The program looks up the moves of the piece type that end on the target location
+            # the user specified. If there is more than one match a AmbiguousMoveError is raised.
+            targetType = moveString[0]
+            targetRow, targetCol = self.parseSquare(moveString[1:3])
             # if it is a pawn move onto the final row, then the user must specify a type of piece to promote to.
-            if targetType == "p" and (
-                    (self._activeColor and targetRow == 0) or (not self._activeColor and targetRow == 7)):
+            if targetType == "p" and self.isLastRow(targetRow):
                 raise SpecifyPromotionError
-            move: Move
-            # the loop to see if any of them match the users move
-            possibleMove = [move for move in self._moves if
-                            move.getTargetRowAndCol() == (targetRow, targetCol) and move.getPieceType() == targetType]
-            if len(possibleMove) == 1:
-                # only make the move if there is one option
-                finalizedMove = possibleMove[0]
-            elif len(possibleMove) > 1:
-                raise AmbiguousMoveError
-            else:
-                raise InvalidMoveError
+            finalizedMove = self.findMove(targetType, targetRow, targetCol)
         elif len(moveString) == 4:
             # pawn promotion
             if moveString[0] != "p":
                 # if it isn't a pawn then the user has entered something invalid.
                 raise InvalidMoveError
-            try:
-                targetRow = 8 - int(moveString[2])
-                targetCol = ord(moveString[1].lower()) - 97
-                self._promotionType = moveString[3]
-            except ValueError:
-                raise InvalidMoveError
-            if self._promotionType == "p" or self._promotionType == "k":
+            targetRow, targetCol = self.parseSquare(moveString[1:3])
+            promotionType = moveString[3]
+            if promotionType not in "nbrq":
                 # the user cannot promote from a pawn to a pawn or king.
                 raise ImpossiblePromotionError
-            if (self._activeColor and targetRow != 0) or (not self._activeColor and targetRow != 7):
-                raise InvalidMoveError
-            move: Move
-            for move in self._moves:
-                if (move.getTargetRow, move.getTargetCol) == (targetRow, targetCol) and move.getPieceType() == "p":
-                    finalizedMove = move
-                    break
-            else:
+            if not self.isLastRow(targetRow):
                 raise InvalidMoveError
+            finalizedMove = self.findMove("p", targetRow, targetCol)
+            self._promotionType = promotionType
         elif len(moveString) == 5:
             # can be used normally, but mainly used to distinguish between ambiguous 3 character moves.
-            targetRow = 8 - int(moveString[4])
-            targetCol = ord(moveString[3].lower()) - 97
-            originRow = 8 - int(moveString[2])
-            originCol = ord(moveString[1].lower()) - 97
             targetType = moveString[0]
-            # since all parameters are specified, the program doesn't need to look at
-            # if any of the calculated moves match the target position
-            # it just needs to see if the move the user specified is in the list of available moves.
-            possibleMove = Move(originRow, originCol, targetRow, targetCol, targetType)
-            if possibleMove in self._moves:
-                finalizedMove = possibleMove
-            else:
+            originRow, originCol = self.parseSquare(moveString[1:3])
+            targetRow, targetCol = self.parseSquare(moveString[3:5])
+            # since all parameters are specified, the move id is looked up directly, which also
+            # gives back the calculated move itself so en passant and castling moves stay what they are.
+            finalizedMove = self.getMoveIndex()[1].get(originRow * 512 + originCol * 64 + targetRow * 8 + targetCol)
+            if finalizedMove is None or finalizedMove.getPieceType() != targetType:
+                raise InvalidMoveError
+            if targetType == "p" and self.isLastRow(targetRow):
+                raise SpecifyPromotionError
+        elif len(moveString) == 6:
+            # pawn promotion with the starting position, for when two pawns can promote on the same square.
+            if moveString[0] != "p":
+                raise InvalidMoveError
+            originRow, originCol = self.parseSquare(moveString[1:3])
+            targetRow, targetCol = self.parseSquare(moveString[3:5])
+            promotionType = moveString[5]
+            if promotionType not in "nbrq":
+                raise ImpossiblePromotionError
+            finalizedMove = self.getMoveIndex()[1].get(originRow * 512 + originCol * 64 + targetRow * 8 + targetCol)
+            if finalizedMove is None or not finalizedMove.getFlags() & MOVE_FLAG_PROMOTION:
                 raise InvalidMoveError
+            self._promotionType = promotionType
         else:
             raise IncorrectMoveStringLengthError
         # finally, make the move/moves
         if finalizedMove is not None:
             self.makeMove(finalizedMove)
             returnedString = str(finalizedMove.__repr__())
-        if len(finalizedMoves) != 0:
-            for move in finalizedMoves:
-                self.makeMove(move)
+            # the promotion type is added so the move can be entered again exactly as it was made
+            if finalizedMove.getFlags() & MOVE_FLAG_PROMOTION and self._promotionType is not None:
+                returnedString += self._promotionType
+        # the promotion type only applies to the move that was just made
+        self._promotionType = None
         return returnedString
 
-    def makeMove(self, move, customBoard=None):
+    @staticmethod
+    def parseSquare(squareString):
+        """Turns a square in chess notation like e4 into a (row, col) tuple."""
+        col = ord(squareString[0]) - 97
+        if not 0 <= col < 8 or squareString[1] not in "12345678":
+            raise InvalidMoveError
+        return 8 - int(squareString[1]), col
+
+    def isLastRow(self, row):
+        """Checks if the row is the one where the current player's pawns get promoted."""
+        return row == (0 if self._activeColor else 7)
+
+    def getMoveIndex(self):
         """
-        takes a move and makes it on the main board if a custom temporary board
-        has not been provided
+        Returns the current moves grouped by (piece type, target square), and by move id.
+        The index is only built the first time a move is looked up after the moves are calculated,
+        so every attempt at entering a move afterwards only takes dictionary lookups.
         """
-        if customBoard is None:
-            board = self._board
-        else:
-            board = customBoard
+        if self._moveIndex is None:
+            movesByTarget = {}
+            movesByID = {}
+            move: Move
+            for move in self._moves:
+                key = (move.getPieceType(), move.getTargetRow() * 8 + move.getTargetCol())
+                if key in movesByTarget:
+                    movesByTarget[key].append(move)
+                else:
+                    movesByTarget[key] = [move]
+                movesByID[move.getMoveID()] = move
+            self._moveIndex = (movesByTarget, movesByID)
+        return self._moveIndex
+
+    def findMove(self, pieceType, targetRow, targetCol):
+        """Finds the only move of the piece type that ends on the target position."""
+        possibleMoves = self.getMoveIndex()[0].get((pieceType, targetRow * 8 + targetCol))
+        if possibleMoves is None:
+            raise InvalidMoveError
+        if len(possibleMoves) > 1:
+            raise AmbiguousMoveError
+        return possibleMoves[0]
+
+    def makeMove(self, move):
+        """
+        Makes the move on the board and saves an undo record, so that the move
+        can be taken back with unmakeMove without copying the board.
+        The position hash is updated along with every change that is made.
+        """
+        board = self._board
+        self._undoStack.append(UndoRecord(move, self._enPassantSquare, self._whiteCastleAvailability,
+                                          self._blackCastleAvailability, self._whiteKingPos, self._blackKingPos,
+                                          self._halfmoveClock, self._fullmoveNumber))
+        record: UndoRecord = self._undoStack[-1]
+        record.hash = self._hash
+        record.enPassantHash = self._enPassantHash
+        # the en passant square only lasts for one move, so it is removed unless this move sets a new one
+        self._hash ^= self._enPassantHash
+        self._enPassantHash = 0
+        self._enPassantSquare = ()
+        self._touchedSquares |= (1 << move.getOriginSquare()) | (1 << move.getTargetSquare())
+        piece = board.popCell(move.getOriginRow(), move.getOriginCol())
+        record.movedPiece = piece
+        pieceIndex = BitboardBoard.pieceIndex(piece)
+        self._hash ^= ZOBRIST_PIECE_KEYS[pieceIndex][move.getOriginSquare()]
+        flags = move.getFlags()
+        # the full move number goes up once black has moved
+        if not piece.getColor():
+            self._fullmoveNumber += 1
         # custom move instructions for en passant
-        if isinstance(move, EnPassantMove):
-            pawn = board.popCell(move.getOriginRow(), move.getOriginCol())
-            board.editCell(move.getTargetRow(), move.getTargetCol(), pawn)
-            board.popCell(move.getEnemyRow(), move.getEnemyCol())
-        else:
-            piece = board.popCell(move.getOriginRow(), move.getOriginCol())
+        if flags & MOVE_FLAG_EN_PASSANT:
             board.editCell(move.getTargetRow(), move.getTargetCol(), piece)
-            # special conditions pertaining to
-            # rooks (castling), pawns (en passant), and kings (castling and checks)
-            if piece.getType() == "r":
-                if customBoard is None:
-                    if piece.getColor():
-                        if move.getOriginRow() == 7 and move.getOriginCol() == 7:
-                            self._whiteCastleAvailability[0] = False
-                        if move.getOriginRow() == 7 and move.getOriginCol() == 0:
-                            self._whiteCastleAvailability[1] = False
-                    else:
-                        if move.getOriginRow() == 0 and move.getOriginCol() == 7:
-                            self._blackCastleAvailability[0] = False
-                        if move.getOriginRow() == 0 and move.getOriginCol() == 0:
-                            self._blackCastleAvailability[1] = False
-            if piece.getType() == "p":
-                if customBoard is None:
-                    if move.getTargetRow() - move.getOriginRow() == 2:
-                        self._enPassantSquare = (move.getTargetRow(), move.getTargetCol(), False)
-                    elif move.getTargetRow() - move.getOriginRow() == -2:
-                        self._enPassantSquare = (move.getTargetRow(), move.getTargetCol(), True)
-                    if piece.getColor() and move.getTargetRow() == 0:
-                        board.editCell(move.getTargetRow(), move.getTargetCol(), Piece(True, self._promotionType))
-                    elif not piece.getColor() and move.getTargetRow() == 7:
-                        board.editCell(move.getTargetRow(), move.getTargetCol(), Piece(False, self._promotionType))
+            record.capturedPiece = board.popCell(move.getEnemyRow(), move.getEnemyCol())
+            self._touchedSquares |= 1 << (move.getEnemyRow() * 8 + move.getEnemyCol())
+            capturedIndex = BitboardBoard.pieceIndex(record.capturedPiece)
+            self._hash ^= ZOBRIST_PIECE_KEYS[pieceIndex][move.getTargetSquare()] ^ \
+                ZOBRIST_PIECE_KEYS[capturedIndex][move.getEnemyRow() * 8 + move.getEnemyCol()]
+            self._materialCounts[capturedIndex] -= 1
+            self._halfmoveClock = 0
+            self.recordPosition()
+            if self._debug:
+                self.verifyHash()
+            return
+        record.capturedPiece = board.popCell(move.getTargetRow(), move.getTargetCol())
+        board.editCell(move.getTargetRow(), move.getTargetCol(), piece)
+        targetSquare = move.getTargetSquare()
+        if record.capturedPiece is not None:
+            capturedIndex = BitboardBoard.pieceIndex(record.capturedPiece)
+            self._hash ^= ZOBRIST_PIECE_KEYS[capturedIndex][targetSquare]
+            self._materialCounts[capturedIndex] -= 1
+            if record.capturedPiece.getType() == "b":
+                self._bishopSquareColors[(move.getTargetRow() + move.getTargetCol()) & 1] -= 1
+        if flags & MOVE_FLAG_CASTLE:
+            rook = board.popCell(move.getTargetRow(), move.getRookOriginCol())
+            board.editCell(move.getTargetRow(), move.getRookTargetCol(), rook)
+            self._touchedSquares |= (1 << (move.getTargetRow() * 8 + move.getRookOriginCol())) | \
+                (1 << (move.getTargetRow() * 8 + move.getRookTargetCol()))
+            rookKeys = ZOBRIST_PIECE_KEYS[BitboardBoard.pieceIndex(rook)]
+            self._hash ^= rookKeys[move.getTargetRow() * 8 + move.getRookOriginCol()] ^ \
+                rookKeys[move.getTargetRow() * 8 + move.getRookTargetCol()]
+        # the halfmove clock counts the moves since the last capture or pawn move for the 50 move rule
+        if record.capturedPiece is not None or piece.getType() == "p":
+            self._halfmoveClock = 0
+        else:
+            self._halfmoveClock += 1
+        # a rook that is captured before it has moved can't be castled with anymore
+        if record.capturedPiece is not None:
+            if move.getTargetRow() == 7 and move.getTargetCol() == 7:
+                self._whiteCastleAvailability[0] = False
+            elif move.getTargetRow() == 7 and move.getTargetCol() == 0:
+                self._whiteCastleAvailability[1] = False
+            elif move.getTargetRow() == 0 and move.getTargetCol() == 7:
+                self._blackCastleAvailability[0] = False
+            elif move.getTargetRow() == 0 and move.getTargetCol() == 0:
+                self._blackCastleAvailability[1] = False
+        # special conditions pertaining to
+        # rooks (castling), pawns (en passant), and kings (castling and checks)
+        if piece.getType() == "r":
+            if piece.getColor():
+                if move.getOriginRow() == 7 and move.getOriginCol() == 7:
+                    self._whiteCastleAvailability[0] = False
+                if move.getOriginRow() == 7 and move.getOriginCol() == 0:
+                    self._whiteCastleAvailability[1] = False
+            else:
+                if move.getOriginRow() == 0 and move.getOriginCol() == 7:
+                    self._blackCastleAvailability[0] = False
+                if move.getOriginRow() == 0 and move.getOriginCol() == 0:
+                    self._blackCastleAvailability[1] = False
+        elif piece.getType() == "p":
+            if move.getTargetRow() - move.getOriginRow() == 2:
+                self._enPassantSquare = (move.getTargetRow(), move.getTargetCol(), False)
+            elif move.getTargetRow() - move.getOriginRow() == -2:
+                self._enPassantSquare = (move.getTargetRow(), move.getTargetCol(), True)
+            if self._enPassantSquare != ():
+                self._enPassantHash = self.calculateEnPassantHash()
+                self._hash ^= self._enPassantHash
+            # the promotion type is only set when a real promotion is being made,
+            # while checking if a move is valid the pawn is left on the last row.
+            if self._promotionType is not None and flags & MOVE_FLAG_PROMOTION:
+                self._materialCounts[pieceIndex] -= 1
+                pieceIndex = PIECE_TYPES.index(self._promotionType) + (6 if piece.getColor() else 0)
+                piece = PIECE_OBJECTS[pieceIndex]
+                board.editCell(move.getTargetRow(), move.getTargetCol(), piece)
+                self._materialCounts[pieceIndex] += 1
+                if piece.getType() == "b":
+                    self._bishopSquareColors[(move.getTargetRow() + move.getTargetCol()) & 1] += 1
+        elif piece.getType() == "k":
+            if piece.getColor():
+                self._whiteKingPos = (move.getTargetRow(), move.getTargetCol())
+                self._whiteCastleAvailability = [False, False]
+            else:
+                self._blackKingPos = (move.getTargetRow(), move.getTargetCol())
+                self._blackCastleAvailability = [False, False]
+        self._hash ^= ZOBRIST_PIECE_KEYS[pieceIndex][targetSquare]
+        # only king moves, rook moves and captures can change the castling rights
+        if piece.getType() in "kr" or record.capturedPiece is not None:
+            self._hash ^= calculateCastlingHash(record.whiteCastleAvailability, record.blackCastleAvailability) ^ \
+                calculateCastlingHash(self._whiteCastleAvailability, self._blackCastleAvailability)
+        self.recordPosition()
+        if self._debug:
+            self.verifyHash()
+
+    def recordPosition(self):
+        """Adds the position after a move to the position history, the other player is the one to move next."""
+        positionHash = self._hash ^ ZOBRIST_BLACK_TO_MOVE_KEY
+        self._positionHistory.append(positionHash)
+        self._repetitionCounts[positionHash] = self._repetitionCounts.get(positionHash, 0) + 1
+
+    def unmakeMove(self):
+        """Takes back the last move that was made with makeMove by using its undo record."""
+        board = self._board
+        record: UndoRecord = self._undoStack.pop()
+        move = record.move
+        positionHash = self._positionHistory.pop()
+        if self._repetitionCounts[positionHash] == 1:
+            del self._repetitionCounts[positionHash]
+        else:
+            self._repetitionCounts[positionHash] -= 1
+        # unmaking touches the same squares as making the move did
+        self._touchedSquares |= (1 << move.getOriginSquare()) | (1 << move.getTargetSquare())
+        # the piece on the target square might be a promoted piece, so the original piece is put back
+        targetPiece = board.popCell(move.getTargetRow(), move.getTargetCol())
+        board.editCell(move.getOriginRow(), move.getOriginCol(), record.movedPiece)
+        if targetPiece is not record.movedPiece:
+            self._materialCounts[BitboardBoard.pieceIndex(targetPiece)] -= 1
+            self._materialCounts[BitboardBoard.pieceIndex(record.movedPiece)] += 1
+            if targetPiece.getType() == "b":
+                self._bishopSquareColors[(move.getTargetRow() + move.getTargetCol()) & 1] -= 1
+        if move.getFlags() & MOVE_FLAG_CASTLE:
+            rook = board.popCell(move.getTargetRow(), move.getRookTargetCol())
+            board.editCell(move.getTargetRow(), move.getRookOriginCol(), rook)
+            self._touchedSquares |= (1 << (move.getTargetRow() * 8 + move.getRookOriginCol())) | \
+                (1 << (move.getTargetRow() * 8 + move.getRookTargetCol()))
+        if record.capturedPiece is not None:
+            self._materialCounts[BitboardBoard.pieceIndex(record.capturedPiece)] += 1
+            if move.getFlags() & MOVE_FLAG_EN_PASSANT:
+                board.editCell(move.getEnemyRow(), move.getEnemyCol(), record.capturedPiece)
+                self._touchedSquares |= 1 << (move.getEnemyRow() * 8 + move.getEnemyCol())
+            else:
+                board.editCell(move.getTargetRow(), move.getTargetCol(), record.capturedPiece)
+                if record.capturedPiece.getType() == "b":
+                    self._bishopSquareColors[(move.getTargetRow() + move.getTargetCol()) & 1] += 1
+        self._enPassantSquare = record.enPassantSquare
+        self._whiteCastleAvailability = list(record.whiteCastleAvailability)
+        self._blackCastleAvailability = list(record.blackCastleAvailability)
+        self._whiteKingPos = record.whiteKingPos
+        self._blackKingPos = record.blackKingPos
+        self._halfmoveClock = record.halfmoveClock
+        self._fullmoveNumber = record.fullmoveNumber
+        self._hash = record.hash
+        self._enPassantHash = record.enPassantHash
+        if self._debug:
+            self.verifyHash()
+
+    def getHash(self):
+        """Returns the 64 bit zobrist hash of the current position."""
+        return self._hash
+
+    def getHalfmoveClock(self):
+        return self._halfmoveClock
+
+    def getFullmoveNumber(self):
+        return self._fullmoveNumber
+
+    def getEnPassantSquare(self):
+        return self._enPassantSquare
+
+    def getCastleAvailability(self, color):
+        """Returns if the player can still castle on the kingside and on the queenside."""
+        if color:
+            return tuple(self._whiteCastleAvailability)
+        return tuple(self._blackCastleAvailability)
+
+    def getPositionHistory(self):
+        """Returns the hashes of every position of the game so far, ending with the current one."""
+        return array.array("Q", self._positionHistory)
+
+    def getDrawReason(self):
+        """
+        Returns why the current position is a draw, other than stalemate, or None if it isn't one.
+        None of the checks depend on the length of the game, since the repetitions and
+        the material are counted as the moves are made.
+        """
+        if self._repetitionCounts.get(self._hash, 0) >= 3:
+            return "threefold repetition"
+        if self._halfmoveClock >= 100:
+            return "the 50-move rule"
+        if self.isInsufficientMaterial():
+            return "insufficient material"
+        return None
+
+    def isInsufficientMaterial(self):
+        """
+        Checks if neither player has enough pieces left to checkmate, which is when there are only
+        kings and a single knight or bishop, or only kings and bishops that are all on the same square color.
+        """
+        counts = self._materialCounts
+        # pawns, rooks and queens of either color
+        if counts[0] or counts[3] or counts[4] or counts[6] or counts[9] or counts[10]:
+            return False
+        knights = counts[1] + counts[7]
+        bishops = counts[2] + counts[8]
+        if knights + bishops <= 1:
+            return True
+        return knights == 0 and (self._bishopSquareColors[0] == 0 or self._bishopSquareColors[1] == 0)
+
+    def calculateMaterial(self):
+        """Counts every type of piece on the board from scratch, along with the square colors of the bishops."""
+        self._materialCounts = [0] * 12
+        self._bishopSquareColors = [0, 0]
+        for pieceIndex, square in self._board.getPieceSquares():
+            self._materialCounts[pieceIndex] += 1
+            # the bishops are piece indexes 2 and 8
+            if pieceIndex % 6 == 2:
+                self._bishopSquareColors[((square >> 3) + (square & 7)) & 1] += 1
+
+    def startPositionHistory(self, positionHistory=None):
+        """
+        Starts the position history and material counts from the current position,
+        or continues the position history that is given.
+        """
+        if positionHistory:
+            self._positionHistory = array.array("Q", positionHistory)
+            self._repetitionCounts = {}
+            for positionHash in self._positionHistory:
+                self._repetitionCounts[positionHash] = self._repetitionCounts.get(positionHash, 0) + 1
+        else:
+            self._positionHistory = array.array("Q", [self._hash])
+            self._repetitionCounts = {self._hash: 1}
+        self.calculateMaterial()
 
-                else:
-                    if move.getTargetRow() - move.getOriginRow() == 2:
-                        self._tempEnPassantSquare = (move.getTargetRow(), move.getTargetCol(), False)
-                    elif move.getTargetRow() - move.getOriginRow() == -2:
-                        self._tempEnPassantSquare = (move.getTargetRow(), move.getTargetCol(), True)
-            elif piece.getType() == "k":
-                if customBoard is None:
-                    if piece.getColor():
-                        self._whiteKingPos = (move.getTargetRow(), move.getTargetCol())
-                        self._whiteCastleAvailability = [False, False]
-                    else:
-                        self._blackKingPos = (move.getTargetRow(), move.getTargetCol())
-                        self._blackCastleAvailability = [False, False]
-                else:
-                    if piece.getColor():
-                        self._tempWhiteKingPos = (move.getTargetRow(), move.getTargetCol())
-                    else:
-                        self._tempBlackKingPos = (move.getTargetRow(), move.getTargetCol())
+    def calculateEnPassantHash(self):
+        """
+        Returns the hash key of the en passant square, which only counts when an enemy pawn is
+        next to the pawn that moved two squares, otherwise the position is the same as without it.
+        """
+        if self._enPassantSquare == ():
+            return 0
+        row, col, pawnColor = self._enPassantSquare
+        for enemyCol in (col - 1, col + 1):
+            if 0 <= enemyCol < 8:
+                piece = self._board.getPiece(row, enemyCol)
+                if piece is not None and piece.getType() == "p" and piece.getColor() != pawnColor:
+                    return ZOBRIST_EN_PASSANT_KEYS[col]
+        return 0
+
+    def calculateHash(self):
+        """Calculates the zobrist hash of the current position from scratch."""
+        positionHash = 0
+        for pieceIndex, square in self._board.getPieceSquares():
+            positionHash ^= ZOBRIST_PIECE_KEYS[pieceIndex][square]
+        if not self._activeColor:
+            positionHash ^= ZOBRIST_BLACK_TO_MOVE_KEY
+        positionHash ^= calculateCastlingHash(self._whiteCastleAvailability, self._blackCastleAvailability)
+        positionHash ^= self.calculateEnPassantHash()
+        return positionHash
+
+    def verifyHash(self):
+        """Used in debug mode to make sure the incrementally updated hash matches a hash calculated from scratch."""
+        assert self._hash == self.calculateHash(), f"Position hash is out of sync:\n{self._board}"
 
     def calculateMoves(self):
         """Calculates ALL moves for every piece that belongs to the current player on the board."""
@@ -444,6 +1613,22 @@ class GameController:
         self._blackCanCastleThisTurn = [False, False]
         self._promotionSquares = []
         self._moves = []
+        self._moveIndex = None
+        if self._moveGenerator is not None:
+            self._moves = self._moveGenerator.calculateMoves(self._board, self._activeColor, self._touchedSquares,
+                                                             self._promotionSquares)
+            self._touchedSquares = 0
+            if self._debug:
+                self.verifyMoves()
+            return
+        self.calculateAllMoves()
+
+    def calculateAllMoves(self):
+        """Calculates the moves of every piece of the current player from scratch."""
+        if self._useBitboards:
+            # the bitboard can calculate the moves for every piece at once
+            self._moves = self._board.calculateMoves(self._activeColor, self._promotionSquares)
+            return
         # calculates the moves for every piece that belongs to the current player on the board
         for rowNum, row in enumerate(self._board.getGrid()):
             for colNum, piece in enumerate(row):
@@ -463,106 +1648,86 @@ class GameController:
                     elif piece.getType() == "k":
                         self._moves += self.calculateKingMoves(rowNum, colNum)
 
+    def verifyMoves(self):
+        """Used in debug mode to make sure the incremental moves match the moves calculated from scratch."""
+        incrementalMoves = self._moves
+        promotionSquares = self._promotionSquares
+        self._moves = []
+        self._promotionSquares = []
+        self.calculateAllMoves()
+        fullMoves = self._moves
+        self._moves = incrementalMoves
+        self._promotionSquares = promotionSquares
+        assert sorted((move.getMoveID(), move.getFlags()) for move in incrementalMoves) == \
+            sorted((move.getMoveID(), move.getFlags()) for move in fullMoves), \
+            f"Incremental moves are out of sync:\n{self._board}"
+
+    def getMoveGeneratorStats(self):
+        """Returns the counters of the incremental move generator, or None when the moves are calculated in full."""
+        if self._moveGenerator is None:
+            return None
+        return self._moveGenerator.getStats()
+
     def calculateSpecialMoves(self):
         """Calculates special moves that the current player can make"""
-        # En Passant
-        if self._enPassantSquare != ():
-            if self._enPassantSquare[2] == self._activeColor:
-                self._enPassantSquare = ()
-            else:
-                # for columns 2-8 check the left square
-                if self._enPassantSquare[1] > 0:
-                    leftPiece = self._board.getGrid()[self._enPassantSquare[0]][self._enPassantSquare[1] - 1]
-                    leftPiece: Piece
-                    # add the en passant move if it is valid.
-                    if leftPiece is not None and leftPiece.getColor() is self._activeColor and leftPiece.getType() == "p":
-                        if self._activeColor:
-                            self._moves.append(EnPassantMove(self._enPassantSquare[0], self._enPassantSquare[1] - 1,
-                                                             self._enPassantSquare[0] - 1, self._enPassantSquare[1],
-                                                             self._enPassantSquare[0], self._enPassantSquare[1], "p"))
-                        else:
-                            self._moves.append(EnPassantMove(self._enPassantSquare[0], self._enPassantSquare[1] - 1,
-                                                             self._enPassantSquare[0] + 1, self._enPassantSquare[1],
-                                                             self._enPassantSquare[0], self._enPassantSquare[1], "p"
-                                                             ))
-                # for columns 1-7 check the right square
-                if self._enPassantSquare[1] < 7:
-                    rightPiece = self._board.getGrid()[self._enPassantSquare[0]][self._enPassantSquare[1] + 1]
-                    rightPiece: Piece
-                    if rightPiece is not None and rightPiece.getColor() is self._activeColor and rightPiece.getType() == "p":
-                        if self._activeColor:
-                            self._moves.append(EnPassantMove(self._enPassantSquare[0], self._enPassantSquare[1] + 1,
-                                                             self._enPassantSquare[0] - 1, self._enPassantSquare[1],
-                                                             self._enPassantSquare[0], self._enPassantSquare[1], "p"))
-                        else:
-                            self._moves.append(EnPassantMove(self._enPassantSquare[0], self._enPassantSquare[1] + 1,
-                                                             self._enPassantSquare[0] + 1, self._enPassantSquare[1],
-                                                             self._enPassantSquare[0], self._enPassantSquare[1], "p"))
-        # Castling
+        self._moveIndex = None
+        self._moves += self.calculateEnPassantMoves()
+        castleMoves = self.calculateCastleMoves()
+        canCastleThisTurn = self._whiteCanCastleThisTurn if self._activeColor else self._blackCanCastleThisTurn
+        for move in castleMoves:
+            # index 0 is the king side and index 1 is the queen side
+            canCastleThisTurn[move.getTargetCol() == 2] = True
+        self._moves += castleMoves
+
+    def calculateEnPassantMoves(self):
+        """En Passant, which can only be done right after the other player moved a pawn two squares"""
+        moves = []
+        if self._enPassantSquare == () or self._enPassantSquare[2] == self._activeColor:
+            return moves
+        enemyRow, enemyCol = self._enPassantSquare[0], self._enPassantSquare[1]
+        # the capturing pawn moves forward onto the square behind the enemy pawn
+        targetRow = enemyRow - 1 if self._activeColor else enemyRow + 1
+        # for columns 2-8 check the left square, for columns 1-7 check the right square
+        for col in (enemyCol - 1, enemyCol + 1):
+            if 0 <= col < 8:
+                piece = self._board.getPiece(enemyRow, col)
+                piece: Piece
+                # add the en passant move if it is valid.
+                if piece is not None and piece.getColor() is self._activeColor and piece.getType() == "p":
+                    moves.append(EnPassantMove(enemyRow, col, targetRow, enemyCol, enemyRow, enemyCol, "p"))
+        return moves
+
+    def calculateCastleMoves(self):
+        """Castling, the moves are only given when the king and the squares it moves through are safe"""
+        moves = []
         if self._activeColor:
-            kingInCheck = [
-                Move(self._whiteKingPos[0], self._whiteKingPos[1], self._whiteKingPos[0], self._whiteKingPos[1], "k")]
-            self.calculateValidMoves(kingInCheck)
-            if len(kingInCheck) == 1:
-                if self._whiteCastleAvailability[0]:
-                    # white king side castle
-                    kingSubMoves = []
-                    # check if the squares the king has to move through are attacked
-                    for i in range(1, 3):
-                        if self._board.getGrid()[self._whiteKingPos[0]][self._whiteKingPos[1] + i] is None:
-                            kingSubMoves.append(
-                                Move(self._whiteKingPos[0], self._whiteKingPos[1], self._whiteKingPos[0],
-                                     self._whiteKingPos[1] + i, "k"))
-                        else:
-                            break
-                    self.calculateValidMoves(kingSubMoves)
-                    # if they are all valid then make the castling move valid.
-                    if len(kingSubMoves) == 2:
-                        self._whiteCanCastleThisTurn[0] = True
-                if self._whiteCastleAvailability[1]:
-                    # white queen side castle
-                    kingSubMoves = []
-                    for i in range(-1, -4, -1):
-                        if self._board.getGrid()[self._whiteKingPos[0]][self._whiteKingPos[1] + i] is None:
-                            kingSubMoves.append(
-                                Move(self._whiteKingPos[0], self._whiteKingPos[1], self._whiteKingPos[0],
-                                     self._whiteKingPos[1] + i, "k"))
-                        else:
-                            break
-                    self.calculateValidMoves(kingSubMoves)
-                    if len(kingSubMoves) == 3:
-                        self._whiteCanCastleThisTurn[1] = True
+            kingPos = self._whiteKingPos
+            castleAvailability = self._whiteCastleAvailability
         else:
-            kingInCheck = [
-                Move(self._blackKingPos[0], self._blackKingPos[1], self._blackKingPos[0], self._blackKingPos[1], "k")]
-            self.calculateValidMoves(kingInCheck)
-            if len(kingInCheck) == 1:
-                if self._blackCastleAvailability[0]:
-                    # black king side castle
-                    kingSubMoves = []
-                    for i in range(1, 3):
-                        if self._board.getGrid()[self._blackKingPos[0]][self._blackKingPos[1] + i] is None:
-                            kingSubMoves.append(
-                                Move(self._blackKingPos[0], self._blackKingPos[1], self._blackKingPos[0],
-                                     self._blackKingPos[1] + i, "k"))
-                        else:
-                            break
-                    self.calculateValidMoves(kingSubMoves)
-                    if len(kingSubMoves) == 2:
-                        self._blackCanCastleThisTurn[0] = True
-                if self._blackCastleAvailability[1]:
-                    # black queen side castle
-                    kingSubMoves = []
-                    for i in range(-1, -4, -1):
-                        if self._board.getGrid()[self._blackKingPos[0]][self._blackKingPos[1] + i] is None:
-                            kingSubMoves.append(
-                                Move(self._blackKingPos[0], self._blackKingPos[1], self._blackKingPos[0],
-                                     self._blackKingPos[1] + i, "k"))
-                        else:
-                            break
-                    self.calculateValidMoves(kingSubMoves)
-                    if len(kingSubMoves) == 3:
-                        self._blackCanCastleThisTurn[1] = True
+            kingPos = self._blackKingPos
+            castleAvailability = self._blackCastleAvailability
+        if not castleAvailability[0] and not castleAvailability[1]:
+            return moves
+        # the king cannot castle out of check
+        if not self.isSquareAttacked(kingPos, not self._activeColor):
+            # king side castle, the squares the king has to move through must be empty and not attacked
+            if castleAvailability[0] and self.isCastlingPathSafe(kingPos, (1, 2)):
+                moves.append(CastleMove(kingPos[0], kingPos[1], kingPos[0], kingPos[1] + 2, 7, 5))
+            # queen side castle, the square next to the rook only has to be empty since the king doesn't cross it
+            if castleAvailability[1] and self._board.getPiece(kingPos[0], kingPos[1] - 3) is None and \
+                    self.isCastlingPathSafe(kingPos, (-1, -2)):
+                moves.append(CastleMove(kingPos[0], kingPos[1], kingPos[0], kingPos[1] - 2, 0, 3))
+        return moves
+
+    def isCastlingPathSafe(self, kingPos, colOffsets):
+        """Checks that every square next to the king at the column offsets is empty and not attacked."""
+        for colOffset in colOffsets:
+            square = (kingPos[0], kingPos[1] + colOffset)
+            if self._board.getPiece(square[0], square[1]) is not None:
+                return False
+            if self.isSquareAttacked(square, not self._activeColor):
+                return False
+        return True
 
     def calculateValidMoves(self, moveList=None):
         """Filters out any invalid moves that exists in the current moves list."""
@@ -570,51 +1735,174 @@ class GameController:
             moves = self._moves
         else:
             moves = moveList
+        if self._activeColor:
+            kingPos = self._whiteKingPos
+        else:
+            kingPos = self._blackKingPos
+        self.calculatePinsAndChecks()
+        validMoves = []
+        pinnedPieces = self._pinnedPieces
         move: Move
-        # loops through each of the moves, makes the move, and then checks to see if your king can be captured.
-        for move in list(moves):
-            self._tempEnPassantSquare = self._enPassantSquare
-            self._tempBlackKingPos = self._blackKingPos
-            self._tempWhiteKingPos = self._whiteKingPos
-            tempBoard = copy.deepcopy(self._board)
-            self.makeMove(move, tempBoard)
-            if self.calculateEnemyMoves(tempBoard):
-                moves.remove(move)
-
-    def calculateEnemyMoves(self, tempBoard):
-        """
-        Checks if your king can be captured under the current board circumstances.
-        A custom board can be provided, and is used to check valid moves.
-        It is similar to the calculate moves function but does it for the enemy.
-        """
-        for rowNum, row in enumerate(tempBoard.getGrid()):
+        for move in moves:
+            # most moves are made by a piece that isn't the king and isn't pinned, which are always legal
+            # when the king isn't in check, so they are let through without the call to isLegalMove
+            if not self._kingInCheck and move.getPieceType() != "k" and not move.getFlags() & MOVE_FLAG_EN_PASSANT \
+                    and (move.getOriginRow(), move.getOriginCol()) not in pinnedPieces:
+                validMoves.append(move)
+            elif self.isLegalMove(move, kingPos, self._kingInCheck, pinnedPieces, self._checkMask):
+                validMoves.append(move)
+        # the list is changed in place since the callers use the list they passed in
+        moves[:] = validMoves
+        if moveList is None:
+            self._moveIndex = None
+
+    def calculateLegalMoves(self):
+        """
+        Calculates the legal moves of the player to move, the same three steps a game goes through every turn,
+        and returns them. They are also what getMoves returns afterwards.
+        """
+        self.calculateMoves()
+        self.calculateSpecialMoves()
+        self.calculateValidMoves()
+        return self._moves
+
+    def iterLegalMoves(self, quietMoves=True):
+        """
+        Generates the legal moves of the current player one at a time in stages: captures and promotions first,
+        then en passant, then the quiet moves and castling last, which are left out when quietMoves is False.
+        Nothing is calculated until a move is asked for, so a caller that stops early doesn't pay for the rest.
+        Moves can be made with the moves that are given, as long as they are taken back before the next one.
+        """
+        self.calculatePinsAndChecks()
+        # the pins and checks are kept here, since the moves made by the caller can calculate them again
+        kingInCheck = self._kingInCheck
+        pinnedPieces = self._pinnedPieces
+        checkMask = self._checkMask
+        kingPos = self._whiteKingPos if self._activeColor else self._blackKingPos
+        for move in self.iterPseudoMoves(True):
+            if self.isLegalMove(move, kingPos, kingInCheck, pinnedPieces, checkMask):
+                yield move
+        for move in self.calculateEnPassantMoves():
+            if self.isLegalMove(move, kingPos, kingInCheck, pinnedPieces, checkMask):
+                yield move
+        if not quietMoves:
+            return
+        for move in self.iterPseudoMoves(False):
+            if self.isLegalMove(move, kingPos, kingInCheck, pinnedPieces, checkMask):
+                yield move
+        for move in self.calculateCastleMoves():
+            if self.isLegalMove(move, kingPos, kingInCheck, pinnedPieces, checkMask):
+                yield move
+
+    def hasLegalMove(self):
+        """
+        Checks if the current player has any legal move, stopping at the first one that is found.
+        This is all that is needed to tell if the game has ended in checkmate or stalemate.
+        """
+        for _ in self.iterLegalMoves():
+            return True
+        return False
+
+    def iterPseudoMoves(self, tactical):
+        """
+        Generates the pseudo legal moves of the current player that are captures or promotions when tactical
+        is True, or the rest of them when it is False, without the special moves.
+        """
+        color = self._activeColor
+        if self._useBitboards:
+            board: BitboardBoard = self._board
+            enemy = board.getOccupancy(not color)
+            empty = ~(enemy | board.getOccupancy(color)) & FULL_BOARD
+            promotionRow = 0xFF if color else 0xFF << 56
+            if tactical:
+                yield from board.iterMoves(color, enemy, promotionRow, [])
+            else:
+                yield from board.iterMoves(color, empty, ~promotionRow & FULL_BOARD, [])
+            return
+        pieceMoveFunctions = {"r": self.calculateRookMoves, "b": self.calculateBishopMoves,
+                              "n": self.calculateKnightMoves, "q": self.calculateQueenMoves,
+                              "k": self.calculateKingMoves}
+        for rowNum, row in enumerate(self._board.getGrid()):
             for colNum, piece in enumerate(row):
                 piece: Piece
-                if piece is not None and piece.getColor() is not self._activeColor:
-                    self._activeColor = not self._activeColor
-                    enemyMoves = []
-                    if piece.getType() == "p":
-                        enemyMoves = self.calculatePawnMoves(rowNum, colNum, tempBoard)
-                    elif piece.getType() == "r":
-                        enemyMoves = self.calculateRookMoves(rowNum, colNum, tempBoard)
-                    elif piece.getType() == "b":
-                        enemyMoves = self.calculateBishopMoves(rowNum, colNum, tempBoard)
-                    elif piece.getType() == "n":
-                        enemyMoves = self.calculateKnightMoves(rowNum, colNum, tempBoard)
-                    elif piece.getType() == "q":
-                        enemyMoves = self.calculateQueenMoves(rowNum, colNum, tempBoard)
-                    elif piece.getType() == "k":
-                        enemyMoves = self.calculateKingMoves(rowNum, colNum, tempBoard)
-                    self._activeColor = not self._activeColor
-                    enemyMove: Move
-                    for enemyMove in enemyMoves:
-                        # if the king can be captured, return True.
-                        if self._activeColor:
-                            if (enemyMove.getTargetRow(), enemyMove.getTargetCol()) == self._tempWhiteKingPos:
-                                return True
-                        else:
-                            if (enemyMove.getTargetRow(), enemyMove.getTargetCol()) == self._tempBlackKingPos:
-                                return True
+                if piece is None or piece.getColor() is not color:
+                    continue
+                if piece.getType() == "p":
+                    pieceMoves = self.calculatePawnMoves(rowNum, colNum, customPromoList=[])
+                else:
+                    pieceMoves = pieceMoveFunctions[piece.getType()](rowNum, colNum)
+                for move in pieceMoves:
+                    if bool(move.getFlags() & (MOVE_FLAG_CAPTURE | MOVE_FLAG_PROMOTION)) == tactical:
+                        yield move
+
+    def isLegalMove(self, move, kingPos, kingInCheck, pinnedPieces, checkMask=FULL_BOARD):
+        """
+        Checks that the pseudo legal move doesn't leave the current player's king in check,
+        using the pins and checks of the position from calculatePinsAndChecks.
+        """
+        if self._useBitboards:
+            return self.isLegalBitboardMove(move, kingPos, pinnedPieces, checkMask)
+        # when the king isn't in check, a move that isn't made by the king or a pinned piece can never
+        # leave the king in check. En passant is the exception since it removes a second piece from the board.
+        if not kingInCheck and move.getPieceType() != "k" and not move.getFlags() & MOVE_FLAG_EN_PASSANT:
+            pinDirection = pinnedPieces.get((move.getOriginRow(), move.getOriginCol()))
+            # a pinned piece can still move along the line between the king and the pinning piece
+            return pinDirection is None or (move.getTargetRow() - kingPos[0]) * pinDirection[1] == \
+                (move.getTargetCol() - kingPos[1]) * pinDirection[0]
+        return self.isLegalAfterMaking(move)
+
+    def isLegalBitboardMove(self, move, kingPos, pinnedPieces, checkMask):
+        """
+        Checks the pseudo legal move with the check mask and the pin masks of the bitboard board, so only
+        en passant has to be made and taken back.
+        """
+        flags = move.getFlags()
+        target = move.getTargetRow() * 8 + move.getTargetCol()
+        if move.getPieceType() == "k":
+            # calculateCastleMoves already checked every square the king goes through
+            return bool(flags & MOVE_FLAG_CASTLE) or \
+                self._board.isKingMoveSafe(kingPos[0] * 8 + kingPos[1], target, self._activeColor)
+        if flags & MOVE_FLAG_EN_PASSANT:
+            # the captured pawn leaves a square that isn't the target, which can open a line to the king
+            return self.isLegalAfterMaking(move)
+        targetBit = 1 << target
+        if not checkMask & targetBit:
+            return False
+        pinMask = pinnedPieces.get((move.getOriginRow(), move.getOriginCol()))
+        return pinMask is None or bool(pinMask & targetBit)
+
+    def isLegalAfterMaking(self, move):
+        # the move is made, checked to see if your king can be captured,
+        # and then taken back so the board is left as it was.
+        self.makeMove(move)
+        if self._activeColor:
+            movedKingPos = self._whiteKingPos
+        else:
+            movedKingPos = self._blackKingPos
+        legal = not self.isSquareAttacked(movedKingPos, not self._activeColor)
+        self.unmakeMove()
+        return legal
+
+    def calculatePinsAndChecks(self):
+        """
+        Works out once per position if the current player's king is in check, and which
+        of the current player's pieces are pinned to the king and in which direction.
+        """
+        if self._activeColor:
+            kingPos = self._whiteKingPos
+        else:
+            kingPos = self._blackKingPos
+        if self._useBitboards:
+            # the pinned pieces are given the squares they can move to instead of the direction of the pin
+            self._kingInCheck, self._checkMask, self._pinnedPieces = \
+                self._board.calculateChecksAndPins(kingPos[0], kingPos[1], self._activeColor)
+            return
+        self._kingInCheck = self.isSquareAttacked(kingPos, not self._activeColor)
+        self._pinnedPieces = self._board.calculatePins(kingPos[0], kingPos[1], self._activeColor)
+
+    def isSquareAttacked(self, square, byColor):
+        """Checks if any piece of the given color attacks the square, given as a (row, col) tuple."""
+        return self._board.isSquareAttacked(square[0], square[1], byColor)
 
     def inCheck(self):
         """
@@ -625,14 +1913,7 @@ class GameController:
             kingPos = self._whiteKingPos
         else:
             kingPos = self._blackKingPos
-        self._activeColor = not self._activeColor
-        self.calculateMoves()
-        self._activeColor = not self._activeColor
-        move: Move
-        for move in self._moves:
-            if move.getTargetRow() == kingPos[0] and move.getTargetCol() == kingPos[1]:
-                return True
-        return False
+        return self.isSquareAttacked(kingPos, not self._activeColor)
 
     # These are the move calculations for each of the different types of pieces.
     # Custom boards can be used in each one in order to check for valid moves.
@@ -649,9 +1930,10 @@ class GameController:
             board = customBoard
         if self._activeColor:
             # white pawn
+            promotionFlag = MOVE_FLAG_PROMOTION if row == 1 else 0
             if board.getGrid()[row - 1][col] is None:
                 # normal move
-                moves.append(Move(row, col, row - 1, col, "p"))
+                moves.append(Move(row, col, row - 1, col, "p", promotionFlag))
                 if row == 1:
                     promotionSquareList.append((row - 1, col))
                 if row == 6 and board.getGrid()[row - 2][col] is None:
@@ -662,7 +1944,7 @@ class GameController:
                 enemyPiece = board.getGrid()[row - 1][col + 1]
                 enemyPiece: Piece
                 if enemyPiece is not None and enemyPiece.getColor() is not self._activeColor:
-                    moves.append(Move(row, col, row - 1, col + 1, "p"))
+                    moves.append(Move(row, col, row - 1, col + 1, "p", MOVE_FLAG_CAPTURE | promotionFlag))
                     if row == 1:
                         promotionSquareList.append((row - 1, col + 1))
             if col > 0:
@@ -670,14 +1952,15 @@ class GameController:
                 enemyPiece = board.getGrid()[row - 1][col - 1]
                 enemyPiece: Piece
                 if enemyPiece is not None and enemyPiece.getColor() is not self._activeColor:
-                    moves.append(Move(row, col, row - 1, col - 1, "p"))
+                    moves.append(Move(row, col, row - 1, col - 1, "p", MOVE_FLAG_CAPTURE | promotionFlag))
                     if row == 1:
                         promotionSquareList.append((row - 1, col - 1))
         else:
             # black pawn
+            promotionFlag = MOVE_FLAG_PROMOTION if row == 6 else 0
             if board.getGrid()[row + 1][col] is None:
                 # normal movement
-                moves.append(Move(row, col, row + 1, col, "p"))
+                moves.append(Move(row, col, row + 1, col, "p", promotionFlag))
                 if row == 6:
                     promotionSquareList.append((row + 1, col))
                 if row == 1 and board.getGrid()[row + 2][col] is None:
@@ -688,7 +1971,7 @@ class GameController:
                 enemyPiece = board.getGrid()[row + 1][col + 1]
                 enemyPiece: Piece
                 if enemyPiece is not None and enemyPiece.getColor() is not self._activeColor:
-                    moves.append(Move(row, col, row + 1, col + 1, "p"))
+                    moves.append(Move(row, col, row + 1, col + 1, "p", MOVE_FLAG_CAPTURE | promotionFlag))
                     if row == 6:
                         promotionSquareList.append((row + 1, col + 1))
             if col > 0:
@@ -696,7 +1979,7 @@ class GameController:
                 enemyPiece = board.getGrid()[row + 1][col - 1]
                 enemyPiece: Piece
                 if enemyPiece is not None and enemyPiece.getColor() is not self._activeColor:
-                    moves.append(Move(row, col, row + 1, col - 1, "p"))
+                    moves.append(Move(row, col, row + 1, col - 1, "p", MOVE_FLAG_CAPTURE | promotionFlag))
                     if row == 6:
                         promotionSquareList.append((row + 1, col - 1))
         return moves
@@ -727,7 +2010,7 @@ class GameController:
                 else:
                     targetPiece: Piece
                     if targetPiece.getColor() != self._activeColor:
-                        moves.append(Move(row, col, targetRow, targetCol, "n"))
+                        moves.append(Move(row, col, targetRow, targetCol, "n", MOVE_FLAG_CAPTURE))
         return moves
 
     def calculateBishopMoves(self, row, col, customBoard=None):
@@ -757,7 +2040,7 @@ class GameController:
                     else:
                         targetPiece: Piece
                         if targetPiece.getColor() != self._activeColor:
-                            moves.append(Move(row, col, targetRow, targetCol, pieceType))
+                            moves.append(Move(row, col, targetRow, targetCol, pieceType, MOVE_FLAG_CAPTURE))
                         break
                 else:
                     break
@@ -781,5 +2064,5 @@ class GameController:
                 else:
                     targetPiece: Piece
                     if targetPiece.getColor() != self._activeColor:
-                        moves.append(Move(row, col, targetRow, targetCol, "k"))
+                        moves.append(Move(row, col, targetRow, targetCol, "k", MOVE_FLAG_CAPTURE))
         return moves
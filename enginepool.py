@@ -0,0 +1,188 @@
+import asyncio
+import collections
+import concurrent.futures
+import time
+
+import batch
+import book
+import engine
+import search
+import transposition
+
+# the memory budget of the transposition table that each worker process keeps for all of its searches
+WORKER_TABLE_MEGABYTES = 16
+
+# The transposition table of this worker process, made by the first search that runs in it
+_workerTable = None
+# The opening books that this worker process has opened, by their path
+_workerBooks = {}
+
+
+def calculateOutcome(controller: engine.GameController):
+    """
+    Works out if the game is over for the player to move, giving "checkmate", "stalemate",
+    the reason for any other kind of draw, or None when the game goes on.
+    """
+    if not controller.hasLegalMove():
+        if controller.inCheck():
+            return "checkmate"
+        return "stalemate"
+    return controller.getDrawReason()
+
+
+def playMove(state, moveString):
+    """
+    Makes the move on the game state and works out if the game is over, this runs in a worker process.
+    Returns the new state, the move that was made and the outcome, or the move error if the move can't be made.
+    """
+    controller = engine.GameController.fromState(state, engine.BitboardBoard)
+    controller.calculateLegalMoves()
+    try:
+        lastMove = controller.processMove(moveString)
+    except engine.MoveErrors as error:
+        return None, None, None, error
+    controller.setActiveColor(not controller.getActiveColor())
+    return controller.getState(), lastMove, calculateOutcome(controller), None
+
+
+def searchPosition(state, maxDepth, timeLimit, bookPath=None):
+    """
+    Searches the game state for the best move of the player to move, this runs in a worker process.
+    Returns the move string along with the score, the depth that was finished and the number of nodes.
+    When the position is in the opening book, a book move is played right away without searching,
+    with a score, depth and number of nodes of 0.
+    """
+    global _workerTable
+    if _workerTable is None:
+        _workerTable = transposition.TranspositionTable(WORKER_TABLE_MEGABYTES)
+    controller = engine.GameController.fromState(state, engine.BitboardBoard)
+    if bookPath is not None:
+        if bookPath not in _workerBooks:
+            _workerBooks[bookPath] = book.OpeningBook(bookPath)
+        bookMove = _workerBooks[bookPath].chooseMove(controller)
+        if bookMove is not None:
+            return bookMove, 0, 0, 0
+    result = search.Searcher(controller, maxDepth, timeLimit, _workerTable).search()
+    return result.getMoveString(), result.score, result.depth, result.nodes
+
+
+class EnginePool:
+    """
+    Runs the engine work of every game in a pool of worker processes, so the event loop only waits for
+    the results and keeps running the timers and commands of the other games in the meantime.
+    Games are sent to the workers as the compact state from GameController.getState, never as boards.
+    """
+
+    def __init__(self, workers=None, bookPath=None):
+        # None uses one worker for every processor
+        self._executor = concurrent.futures.ProcessPoolExecutor(workers)
+        # the opening book that the searches play from before searching, if there is one
+        self._bookPath = bookPath
+
+    async def playMove(self, state, moveString):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, playMove, state, moveString)
+
+    async def searchPosition(self, state, maxDepth, timeLimit):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, searchPosition, state, maxDepth,
+                                                                timeLimit, self._bookPath)
+
+    async def analyzeBatch(self, positions: batch.PositionBatch) -> batch.BatchResult:
+        """Calculates the legal moves and outcomes of the positions of many games in one worker at once."""
+        packedResult = await asyncio.get_running_loop().run_in_executor(self._executor, batch.analyzePackedBatch,
+                                                                        *positions.toBytes())
+        return batch.BatchResult.fromBytes(*packedResult)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+class LagMonitor:
+    """
+    Measures the event loop lag, which is how much later than asked the loop wakes up a task that sleeps
+    for a fixed interval. The lag is how long the loop was kept busy by something that didn't await.
+    """
+
+    def __init__(self, interval=0.1, sampleCount=600):
+        self._interval = interval
+        # the lag of the most recent wakeups in seconds
+        self._lags = collections.deque(maxlen=sampleCount)
+        self._maxLag = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self._interval)
+            lag = max(loop.time() - start - self._interval, 0.0)
+            self._lags.append(lag)
+            if lag > self._maxLag:
+                self._maxLag = lag
+
+    def getStats(self):
+        """Returns the last, average, 99th percentile and highest lag in milliseconds."""
+        if len(self._lags) == 0:
+            return {"last": 0.0, "average": 0.0, "p99": 0.0, "max": 0.0, "samples": 0}
+        lags = sorted(self._lags)
+        return {
+            "last": self._lags[-1] * 1000,
+            "average": sum(lags) / len(lags) * 1000,
+            "p99": lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000,
+            "max": self._maxLag * 1000,
+            "samples": len(lags),
+        }
+
+
+async def simulateLoad(gameCount, searchDepth, useWorkers):
+    """
+    Plays the computer against itself in several games at once while measuring the event loop lag,
+    either through the worker processes or straight on the event loop like before.
+    """
+    monitor = LagMonitor(0.01)
+    monitor.start()
+    pool = EnginePool() if useWorkers else None
+
+    async def playGame():
+        state = engine.GameController(engine.BitboardBoard).getState()
+        for _ in range(6):
+            if pool is not None:
+                moveString = (await pool.searchPosition(state, searchDepth, 1.0))[0]
+                state, _, outcome, _ = await pool.playMove(state, moveString)
+            else:
+                moveString = searchPosition(state, searchDepth, 1.0)[0]
+                state, _, outcome, _ = playMove(state, moveString)
+                # a handler without workers still gives other tasks a turn between moves
+                await asyncio.sleep(0)
+            if outcome is not None:
+                break
+
+    start = time.perf_counter()
+    await asyncio.gather(*(playGame() for _ in range(gameCount)))
+    seconds = time.perf_counter() - start
+    monitor.stop()
+    if pool is not None:
+        pool.shutdown()
+    return seconds, monitor.getStats()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measures the event loop lag while several games are searched.")
+    parser.add_argument("--games", type=int, default=4)
+    parser.add_argument("--depth", type=int, default=3)
+    args = parser.parse_args()
+    for workersUsed in (False, True):
+        totalSeconds, lagStats = asyncio.run(simulateLoad(args.games, args.depth, workersUsed))
+        print(f"{'Worker processes' if workersUsed else 'Event loop     '}: {totalSeconds:.2f}s, "
+              f"lag average {lagStats['average']:.1f}ms, p99 {lagStats['p99']:.1f}ms, "
+              f"max {lagStats['max']:.1f}ms over {lagStats['samples']} samples")
@@ -0,0 +1,180 @@
+import argparse
+import time
+
+import engine
+
+# The standard perft positions with their known leaf node counts for depth 1, 2, 3...
+# Kiwipete and the other positions test castling, en passant, promotion and discovered checks.
+POSITIONS = [
+    ("start", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", [20, 400, 8902, 197281]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862]),
+    ("endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238]),
+    ("promotion", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467]),
+    ("discovered", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379]),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P3/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [47, 1845, 81467]),
+]
+
+# Fenstrings that must be rejected when they are loaded
+INVALID_FENS = [
+    ("en passant rank", "rnbqkbnr/pppp1ppp/8/4p3/8/8/PPPPPPPP/RNBQKBNR w KQkq e3 0 2"),
+    ("en passant square", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq i3 0 1"),
+    ("en passant pawn", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR b KQkq e3 0 1"),
+    ("split digits", "rnbqkbnr/pppppppp/71/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"),
+    ("digit sum", "rnbqkbnr/pppppppp/44/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"),
+    ("nine squares", "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"),
+    ("long row", "rnbqkbnrp/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"),
+    ("pawn on rank 8", "Pk5K/8/8/8/8/8/8/8 w - - 0 1"),
+    ("pawn on rank 1", "k6K/8/8/8/8/8/8/p7 w - - 0 1"),
+    ("halfmove clock", "4k3/8/8/8/8/8/8/4K3 w - - -1 1"),
+    ("fullmove number", "4k3/8/8/8/8/8/8/4K3 w - - 0 0"),
+    ("adjacent kings", "8/8/8/3kK3/8/8/8/8 w - - 0 1"),
+    ("check not moving", "4k3/8/8/8/8/8/8/4R1K1 w - - 0 1"),
+]
+# Fenstrings that load with the castling rights that are left once the impossible ones are dropped
+CASTLING_FENS = [
+    ("no rooks", "4k3/8/8/8/8/8/8/4K3 w K - 0 1", "4k3/8/8/8/8/8/8/4K3 w - - 0 1"),
+    ("moved king", "r3k2r/8/8/8/8/8/8/R5K1 w KQkq - 0 1", "r3k2r/8/8/8/8/8/8/R5K1 w kq - 0 1"),
+]
+
+PROMOTION_TYPES = "qrbn"
+
+
+def legalMoves(controller: engine.GameController):
+    """
+    Calculates every legal move of the current player as (move, promotion type) pairs,
+    a pawn move onto the last row counts once for every piece it can be promoted to.
+    """
+    controller.calculateMoves()
+    controller.calculateSpecialMoves()
+    controller.calculateValidMoves()
+    moves = []
+    move: engine.Move
+    for move in controller.getMoves():
+        if move.getFlags() & engine.MOVE_FLAG_PROMOTION:
+            for promotionType in PROMOTION_TYPES:
+                moves.append((move, promotionType))
+        else:
+            moves.append((move, None))
+    return moves
+
+
+def makeMove(controller: engine.GameController, move, promotionType):
+    controller.setPromotionType(promotionType)
+    controller.makeMove(move)
+    controller.setPromotionType(None)
+    controller.setActiveColor(not controller.getActiveColor())
+
+
+def unmakeMove(controller: engine.GameController):
+    controller.setActiveColor(not controller.getActiveColor())
+    controller.unmakeMove()
+
+
+def perft(controller: engine.GameController, depth: int) -> int:
+    """Counts the leaf nodes of the move tree from the current position down to the given depth."""
+    moves = legalMoves(controller)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move, promotionType in moves:
+        makeMove(controller, move, promotionType)
+        nodes += perft(controller, depth - 1)
+        unmakeMove(controller)
+    return nodes
+
+
+def divide(controller: engine.GameController, depth: int) -> dict:
+    """Breaks the perft count down into the count below every root move."""
+    counts = {}
+    for move, promotionType in legalMoves(controller):
+        if depth == 1:
+            nodes = 1
+        else:
+            makeMove(controller, move, promotionType)
+            nodes = perft(controller, depth - 1)
+            unmakeMove(controller)
+        counts[f"{move}{promotionType or ''}"] = nodes
+    return counts
+
+
+def runSuite(maxDepth: int, boardType, names=None, debug=False, incremental=False):
+    """Runs perft on the standard positions, checking every count and reporting the speed."""
+    failures = 0
+    totalNodes = 0
+    totalTime = 0.0
+    for name, fenString, expectedCounts in POSITIONS:
+        if names and name not in names:
+            continue
+        for depth, expected in enumerate(expectedCounts[:maxDepth], start=1):
+            controller = engine.GameController.fromFen(fenString, boardType, debug, incremental)
+            start = time.perf_counter()
+            nodes = perft(controller, depth)
+            elapsed = time.perf_counter() - start
+            totalNodes += nodes
+            totalTime += elapsed
+            status = "ok" if nodes == expected else f"FAILED (expected {expected})"
+            if nodes != expected:
+                failures += 1
+            print(f"{name:<12} depth {depth}: {nodes:>8} nodes {elapsed:8.3f}s "
+                  f"{nodes / max(elapsed, 1e-9):>9.0f} nps  {status}")
+    print(f"Total: {totalNodes} nodes in {totalTime:.3f}s ({totalNodes / max(totalTime, 1e-9):.0f} nps), "
+          f"{failures} failed")
+    return failures
+
+
+def checkFens(boardType) -> int:
+    """Checks that invalid fenstrings are rejected and impossible castling rights are dropped."""
+    failures = 0
+    for name, fenString in INVALID_FENS:
+        try:
+            engine.GameController.fromFen(fenString, boardType)
+            status = "FAILED (loaded)"
+            failures += 1
+        except engine.InvalidFenError:
+            status = "ok"
+        print(f"{name:<18} rejected  {status}")
+    for name, fenString, expected in CASTLING_FENS:
+        loaded = engine.GameController.fromFen(fenString, boardType).toFen()
+        status = "ok" if loaded == expected else f"FAILED (loaded {loaded})"
+        if loaded != expected:
+            failures += 1
+        print(f"{name:<18} castling  {status}")
+    print(f"Fenstrings: {failures} failed")
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Counts and checks the move tree of the chess engine.")
+    parser.add_argument("--depth", type=int, default=3, help="the deepest depth to search to")
+    parser.add_argument("--board", choices=["grid", "bitboard"], default="bitboard")
+    parser.add_argument("--position", action="append",
+                        help="the name of a standard position to run, can be repeated (default: all)")
+    parser.add_argument("--fen", help="run on a custom position instead of the standard ones")
+    parser.add_argument("--divide", action="store_true", help="show the node count below every root move")
+    parser.add_argument("--debug", action="store_true",
+                        help="check the incremental position hash and moves against a full recalculation every time")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only calculate the moves of the pieces affected by the last moves again")
+    args = parser.parse_args()
+    selectedBoard = engine.BitboardBoard if args.board == "bitboard" else engine.Board
+
+    if args.fen is not None or args.divide:
+        if args.fen is not None:
+            fen = args.fen
+        else:
+            fen = dict((name, fen) for name, fen, _ in POSITIONS)[(args.position or ["start"])[0]]
+        gameController = engine.GameController.fromFen(fen, selectedBoard, args.debug, args.incremental)
+        startTime = time.perf_counter()
+        if args.divide:
+            divideCounts = divide(gameController, args.depth)
+            for moveName, count in divideCounts.items():
+                print(f"{moveName}: {count}")
+            nodeCount = sum(divideCounts.values())
+        else:
+            nodeCount = perft(gameController, args.depth)
+        seconds = time.perf_counter() - startTime
+        print(f"Nodes: {nodeCount} in {seconds:.3f}s ({nodeCount / max(seconds, 1e-9):.0f} nps)")
+    else:
+        suiteFailures = checkFens(selectedBoard)
+        suiteFailures += runSuite(args.depth, selectedBoard, args.position, args.debug, args.incremental)
+        exit(1 if suiteFailures else 0)
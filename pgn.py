@@ -0,0 +1,330 @@
+import json
+import re
+
+import engine
+
+# A move in standard algebraic notation, once the check marks and annotations are taken off:
+# the piece letter, the file and rank the piece comes from when they are needed, the target square
+# and the promotion piece
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+# The tokens of the move text: comments, variations, numeric annotations, move numbers, results and moves
+MOVETEXT_PATTERN = re.compile(r"\{|\}|\(|\)|;|\$\d+|\d+\.+|1-0|0-1|1/2-1/2|\*|[^\s{}();]+")
+HEADER_PATTERN = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]\s*$')
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+# The tags every exported game starts with, in the order PGN asks for
+SEVEN_TAG_ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+# How long the lines of exported move text are at most
+LINE_LENGTH = 80
+
+
+class PgnGame:
+    """One game of a PGN file, its tags and its moves in standard algebraic notation."""
+
+    def __init__(self, headers, moves, result="*"):
+        self.headers = headers
+        self.moves = moves
+        self.result = result
+
+
+def makeMove(controller: engine.GameController, move: engine.Move, promotionType=None):
+    """Makes the move and gives the turn to the other player."""
+    controller.setPromotionType(promotionType)
+    controller.makeMove(move)
+    controller.setPromotionType(None)
+    controller.setActiveColor(not controller.getActiveColor())
+
+
+def unmakeMove(controller: engine.GameController):
+    controller.setActiveColor(not controller.getActiveColor())
+    controller.unmakeMove()
+
+
+def moveToSan(controller: engine.GameController, move: engine.Move, promotionType=None):
+    """
+    Writes a legal move of the controller's position in standard algebraic notation.
+    The legal moves must have been calculated, and the move is made and taken back to see if it gives check.
+    """
+    if move.getFlags() & engine.MOVE_FLAG_CASTLE:
+        san = "O-O" if move.getTargetCol() == 6 else "O-O-O"
+    else:
+        pieceType = move.getPieceType()
+        target = chr(move.getTargetCol() + 97) + str(8 - move.getTargetRow())
+        capture = "x" if move.getFlags() & engine.MOVE_FLAG_CAPTURE else ""
+        if pieceType == "p":
+            # pawn captures always give the file the pawn came from
+            san = (chr(move.getOriginCol() + 97) if capture else "") + capture + target
+            if move.getFlags() & engine.MOVE_FLAG_PROMOTION:
+                san += "=" + (promotionType or "q").upper()
+        else:
+            # the other pieces of the same type that could move to the same square decide what has to be added
+            others = [other for other in controller.getMoveIndex()[0].get((pieceType, move.getTargetSquare()), ())
+                      if other.getMoveID() != move.getMoveID()]
+            origin = ""
+            if others:
+                if all(other.getOriginCol() != move.getOriginCol() for other in others):
+                    origin = chr(move.getOriginCol() + 97)
+                elif all(other.getOriginRow() != move.getOriginRow() for other in others):
+                    origin = str(8 - move.getOriginRow())
+                else:
+                    origin = chr(move.getOriginCol() + 97) + str(8 - move.getOriginRow())
+            san = pieceType.upper() + origin + capture + target
+    makeMove(controller, move, promotionType)
+    if controller.inCheck():
+        san += "+" if controller.hasLegalMove() else "#"
+    unmakeMove(controller)
+    return san
+
+
+def parseSan(controller: engine.GameController, san):
+    """
+    Finds the legal move of the controller's position that the standard algebraic notation stands for,
+    giving back the move and the promotion type. The legal moves must have been calculated.
+    """
+    san = san.rstrip("+#!?")
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        row = 7 if controller.getActiveColor() else 0
+        targetCol = 6 if san in ("O-O", "0-0") else 2
+        move = controller.getMoveIndex()[1].get(row * 512 + 4 * 64 + row * 8 + targetCol)
+        if move is None or not move.getFlags() & engine.MOVE_FLAG_CASTLE:
+            raise engine.InvalidMoveError
+        return move, None
+    match = SAN_PATTERN.match(san)
+    if match is None:
+        raise engine.InvalidMoveError
+    pieceLetter, originFile, originRank, target, promotionLetter = match.groups()
+    pieceType = pieceLetter.lower() if pieceLetter else "p"
+    targetRow, targetCol = engine.GameController.parseSquare(target)
+    candidates = [move for move in controller.getMoveIndex()[0].get((pieceType, targetRow * 8 + targetCol), ())
+                  if (originFile is None or move.getOriginCol() == ord(originFile) - 97) and
+                  (originRank is None or move.getOriginRow() == 8 - int(originRank))]
+    if len(candidates) == 0:
+        raise engine.InvalidMoveError
+    if len(candidates) > 1:
+        raise engine.AmbiguousMoveError
+    move = candidates[0]
+    if move.getFlags() & engine.MOVE_FLAG_PROMOTION:
+        if promotionLetter is None:
+            raise engine.SpecifyPromotionError
+        return move, promotionLetter.lower()
+    return move, None
+
+
+def findMove(controller: engine.GameController, moveString):
+    """
+    Finds the legal move that a move string of the match history stands for, which is the full notation
+    that processMove gives back. The legal moves must have been calculated.
+    """
+    if moveString in ("0-0", "0-0-0"):
+        return parseSan(controller, moveString)
+    originRow, originCol = engine.GameController.parseSquare(moveString[1:3])
+    targetRow, targetCol = engine.GameController.parseSquare(moveString[3:5])
+    move = controller.getMoveIndex()[1].get(originRow * 512 + originCol * 64 + targetRow * 8 + targetCol)
+    if move is None:
+        raise engine.InvalidMoveError
+    promotionType = moveString[5] if len(moveString) == 6 else None
+    if move.getFlags() & engine.MOVE_FLAG_PROMOTION and promotionType is None:
+        promotionType = "q"
+    return move, promotionType
+
+
+def moveToString(move: engine.Move, promotionType=None):
+    """Writes the move in the full notation that processMove takes and the match history keeps."""
+    if promotionType is not None and move.getFlags() & engine.MOVE_FLAG_PROMOTION:
+        return repr(move) + promotionType
+    return repr(move)
+
+
+def startController(headers):
+    """Sets up the game controller for the start of a game, which can be given by a FEN tag."""
+    if "FEN" in headers:
+        return engine.GameController.fromFen(headers["FEN"], engine.BitboardBoard)
+    return engine.GameController(engine.BitboardBoard)
+
+
+def iterGames(lines):
+    """
+    Reads the games of a PGN file one at a time from its lines, so only the game that is being read is kept
+    in memory no matter how big the file is. Comments, variations and numeric annotations are left out.
+    """
+    headers = {}
+    moves = []
+    result = "*"
+    # how deep in variations the reader is, and whether it is in a comment
+    variationDepth = 0
+    inComment = False
+    for line in lines:
+        if not inComment and variationDepth == 0:
+            if line.startswith("%"):
+                # an escaped line, which is for other programs
+                continue
+            header = HEADER_PATTERN.match(line)
+            if header is not None:
+                if moves:
+                    # a game without a result token is finished by the tags of the next game
+                    yield PgnGame(headers, moves, result)
+                    headers, moves, result = {}, [], "*"
+                headers[header.group(1)] = header.group(2).replace('\\"', '"').replace("\\\\", "\\")
+                continue
+        for token in MOVETEXT_PATTERN.findall(line):
+            if inComment:
+                inComment = token != "}"
+            elif token == "{":
+                inComment = True
+            elif token == ";":
+                # the rest of the line is a comment
+                break
+            elif token == "(":
+                variationDepth += 1
+            elif token == ")":
+                variationDepth -= 1
+            elif variationDepth > 0 or token[0] == "$" or (token[0].isdigit() and token.endswith(".")):
+                continue
+            elif token in RESULTS:
+                yield PgnGame(headers, moves, token)
+                headers, moves, result = {}, [], "*"
+            else:
+                moves.append(token)
+    if moves or headers:
+        yield PgnGame(headers, moves, headers.get("Result", result))
+
+
+def formatHeader(tag, value):
+    return '[{} "{}"]'.format(tag, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+
+
+def writeGame(pgnFile, game: PgnGame):
+    """Writes one game in PGN, the seven tag roster first and the move text wrapped to LINE_LENGTH."""
+    headers = dict(game.headers, Result=game.result)
+    for tag in SEVEN_TAG_ROSTER:
+        pgnFile.write(formatHeader(tag, headers.get(tag, "?")) + "\n")
+    for tag, value in headers.items():
+        if tag not in SEVEN_TAG_ROSTER:
+            pgnFile.write(formatHeader(tag, value) + "\n")
+    pgnFile.write("\n")
+    tokens = []
+    # a game from a position where black moves first starts with the move number and three dots
+    whiteToMove = " w " in headers.get("FEN", " w ")
+    moveNumber = int(headers["FEN"].split()[5]) if "FEN" in headers else 1
+    for ply, san in enumerate(game.moves):
+        if whiteToMove:
+            tokens.append(f"{moveNumber}.")
+        elif ply == 0:
+            tokens.append(f"{moveNumber}...")
+        tokens.append(san)
+        if not whiteToMove:
+            moveNumber += 1
+        whiteToMove = not whiteToMove
+    tokens.append(game.result)
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            pgnFile.write(line + "\n")
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    pgnFile.write(line + "\n\n")
+
+
+def recordToGame(record):
+    """Turns a game of the match history into a PGN game, writing its moves in standard algebraic notation."""
+    controller = engine.GameController(engine.BitboardBoard)
+    sanMoves = []
+    for moveString in record["moves"]:
+        controller.calculateLegalMoves()
+        move, promotionType = findMove(controller, moveString)
+        sanMoves.append(moveToSan(controller, move, promotionType))
+        makeMove(controller, move, promotionType)
+    startingTime, increment = record["timeControl"]
+    headers = {
+        "Event": "Discord Chess",
+        "Site": "Discord",
+        "Date": record["endedAt"][:10].replace("-", "."),
+        "Round": "-",
+        "White": record["whiteName"],
+        "Black": record["blackName"],
+        "TimeControl": f"{startingTime}+{increment}",
+        "Termination": record["termination"],
+    }
+    return PgnGame(headers, sanMoves, record["result"])
+
+
+def gameToRecord(game: PgnGame):
+    """
+    Turns a PGN game into a match history record, with its moves in the full notation that processMove takes.
+    Raises one of the move errors if a move isn't legal.
+    """
+    controller = startController(game.headers)
+    moveStrings = []
+    for san in game.moves:
+        controller.calculateLegalMoves()
+        move, promotionType = parseSan(controller, san)
+        moveStrings.append(moveToString(move, promotionType))
+        makeMove(controller, move, promotionType)
+    return {
+        "white": None,
+        "black": None,
+        "whiteName": game.headers.get("White", "?"),
+        "blackName": game.headers.get("Black", "?"),
+        "result": game.result,
+        "termination": game.headers.get("Termination", "normal"),
+        "timeControl": [0, 0],
+        "endedAt": game.headers.get("Date", "????.??.??").replace(".", "-") + " 00:00",
+        "moves": moveStrings,
+    }
+
+
+def importGames(pgnPath, recordsPath):
+    """
+    Reads the games of a PGN file into match history records, one line each, which the analysis and the
+    opening book read like the match history. Games that don't start from the normal starting position
+    or have a move that can't be made are skipped. Returns how many games were imported and skipped.
+    """
+    imported = skipped = 0
+    with open(pgnPath, "r", encoding="utf-8", errors="replace") as pgnFile, \
+            open(recordsPath, "w") as recordsFile:
+        for game in iterGames(pgnFile):
+            if "FEN" in game.headers:
+                skipped += 1
+                continue
+            try:
+                record = gameToRecord(game)
+            except (engine.MoveErrors, engine.InvalidFenError):
+                skipped += 1
+                continue
+            imported += 1
+            record["sequence"] = imported
+            recordsFile.write(json.dumps(record) + "\n")
+    return imported, skipped
+
+
+def exportGames(historyPath, pgnPath):
+    """Writes every game of the match history that has its moves into a PGN file, returning how many there were."""
+    exported = 0
+    with open(historyPath, "r") as journal, open(pgnPath, "w") as pgnFile:
+        for line in journal:
+            if not line.endswith("\n"):
+                break
+            record = json.loads(line)
+            if "moves" in record:
+                writeGame(pgnFile, recordToGame(record))
+                exported += 1
+    return exported
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Imports games from PGN files and exports the match history.")
+    parser.add_argument("action", choices=("import", "export"))
+    parser.add_argument("source", help="the PGN file to import, or the match history to export")
+    parser.add_argument("destination", help="the records file to import into, or the PGN file to export to")
+    args = parser.parse_args()
+    startTime = time.perf_counter()
+    if args.action == "import":
+        importedCount, skippedCount = importGames(args.source, args.destination)
+        print(f"Imported {importedCount} games and skipped {skippedCount} in {time.perf_counter() - startTime:.1f}s")
+    else:
+        exportedCount = exportGames(args.source, args.destination)
+        print(f"Exported {exportedCount} games in {time.perf_counter() - startTime:.1f}s")
@@ -0,0 +1,181 @@
+import numpy as np
+
+import batch
+import engine
+import search
+
+# The directions the pieces move in as (row, col) steps, the same ones the engine uses
+ROOK_DIRECTIONS = engine.ROOK_DIRECTIONS
+BISHOP_DIRECTIONS = engine.BISHOP_DIRECTIONS
+KNIGHT_OFFSETS = engine.KNIGHT_OFFSETS
+KING_OFFSETS = engine.ROOK_DIRECTIONS + engine.BISHOP_DIRECTIONS
+# the row step of the pawns of each color, white pawns move towards row 0
+PAWN_STEPS = (1, -1)
+
+# The material and piece square score of every piece index on every square, from white's point of view
+PIECE_SQUARE_SCORES = np.array(search.PIECE_SQUARE_SCORES, dtype=np.int32).reshape(12, 8, 8)
+
+
+class PositionPlanes:
+    """
+    The positions of a batch as a tensor of shape (positions, 12, 8, 8), with one plane of booleans for every
+    piece index that is set on the squares with a piece of that index, along with the color to move of every
+    position. Every routine below works on all of the positions at once.
+    """
+
+    def __init__(self, planes, activeColors):
+        self.planes = planes
+        self.activeColors = activeColors
+
+    def __len__(self):
+        return len(self.planes)
+
+    @classmethod
+    def fromBatch(cls, positions: batch.PositionBatch):
+        """Unpacks the piece bitboards of a position batch into planes, without going through a board."""
+        recordBytes, _ = positions.toBytes()
+        records = np.frombuffer(recordBytes, dtype="<u8").reshape(-1, batch.RECORD_WORDS)
+        # bit n of a bitboard is square n, which is row n // 8 and col n % 8
+        squares = np.unpackbits(np.ascontiguousarray(records[:, :12]).view(np.uint8).reshape(-1, 12, 8),
+                                axis=2, bitorder="little")
+        return cls(squares.reshape(-1, 12, 8, 8).astype(bool), (records[:, 12] & 1).astype(bool))
+
+    @classmethod
+    def fromControllers(cls, controllers):
+        positions = batch.PositionBatch()
+        for controller in controllers:
+            positions.addController(controller)
+        return cls.fromBatch(positions)
+
+    def getOccupancy(self):
+        """Returns the squares with pieces of each color, of shape (positions, 2, 8, 8) with black first."""
+        return np.stack((self.planes[:, :6].any(axis=1), self.planes[:, 6:].any(axis=1)), axis=1)
+
+
+def shift(squares, rowStep, colStep):
+    """Moves every set square of the (..., 8, 8) planes by the step, dropping the squares that go off the board."""
+    shifted = np.zeros_like(squares)
+    shifted[..., max(rowStep, 0):8 + min(rowStep, 0), max(colStep, 0):8 + min(colStep, 0)] = \
+        squares[..., max(-rowStep, 0):8 + min(-rowStep, 0), max(-colStep, 0):8 + min(-colStep, 0)]
+    return shifted
+
+
+def iterAttacks(planes: PositionPlanes, color: bool):
+    """
+    Goes through the attacks of the pieces of one color, one direction or offset of one kind of piece at a time.
+    The squares attacked in one step are never attacked twice in that step, since two pieces can't reach
+    the same square with the same offset and the ray of a sliding piece stops at the next piece on its line,
+    so the number of moves is the sum of the steps.
+    """
+    offset = 6 if color else 0
+    pieces = planes.planes
+    occupied = planes.getOccupancy().any(axis=1)
+    pawns = pieces[:, offset]
+    for colStep in (1, -1):
+        yield shift(pawns, PAWN_STEPS[color], colStep)
+    for rowStep, colStep in KNIGHT_OFFSETS:
+        yield shift(pieces[:, offset + 1], rowStep, colStep)
+    for rowStep, colStep in KING_OFFSETS:
+        yield shift(pieces[:, offset + 5], rowStep, colStep)
+    queens = pieces[:, offset + 4]
+    for directions, sliders in ((BISHOP_DIRECTIONS, pieces[:, offset + 2] | queens),
+                                (ROOK_DIRECTIONS, pieces[:, offset + 3] | queens)):
+        for rowStep, colStep in directions:
+            # the ray goes on through empty squares and stops on the first piece
+            ray = shift(sliders, rowStep, colStep)
+            attacks = ray
+            for _ in range(6):
+                ray = shift(ray & ~occupied, rowStep, colStep)
+                attacks = attacks | ray
+            yield attacks
+
+
+def calculateAttackMaps(planes: PositionPlanes):
+    """
+    Returns the squares attacked by each color, of shape (positions, 2, 8, 8) with black first,
+    the same squares as BitboardBoard.isSquareAttacked.
+    """
+    attackMaps = np.zeros((len(planes), 2, 8, 8), dtype=bool)
+    for color in (False, True):
+        for attacks in iterAttacks(planes, color):
+            attackMaps[:, int(color)] |= attacks
+    return attackMaps
+
+
+def calculateMobility(planes: PositionPlanes):
+    """
+    Returns the number of moves each color could make if it was their turn, of shape (positions, 2) with black
+    first, counted like BitboardBoard.calculateMoves without castling, en passant or checking for pins.
+    """
+    mobility = np.zeros((len(planes), 2), dtype=np.int32)
+    occupancy = planes.getOccupancy()
+    empty = ~occupancy.any(axis=1)
+    for color in (False, True):
+        own = occupancy[:, int(color)]
+        enemy = occupancy[:, int(not color)]
+        for step, attacks in enumerate(iterAttacks(planes, color)):
+            # the first two steps are the pawn captures, which need an enemy piece on the square
+            targets = attacks & enemy if step < 2 else attacks & ~own
+            mobility[:, int(color)] += targets.sum(axis=(1, 2))
+        pawnStep = PAWN_STEPS[color]
+        pushes = shift(planes.planes[:, 6 if color else 0], pawnStep, 0) & empty
+        mobility[:, int(color)] += pushes.sum(axis=(1, 2))
+        # the pawns that could push one square from their starting row can push two squares
+        firstPushRow = 5 if color else 2
+        mobility[:, int(color)] += (pushes[:, firstPushRow] & empty[:, firstPushRow + pawnStep]).sum(axis=1)
+    return mobility
+
+
+def calculateScores(planes: PositionPlanes):
+    """Returns the material and piece square score of every position from white's point of view."""
+    return np.einsum("npij,pij->n", planes.planes.astype(np.int32), PIECE_SQUARE_SCORES)
+
+
+def evaluate(planes: PositionPlanes):
+    """Scores every position like search.evaluate, from the point of view of the player to move."""
+    scores = calculateScores(planes)
+    return np.where(planes.activeColors, scores, -scores)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Checks the batch routines against the engine and measures them.")
+    parser.add_argument("--positions", type=int, default=2000)
+    args = parser.parse_args()
+
+    # positions from random games, which have every kind of piece and plenty of captures and promotions
+    controllers = batch.randomPositions(args.positions)
+
+    startTime = time.perf_counter()
+    scalarAttacks, scalarMobility, scalarScores = [], [], []
+    for gameController in controllers:
+        board = gameController.getBoard()
+        scalarAttacks.append([[[board.isSquareAttacked(row, col, color) for col in range(8)] for row in range(8)]
+                              for color in (False, True)])
+        scalarMobility.append([len(board.calculateMoves(color, [])) for color in (False, True)])
+        scalarScores.append(search.evaluate(gameController))
+    scalarSeconds = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    positionPlanes = PositionPlanes.fromControllers(controllers)
+    packSeconds = time.perf_counter() - startTime
+    startTime = time.perf_counter()
+    attackMaps = calculateAttackMaps(positionPlanes)
+    mobilityCounts = calculateMobility(positionPlanes)
+    positionScores = evaluate(positionPlanes)
+    batchSeconds = time.perf_counter() - startTime
+
+    mismatches = np.flatnonzero((attackMaps != np.array(scalarAttacks)).any(axis=(1, 2, 3)) |
+                                (mobilityCounts != np.array(scalarMobility)).any(axis=1) |
+                                (positionScores != np.array(scalarScores)))
+    for index in mismatches[:5]:
+        print(f"Position {index} differs: {controllers[index].toFen()}")
+    print(f"{len(controllers)} positions, {len(mismatches)} differ from the engine")
+    print(f"Engine one position at a time: {scalarSeconds * 1000:.0f}ms "
+          f"({len(controllers) / scalarSeconds:.0f} positions/s)")
+    print(f"Planes: {packSeconds * 1000:.0f}ms to pack, {batchSeconds * 1000:.0f}ms for the whole batch "
+          f"({len(controllers) / batchSeconds:.0f} positions/s)")
+    if len(mismatches):
+        raise SystemExit(1)
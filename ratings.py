@@ -0,0 +1,386 @@
+import math
+import random
+
+# The rating, rating deviation and volatility of a player who hasn't played yet
+STARTING_RATING = 1500.0
+STARTING_DEVIATION = 350.0
+STARTING_VOLATILITY = 0.06
+# How much the volatility can change, smaller values keep it steadier
+VOLATILITY_CHANGE = 0.5
+# The ratings are scaled by this for the calculations of Glicko-2
+GLICKO_SCALE = 173.7178
+CONVERGENCE_TOLERANCE = 0.000001
+
+# The old ratings started at 1000 and were only ever moved by 5 points, they keep their distance from it
+LEGACY_STARTING_RATING = 1000
+LEGACY_RATING_CHANGE = 5
+
+# The levels of the skip list of the leaderboard, which is enough for millions of players
+SKIP_LIST_LEVELS = 24
+
+# The score of white for every result of a game
+RESULT_SCORES = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+
+
+class PlayerRating:
+    """The Glicko-2 rating of a player, with its deviation which is how unsure the rating is, and its volatility."""
+
+    __slots__ = ("rating", "deviation", "volatility")
+
+    def __init__(self, rating=STARTING_RATING, deviation=STARTING_DEVIATION, volatility=STARTING_VOLATILITY):
+        self.rating = rating
+        self.deviation = deviation
+        self.volatility = volatility
+
+    def toList(self):
+        """Returns the rating as the list it is saved as."""
+        return [round(self.rating, 2), round(self.deviation, 2), round(self.volatility, 6)]
+
+    @classmethod
+    def fromSaved(cls, saved):
+        """Reads a rating saved by toList, or an old rating that was only a number."""
+        if isinstance(saved, (int, float)):
+            return cls(STARTING_RATING + saved - LEGACY_STARTING_RATING)
+        return cls(*saved)
+
+
+def calculateRating(player: PlayerRating, results):
+    """
+    Works out the new rating of a player after a rating period with the Glicko-2 system, from the
+    (opponent rating, score) of every game the player played in it, where the score is 1 for a win,
+    0.5 for a draw and 0 for a loss. The opponent ratings are the ones from before the period.
+    """
+    mu = (player.rating - STARTING_RATING) / GLICKO_SCALE
+    phi = player.deviation / GLICKO_SCALE
+    variance = 0.0
+    improvement = 0.0
+    for opponent, score in results:
+        opponentMu = (opponent.rating - STARTING_RATING) / GLICKO_SCALE
+        opponentPhi = opponent.deviation / GLICKO_SCALE
+        # games against opponents with unsure ratings count for less
+        weight = 1 / math.sqrt(1 + 3 * opponentPhi ** 2 / math.pi ** 2)
+        expectedScore = 1 / (1 + math.exp(-weight * (mu - opponentMu)))
+        variance += weight ** 2 * expectedScore * (1 - expectedScore)
+        improvement += weight * (score - expectedScore)
+    if variance == 0:
+        # a player who didn't play only becomes more unsure
+        return PlayerRating(player.rating, min(math.sqrt(phi ** 2 + player.volatility ** 2) * GLICKO_SCALE,
+                                               STARTING_DEVIATION), player.volatility)
+    variance = 1 / variance
+    delta = variance * improvement
+    volatility = calculateVolatility(phi, player.volatility, variance, delta)
+    newPhi = 1 / math.sqrt(1 / (phi ** 2 + volatility ** 2) + 1 / variance)
+    newMu = mu + newPhi ** 2 * improvement
+    return PlayerRating(newMu * GLICKO_SCALE + STARTING_RATING, newPhi * GLICKO_SCALE, volatility)
+
+
+def calculateVolatility(phi, volatility, variance, delta):
+    """Finds the new volatility of Glicko-2 with the Illinois algorithm."""
+    a = math.log(volatility ** 2)
+
+    def f(x):
+        return (math.exp(x) * (delta ** 2 - phi ** 2 - variance - math.exp(x)) /
+                (2 * (phi ** 2 + variance + math.exp(x)) ** 2) - (x - a) / VOLATILITY_CHANGE ** 2)
+
+    lower = a
+    if delta ** 2 > phi ** 2 + variance:
+        upper = math.log(delta ** 2 - phi ** 2 - variance)
+    else:
+        k = 1
+        while f(a - k * VOLATILITY_CHANGE) < 0:
+            k += 1
+        upper = a - k * VOLATILITY_CHANGE
+    fLower, fUpper = f(lower), f(upper)
+    while abs(upper - lower) > CONVERGENCE_TOLERANCE:
+        middle = lower + (lower - upper) * fLower / (fUpper - fLower)
+        fMiddle = f(middle)
+        if fMiddle * fUpper <= 0:
+            lower, fLower = upper, fUpper
+        else:
+            fLower /= 2
+        upper, fUpper = middle, fMiddle
+    return math.exp(lower / 2)
+
+
+class SkipListNode:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level):
+        self.key = key
+        # the next node on every level and how many places along the list it is
+        self.next = [None] * level
+        self.width = [1] * level
+
+
+class RatingSkipList:
+    """
+    Keeps every player in leaderboard order in an indexable skip list, where every link also knows how many
+    players it skips. Adding or removing a player, the rank of a player and the player at some rank are all
+    found in O(log n) steps, instead of sorting every player.
+    Players are ordered by their exact rating, highest first, and players with the same rating by their id,
+    so every player has a rank of their own and the ranks match the order of the pages.
+    """
+
+    def __init__(self, seed=2022):
+        self._random = random.Random(seed)
+        self._size = 0
+        # the end of the list, which comes after every player on every level
+        self._end = SkipListNode((math.inf, 0), 0)
+        self._head = SkipListNode(None, SKIP_LIST_LEVELS)
+        self._head.next = [self._end] * SKIP_LIST_LEVELS
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def getKey(playerID, rating):
+        return -rating, playerID
+
+    def findPrevious(self, key):
+        """Returns the last node before the key on every level, and how many places along the list each one is."""
+        previous = [None] * SKIP_LIST_LEVELS
+        positions = [0] * SKIP_LIST_LEVELS
+        node = self._head
+        position = 0
+        for level in reversed(range(SKIP_LIST_LEVELS)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            previous[level] = node
+            positions[level] = position
+        return previous, positions
+
+    def add(self, playerID, rating):
+        key = self.getKey(playerID, rating)
+        previous, positions = self.findPrevious(key)
+        # every level has half the nodes of the level below it
+        level = 1
+        while level < SKIP_LIST_LEVELS and self._random.random() < 0.5:
+            level += 1
+        node = SkipListNode(key, level)
+        # the new node goes right after the previous node of the bottom level
+        position = positions[0] + 1
+        for index in range(level):
+            previousNode = previous[index]
+            node.next[index] = previousNode.next[index]
+            node.width[index] = previousNode.width[index] - (position - positions[index]) + 1
+            previousNode.next[index] = node
+            previousNode.width[index] = position - positions[index]
+        for index in range(level, SKIP_LIST_LEVELS):
+            previous[index].width[index] += 1
+        self._size += 1
+
+    def remove(self, playerID, rating):
+        key = self.getKey(playerID, rating)
+        previous, _ = self.findPrevious(key)
+        node = previous[0].next[0]
+        if node.key != key:
+            raise KeyError(playerID)
+        for index in range(len(node.next)):
+            previousNode = previous[index]
+            previousNode.width[index] += node.width[index] - 1
+            previousNode.next[index] = node.next[index]
+        for index in range(len(node.next), SKIP_LIST_LEVELS):
+            previous[index].width[index] -= 1
+        self._size -= 1
+
+    def getRank(self, playerID, rating):
+        """Returns the rank of the player, 1 for the highest rated player."""
+        key = self.getKey(playerID, rating)
+        node = self._head
+        position = 0
+        for level in reversed(range(SKIP_LIST_LEVELS)):
+            while node.next[level].key <= key:
+                position += node.width[level]
+                node = node.next[level]
+        if node.key != key:
+            raise KeyError(playerID)
+        return position
+
+    def getRange(self, start, count):
+        """Returns the (player, rating) of count players from the start-th highest rated one, counting from 0."""
+        node = self._head
+        # the head is place 0, so the start-th player is at place start + 1
+        remaining = start + 1
+        for level in reversed(range(SKIP_LIST_LEVELS)):
+            while node.width[level] <= remaining and node.next[level] is not self._end:
+                remaining -= node.width[level]
+                node = node.next[level]
+        players = []
+        if remaining != 0:
+            return players
+        while node is not self._end and len(players) < count:
+            players.append((node.key[1], -node.key[0]))
+            node = node.next[0]
+        return players
+
+
+class RatingService:
+    """
+    Keeps the ratings of every player by their id and updates them after every game with Glicko-2,
+    along with the leaderboard of every player that has played.
+    """
+
+    def __init__(self):
+        self._ratings = {}
+        self._leaderboard = RatingSkipList()
+
+    def load(self, savedRatings):
+        """Sets up the ratings that were saved by the game storage, where the player ids are strings."""
+        self._ratings = {}
+        self._leaderboard = RatingSkipList()
+        for playerID, saved in savedRatings.items():
+            self.setRating(int(playerID), PlayerRating.fromSaved(saved))
+
+    def getRating(self, playerID) -> PlayerRating:
+        """Returns the rating of the player, or None if they haven't played a game yet."""
+        return self._ratings.get(playerID)
+
+    def setRating(self, playerID, rating: PlayerRating):
+        oldRating = self._ratings.get(playerID)
+        if oldRating is not None:
+            self._leaderboard.remove(playerID, oldRating.rating)
+        self._ratings[playerID] = rating
+        self._leaderboard.add(playerID, rating.rating)
+
+    def recordGame(self, whiteID, blackID, result):
+        """
+        Updates the ratings of both players after a game with the result "1-0", "0-1" or "1/2-1/2", every game
+        is its own rating period. Returns the new ratings of both players as they are saved.
+        """
+        white = self._ratings.get(whiteID) or PlayerRating()
+        black = self._ratings.get(blackID) or PlayerRating()
+        score = RESULT_SCORES[result]
+        self.setRating(whiteID, calculateRating(white, [(black, score)]))
+        self.setRating(blackID, calculateRating(black, [(white, 1 - score)]))
+        return {whiteID: self._ratings[whiteID].toList(), blackID: self._ratings[blackID].toList()}
+
+    def recompute(self, records, legacyRatings=None):
+        """
+        Works out every rating again from the start, by going through the finished games in order on top of
+        the legacy ratings, where the player ids are strings. The games of the old match history only have a
+        summary and are left out, since their results are already in the legacy ratings.
+        A game that was rated the old way, with a flat 5 points, saved the old ratings of its players after it,
+        so the players start from the old rating they had before their first such game instead.
+        """
+        startingRatings = dict((int(playerID), saved) for playerID, saved in (legacyRatings or {}).items())
+        # only the players, the result and the saved ratings are kept of every game, not their moves
+        games = []
+        playedIDs = set()
+        for record in records:
+            if record.get("white") is None or record.get("black") is None or \
+                    record.get("result") not in RESULT_SCORES:
+                continue
+            games.append((record["white"], record["black"], record["result"]))
+            for playerID, score in ((record["white"], RESULT_SCORES[record["result"]]),
+                                    (record["black"], 1 - RESULT_SCORES[record["result"]])):
+                if playerID in playedIDs:
+                    continue
+                playedIDs.add(playerID)
+                saved = record.get("ratings", {}).get(str(playerID))
+                if isinstance(saved, (int, float)):
+                    # a draw didn't change the old ratings
+                    startingRatings[playerID] = saved - round((score - 0.5) * 2) * LEGACY_RATING_CHANGE
+        self._ratings = {}
+        self._leaderboard = RatingSkipList()
+        for playerID, saved in startingRatings.items():
+            self.setRating(playerID, PlayerRating.fromSaved(saved))
+        for whiteID, blackID, result in games:
+            self.recordGame(whiteID, blackID, result)
+
+    def getSavedRatings(self):
+        """Returns every rating as the game storage saves them."""
+        return dict((str(playerID), rating.toList()) for playerID, rating in self._ratings.items())
+
+    def getRank(self, playerID):
+        """Returns the rank of the player on the leaderboard, or None if they haven't played a game yet."""
+        rating = self._ratings.get(playerID)
+        if rating is None:
+            return None
+        return self._leaderboard.getRank(playerID, rating.rating)
+
+    def getPlayerCount(self):
+        return len(self._leaderboard)
+
+    def getLeaderboardPage(self, page, perPage):
+        """Returns the (rank, player id, rating) of one page of the leaderboard, pages start from 0."""
+        return [(page * perPage + offset + 1, playerID, self._ratings[playerID])
+                for offset, (playerID, _) in enumerate(self._leaderboard.getRange(page * perPage, perPage))]
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import time
+
+    import storage
+
+    parser = argparse.ArgumentParser(description="Works out every rating again from the match history, "
+                                                 "or measures the leaderboard.")
+    parser.add_argument("action", choices=("recompute", "bench"))
+    parser.add_argument("--directory", default=".", help="where the match history and ratings are")
+    parser.add_argument("--players", type=int, default=100000)
+    args = parser.parse_args()
+
+    if args.action == "recompute":
+        # this should only be run while the bot is stopped, since it replaces the ratings it saved
+        gameStorage = storage.GameStorage(args.directory)
+        gameStorage.loadFiles()
+        service = RatingService()
+        with open(gameStorage.getJournalPath(), "r") as journal:
+            service.recompute((json.loads(line) for line in journal if line.endswith("\n")),
+                              gameStorage.getLegacyRatings())
+        gameStorage.replaceRatings(service.getSavedRatings())
+        print(f"Worked out the ratings of {service.getPlayerCount()} players again")
+    else:
+        # the example of the Glicko-2 paper
+        example = calculateRating(PlayerRating(1500, 200), [(PlayerRating(1400, 30), 1), (PlayerRating(1550, 100), 0),
+                                                            (PlayerRating(1700, 300), 0)])
+        print(f"Glicko-2 example: {example.rating:.2f} {example.deviation:.2f} {example.volatility:.5f}, "
+              f"the paper has 1464.06 151.52 0.05999")
+        rng = random.Random(2022)
+        service = RatingService()
+        startTime = time.perf_counter()
+        for playerID in range(args.players):
+            service.setRating(playerID, PlayerRating(rng.gauss(1500, 300)))
+        setupSeconds = time.perf_counter() - startTime
+        startTime = time.perf_counter()
+        for _ in range(10000):
+            service.recordGame(rng.randrange(args.players), rng.randrange(args.players),
+                               rng.choice(list(RESULT_SCORES)))
+        gameSeconds = (time.perf_counter() - startTime) / 10000
+        probes = [rng.randrange(args.players) for _ in range(10000)]
+        startTime = time.perf_counter()
+        ranks = [service.getRank(playerID) for playerID in probes]
+        rankSeconds = (time.perf_counter() - startTime) / len(probes)
+        startTime = time.perf_counter()
+        sortedPlayers = sorted(range(args.players), key=lambda playerID: (-service.getRating(playerID).rating, playerID))
+        sortSeconds = time.perf_counter() - startTime
+        for playerID, rank in zip(probes[:200], ranks):
+            assert sortedPlayers[rank - 1] == playerID
+        startTime = time.perf_counter()
+        for page in range(0, 1000, 10):
+            leaderboardPage = service.getLeaderboardPage(page, 10)
+            assert [playerID for _, playerID, _ in leaderboardPage] == sortedPlayers[page * 10:page * 10 + 10]
+        pageSeconds = (time.perf_counter() - startTime) / 100
+        print(f"{args.players} players set up in {setupSeconds:.2f}s, {gameSeconds * 1000000:.0f}us per game")
+        print(f"Rank of a player: {rankSeconds * 1000000:.1f}us, a page of 10: {pageSeconds * 1000000:.0f}us, "
+              f"sorting every player instead: {sortSeconds * 1000:.0f}ms")
+
+        # the first game of two new players always gives the same two ratings, so many players can be tied
+        service = RatingService()
+        for playerID in range(0, 40000, 2):
+            service.recordGame(playerID, playerID + 1, "1-0")
+        tiedPlayers = sorted(range(40000), key=lambda playerID: (-service.getRating(playerID).rating, playerID))
+        probes = [rng.randrange(40000) for _ in range(10000)]
+        startTime = time.perf_counter()
+        for playerID in probes:
+            assert tiedPlayers[service.getRank(playerID) - 1] == playerID
+        rankSeconds = (time.perf_counter() - startTime) / len(probes)
+        startTime = time.perf_counter()
+        for page in range(0, 4000, 40):
+            for rank, playerID, _ in service.getLeaderboardPage(page, 10):
+                assert tiedPlayers[rank - 1] == playerID and service.getRank(playerID) == rank
+        pageSeconds = (time.perf_counter() - startTime) / 100
+        print(f"With 20000 players tied on each of two ratings: rank {rankSeconds * 1000000:.1f}us, "
+              f"a page of 10 with the ranks checked: {pageSeconds * 1000000:.0f}us")
@@ -0,0 +1,186 @@
+import collections
+import io
+
+import engine
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    # the board images need Pillow, without it only the text board can be drawn
+    Image = None
+
+# How many positions of each kind of drawing are kept, the least recently shown ones are dropped first
+RENDER_CACHE_SIZE = 512
+
+# The size of one square of the board images in pixels, and the border around the board with the coordinates
+SQUARE_SIZE = 48
+IMAGE_BORDER = 20
+LIGHT_SQUARE_COLOR = (240, 217, 181)
+DARK_SQUARE_COLOR = (181, 136, 99)
+BORDER_COLOR = (49, 46, 43)
+COORDINATE_COLOR = (220, 220, 220)
+# the fill and outline of the pieces of each color, which are drawn as a disc with the letter of the piece
+WHITE_PIECE_COLORS = ((250, 250, 250), (30, 30, 30))
+BLACK_PIECE_COLORS = ((30, 30, 30), (250, 250, 250))
+
+
+def imagesAvailable():
+    """Returns whether board images can be drawn, which needs Pillow to be installed."""
+    return Image is not None
+
+
+def drawBoardImage(board: engine.Board, whiteAtBottom=True, squareSize=SQUARE_SIZE) -> bytes:
+    """Draws the board as a PNG image, seen from white's side or from black's side."""
+    size = squareSize * 8 + IMAGE_BORDER * 2
+    image = Image.new("RGB", (size, size), BORDER_COLOR)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+
+    def corner(row, col):
+        # the top left corner of the square in the image, the board is turned around for black
+        if not whiteAtBottom:
+            row, col = 7 - row, 7 - col
+        return IMAGE_BORDER + col * squareSize, IMAGE_BORDER + row * squareSize
+
+    for row in range(8):
+        for col in range(8):
+            left, top = corner(row, col)
+            color = LIGHT_SQUARE_COLOR if (row + col) % 2 == 0 else DARK_SQUARE_COLOR
+            draw.rectangle((left, top, left + squareSize - 1, top + squareSize - 1), fill=color)
+    for index in range(8):
+        left, top = corner(index, index)
+        draw.text((left + squareSize // 2 - 3, size - IMAGE_BORDER + 4), "abcdefgh"[index], fill=COORDINATE_COLOR,
+                  font=font)
+        draw.text((IMAGE_BORDER // 2 - 3, top + squareSize // 2 - 5), str(8 - index), fill=COORDINATE_COLOR,
+                  font=font)
+    margin = squareSize // 6
+    for index, square in board.getPieceSquares():
+        left, top = corner(square >> 3, square & 7)
+        fill, outline = WHITE_PIECE_COLORS if index >= 6 else BLACK_PIECE_COLORS
+        draw.ellipse((left + margin, top + margin, left + squareSize - margin, top + squareSize - margin),
+                     fill=fill, outline=outline, width=2)
+        draw.text((left + squareSize // 2 - 3, top + squareSize // 2 - 5), engine.PIECE_TYPES[index % 6].upper(),
+                  fill=outline, font=font)
+    imageBytes = io.BytesIO()
+    image.save(imageBytes, "PNG")
+    return imageBytes.getvalue()
+
+
+class BoardRenderer:
+    """
+    Keeps the drawings of the boards that were shown recently, by the hash of the position and the side the
+    board is seen from, so a position is only drawn once no matter how often it is shown. The text boards
+    go in the game embeds, and the images are only drawn when they are asked for.
+    """
+
+    def __init__(self, maxPositions=RENDER_CACHE_SIZE, squareSize=SQUARE_SIZE):
+        self._maxPositions = maxPositions
+        self._squareSize = squareSize
+        self._texts = collections.OrderedDict()
+        self._images = collections.OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def getText(self, board: engine.Board, positionHash, whiteAtBottom=True) -> str:
+        """Returns the board drawn with box drawing characters."""
+        return self.getDrawing(self._texts, board, positionHash, whiteAtBottom, board.toText)
+
+    def getImage(self, board: engine.Board, positionHash, whiteAtBottom=True) -> bytes:
+        """Returns the board as a PNG image, or None when Pillow isn't installed."""
+        if not imagesAvailable():
+            return None
+        return self.getDrawing(self._images, board, positionHash, whiteAtBottom,
+                               lambda bottom: drawBoardImage(board, bottom, self._squareSize))
+
+    def getDrawing(self, cache, board, positionHash, whiteAtBottom, draw):
+        key = (positionHash, whiteAtBottom)
+        drawing = cache.get(key)
+        if drawing is not None:
+            cache.move_to_end(key)
+            self._hits += 1
+            return drawing
+        self._misses += 1
+        drawing = draw(whiteAtBottom)
+        cache[key] = drawing
+        if len(cache) > self._maxPositions:
+            cache.popitem(last=False)
+        return drawing
+
+    def getStats(self):
+        """Returns how many drawings are kept and how often a drawing could be reused."""
+        return {
+            "texts": len(self._texts),
+            "images": len(self._images),
+            "hits": self._hits,
+            "misses": self._misses,
+        }
+
+
+if __name__ == '__main__':
+    import random
+    import time
+
+    # shows the positions of a few random games again and again, like the game messages of several games
+    rng = random.Random(2022)
+    positions = []
+    controller = engine.GameController(engine.BitboardBoard)
+    while len(positions) < 200:
+        controller.calculateLegalMoves()
+        if len(controller.getMoves()) == 0 or controller.getHalfmoveClock() >= 40:
+            controller = engine.GameController(engine.BitboardBoard)
+            continue
+        controller.setPromotionType("q")
+        controller.makeMove(rng.choice(controller.getMoves()))
+        controller.setPromotionType(None)
+        controller.setActiveColor(not controller.getActiveColor())
+        positions.append((engine.GameController.fromFen(controller.toFen(), engine.BitboardBoard).getBoard(),
+                          controller.getHash()))
+    shown = [rng.choice(positions) for _ in range(2000)]
+
+    def drawOldText(board):
+        # how the boards were drawn before, one cell at a time onto the string from the grid of the board
+        boardStr = "    A   B   C   D   E   F   G   H\n  ╔═══╦═══╦═══╦═══╦═══╦═══╦═══╦═══╗\n"
+        for i, row in enumerate(board.getGrid()):
+            boardStr += f"{8-i} ║"
+            for j, piece in enumerate(row):
+                if piece is None:
+                    boardStr += "   ║" if (i + j) % 2 == 0 else "░░░║"
+                else:
+                    boardStr += f" {piece} ║"
+            boardStr += "\n"
+            if i < 7:
+                boardStr += "  ╠═══╬═══╬═══╬═══╬═══╬═══╬═══╬═══╣\n"
+        return boardStr + "  ╚═══╩═══╩═══╩═══╩═══╩═══╩═══╩═══╝"
+
+    startTime = time.perf_counter()
+    for board, _ in shown:
+        drawOldText(board)
+    oldSeconds = time.perf_counter() - startTime
+    startTime = time.perf_counter()
+    for board, _ in shown:
+        board.toText()
+    joinedSeconds = time.perf_counter() - startTime
+    renderer = BoardRenderer()
+    startTime = time.perf_counter()
+    for board, positionHash in shown:
+        renderer.getText(board, positionHash)
+    cachedSeconds = time.perf_counter() - startTime
+    for board, positionHash in shown:
+        assert renderer.getText(board, positionHash) == drawOldText(board)
+    print(f"Text boards, {len(shown)} shown of {len(positions)} positions:")
+    print(f"  Old concatenation: {oldSeconds / len(shown) * 1000000:.1f}us per board")
+    print(f"  Joined rows:       {joinedSeconds / len(shown) * 1000000:.1f}us per board")
+    print(f"  Cached:            {cachedSeconds / len(shown) * 1000000:.1f}us per board")
+    if imagesAvailable():
+        startTime = time.perf_counter()
+        for board, _ in shown[:100]:
+            drawBoardImage(board)
+        drawSeconds = (time.perf_counter() - startTime) / 100
+        renderer = BoardRenderer()
+        startTime = time.perf_counter()
+        for board, positionHash in shown:
+            renderer.getImage(board, positionHash)
+        cachedSeconds = (time.perf_counter() - startTime) / len(shown)
+        print(f"Board images: {drawSeconds * 1000:.2f}ms to draw, {cachedSeconds * 1000:.3f}ms per board cached")
+    else:
+        print("Pillow isn't installed, so the board images weren't measured")
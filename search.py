@@ -0,0 +1,423 @@
+import time
+
+import engine
+import transposition
+
+# The values of the piece types in PIECE_TYPES order, in centipawns
+PIECE_VALUES = (100, 320, 330, 500, 900, 0)
+
+# Piece square tables for the white pieces, in the same orientation as the board so row 0 is the 8th rank.
+# The black pieces use the same tables flipped upside down.
+PAWN_TABLE = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    5, 5, 10, 25, 25, 10, 5, 5,
+    0, 0, 0, 20, 20, 0, 0, 0,
+    5, -5, -10, 0, 0, -10, -5, 5,
+    5, 10, 10, -20, -20, 10, 10, 5,
+    0, 0, 0, 0, 0, 0, 0, 0,
+)
+KNIGHT_TABLE = (
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20, 0, 0, 0, 0, -20, -40,
+    -30, 0, 10, 15, 15, 10, 0, -30,
+    -30, 5, 15, 20, 20, 15, 5, -30,
+    -30, 0, 15, 20, 20, 15, 0, -30,
+    -30, 5, 10, 15, 15, 10, 5, -30,
+    -40, -20, 0, 5, 5, 0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+)
+BISHOP_TABLE = (
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 10, 10, 5, 0, -10,
+    -10, 5, 5, 10, 10, 5, 5, -10,
+    -10, 0, 10, 10, 10, 10, 0, -10,
+    -10, 10, 10, 10, 10, 10, 10, -10,
+    -10, 5, 0, 0, 0, 0, 5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20,
+)
+ROOK_TABLE = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    5, 10, 10, 10, 10, 10, 10, 5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    0, 0, 0, 5, 5, 0, 0, 0,
+)
+QUEEN_TABLE = (
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 5, 5, 5, 0, -10,
+    -5, 0, 5, 5, 5, 5, 0, -5,
+    0, 0, 5, 5, 5, 5, 0, -5,
+    -10, 5, 5, 5, 5, 5, 0, -10,
+    -10, 0, 5, 0, 0, 0, 0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20,
+)
+KING_TABLE = (
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    20, 20, 0, 0, 0, 0, 20, 20,
+    20, 30, 10, 0, 0, 10, 30, 20,
+)
+PIECE_TABLES = (PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_TABLE)
+
+
+def _pieceSquareScores():
+    """
+    Combines the piece values and the piece square tables into one score for every piece index and square,
+    from white's point of view so the black pieces have negative scores.
+    """
+    scores = []
+    for color in (False, True):
+        for pieceIndex, table in enumerate(PIECE_TABLES):
+            if color:
+                scores.append([PIECE_VALUES[pieceIndex] + table[square] for square in range(64)])
+            else:
+                # flips the row of the square, the column stays the same
+                scores.append([-PIECE_VALUES[pieceIndex] - table[square ^ 56] for square in range(64)])
+    return scores
+
+
+PIECE_SQUARE_SCORES = _pieceSquareScores()
+
+MATE_SCORE = 100000
+# scores above this are a checkmate in some number of moves
+MATE_THRESHOLD = MATE_SCORE - 1000
+INFINITY = MATE_SCORE + 1
+# the computer always promotes to a queen, the other pieces are almost never better
+PROMOTION_TYPE = "q"
+# how many nodes are searched between checks of the clock
+TIME_CHECK_INTERVAL = 1024
+# the memory budget of the transposition table a searcher makes when it isn't given one
+DEFAULT_TABLE_MEGABYTES = 16
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time for the move has run out"""
+    pass
+
+
+class SearchResult:
+    """The best move that was found along with its score, the depth that was completed and the search statistics."""
+
+    def __init__(self, move, promotionType, score, depth, nodes, seconds):
+        self.move = move
+        self.promotionType = promotionType
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.seconds = seconds
+        # the counters of the transposition table after the search
+        self.tableStats = None
+
+    def getMoveString(self):
+        """Writes the move in the notation that the game controller's processMove takes."""
+        if self.move is None:
+            return None
+        moveString = repr(self.move)
+        if self.promotionType is not None:
+            moveString += self.promotionType
+        return moveString
+
+
+def scoreToTable(score, ply):
+    """
+    Checkmate scores count the moves from the root of the search, but the table needs them counted
+    from the stored position itself, since the same position can be reached at any ply.
+    """
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def scoreFromTable(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+def evaluate(controller: engine.GameController) -> int:
+    """Scores the position by material and piece squares, from the point of view of the player to move."""
+    board = controller.getBoard()
+    score = 0
+    if isinstance(board, engine.BitboardBoard):
+        for color in (False, True):
+            for pieceIndex, pieceType in enumerate(engine.PIECE_TYPES):
+                scores = PIECE_SQUARE_SCORES[pieceIndex + (6 if color else 0)]
+                pieces = board.getBitboard(color, pieceType)
+                while pieces:
+                    bit = pieces & -pieces
+                    pieces ^= bit
+                    score += scores[bit.bit_length() - 1]
+    else:
+        for square in range(64):
+            piece = board.getPiece(square >> 3, square & 7)
+            if piece is not None:
+                score += PIECE_SQUARE_SCORES[piece.getIndex()][square]
+    if controller.getActiveColor():
+        return score
+    return -score
+
+
+class Searcher:
+    """
+    Finds the best move for the player to move with an iterative deepening alpha-beta search.
+    Every iteration searches one move deeper than the last, and the best move of the last iteration
+    is searched first, so that the search can be stopped at any time and still give a good move.
+
+    The searcher makes moves on its own game controller, so a copy of the game's controller should be given.
+    The results of every searched position are kept in a transposition table, which can be shared between
+    the searches of one game so the next move starts with what was found before.
+    """
+
+    def __init__(self, controller: engine.GameController, maxDepth=4, timeLimit=None,
+                 table: transposition.TranspositionTable = None):
+        self._controller = controller
+        if table is None:
+            table = transposition.TranspositionTable(DEFAULT_TABLE_MEGABYTES)
+        self._table = table
+        self._maxDepth = maxDepth
+        # seconds the search is allowed to take, or None to always finish every depth
+        self._timeLimit = timeLimit
+        self._deadline = None
+        self._nodes = 0
+        # how many moves deep the search is on the controller, so it can be taken back to the root after a timeout
+        self._movesMade = 0
+        # two quiet moves per ply that caused a cutoff, tried right after the captures
+        self._killerMoves = []
+
+    def search(self) -> SearchResult:
+        start = time.perf_counter()
+        if self._timeLimit is not None:
+            self._deadline = start + self._timeLimit
+        self._nodes = 0
+        self._killerMoves = [[None, None] for _ in range(self._maxDepth + 1)]
+        self._table.newSearch()
+        rootMoves = list(self._controller.calculateLegalMoves())
+        result = SearchResult(None, None, 0, 0, 0, 0.0)
+        if len(rootMoves) == 0:
+            return result
+        # there is always a move to give back, even if the first depth doesn't finish
+        result.move = rootMoves[0]
+        result.promotionType = PROMOTION_TYPE if rootMoves[0].getFlags() & engine.MOVE_FLAG_PROMOTION else None
+        for depth in range(1, self._maxDepth + 1):
+            try:
+                bestMove, score = self.searchRoot(rootMoves, depth)
+            except SearchTimeout:
+                while self._movesMade > 0:
+                    self.unmakeMove()
+                break
+            result.move = bestMove
+            result.promotionType = PROMOTION_TYPE if bestMove.getFlags() & engine.MOVE_FLAG_PROMOTION else None
+            result.score = score
+            result.depth = depth
+            # the best move is searched first in the next iteration
+            rootMoves.remove(bestMove)
+            rootMoves.insert(0, bestMove)
+            if abs(score) >= MATE_THRESHOLD:
+                break
+            # the next depth takes several times longer, so it isn't started if it can't finish
+            if self._deadline is not None and time.perf_counter() - start > self._timeLimit / 2:
+                break
+        result.nodes = self._nodes
+        result.seconds = time.perf_counter() - start
+        result.tableStats = self._table.getStats()
+        return result
+
+    def searchRoot(self, moves, depth):
+        alpha = -INFINITY
+        bestMove = moves[0]
+        for move in moves:
+            self.makeMove(move)
+            score = -self.alphaBeta(depth - 1, 1, -INFINITY, -alpha)
+            self.unmakeMove()
+            if score > alpha:
+                alpha = score
+                bestMove = move
+        self._table.store(self._controller.getHash(), depth, scoreToTable(alpha, 0), transposition.BOUND_EXACT,
+                          bestMove.getMoveID())
+        return bestMove, alpha
+
+    def alphaBeta(self, depth, ply, alpha, beta):
+        """Scores the position from the point of view of the player to move with a negamax alpha-beta search."""
+        self.countNode()
+        controller = self._controller
+        if controller.getDrawReason() is not None:
+            return 0
+        if depth <= 0:
+            return self.quiescence(alpha, beta, ply)
+        positionHash = controller.getHash()
+        entry = self._table.probe(positionHash)
+        tableMoveID = transposition.NO_MOVE
+        if entry is not None:
+            entryDepth, entryScore, bound, tableMoveID = entry
+            # a result from a search that went at least as deep can be used instead of searching again
+            if entryDepth >= depth:
+                entryScore = scoreFromTable(entryScore, ply)
+                if bound == transposition.BOUND_EXACT or \
+                        (bound == transposition.BOUND_LOWER and entryScore >= beta) or \
+                        (bound == transposition.BOUND_UPPER and entryScore <= alpha):
+                    return entryScore
+        moves = controller.calculateLegalMoves()
+        if len(moves) == 0:
+            if controller.inCheck():
+                # checkmates that happen sooner are scored higher
+                return -MATE_SCORE + ply
+            return 0
+        originalAlpha = alpha
+        bestMoveID = transposition.NO_MOVE
+        for move in self.orderMoves(moves, ply, tableMoveID):
+            self.makeMove(move)
+            score = -self.alphaBeta(depth - 1, ply + 1, -beta, -alpha)
+            self.unmakeMove()
+            if score >= beta:
+                if not move.getFlags() & engine.MOVE_FLAG_CAPTURE:
+                    killers = self._killerMoves[ply]
+                    if killers[0] is None or killers[0].getMoveID() != move.getMoveID():
+                        killers[1] = killers[0]
+                        killers[0] = move
+                self._table.store(positionHash, depth, scoreToTable(beta, ply), transposition.BOUND_LOWER,
+                                  move.getMoveID())
+                return beta
+            if score > alpha:
+                alpha = score
+                bestMoveID = move.getMoveID()
+        if alpha > originalAlpha:
+            self._table.store(positionHash, depth, scoreToTable(alpha, ply), transposition.BOUND_EXACT, bestMoveID)
+        else:
+            self._table.store(positionHash, depth, scoreToTable(alpha, ply), transposition.BOUND_UPPER)
+        return alpha
+
+    def quiescence(self, alpha, beta, ply):
+        """
+        Keeps searching the captures after the last depth, so that a position isn't scored
+        right in the middle of a trade of pieces.
+        """
+        controller = self._controller
+        inCheck = controller.inCheck()
+        if not inCheck:
+            # the player doesn't have to capture, so the current score is the least they can get
+            standPat = evaluate(controller)
+            if standPat >= beta:
+                return beta
+            if standPat > alpha:
+                alpha = standPat
+        if inCheck:
+            # every move that gets out of check is searched, and there might not be one
+            moves = controller.calculateLegalMoves()
+            if len(moves) == 0:
+                return -MATE_SCORE + ply
+        else:
+            # only the captures and promotions are generated, the quiet moves are never looked at
+            moves = list(controller.iterLegalMoves(quietMoves=False))
+        for move in self.orderMoves(moves, None, transposition.NO_MOVE):
+            self.countNode()
+            self.makeMove(move)
+            score = -self.quiescence(-beta, -alpha, ply + 1)
+            self.unmakeMove()
+            if score >= beta:
+                return beta
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def orderMoves(self, moves, ply, tableMoveID):
+        """
+        Sorts the moves so that the ones most likely to be good are searched first, which lets alpha-beta
+        skip more of the tree. The best move stored in the transposition table comes first, then captures
+        of valuable pieces by cheap pieces, then promotions, then the killer moves of the ply.
+        """
+        board = self._controller.getBoard()
+        if ply is not None:
+            killers = self._killerMoves[ply]
+            killerIDs = [killer.getMoveID() for killer in killers if killer is not None]
+        else:
+            killerIDs = []
+        scoredMoves = []
+        move: engine.Move
+        for move in moves:
+            flags = move.getFlags()
+            score = 0
+            if flags & engine.MOVE_FLAG_CAPTURE:
+                if flags & engine.MOVE_FLAG_EN_PASSANT:
+                    victimValue = PIECE_VALUES[0]
+                else:
+                    victimValue = PIECE_VALUES[board.getPiece(move.getTargetRow(), move.getTargetCol()).getIndex() % 6]
+                score = 10 * victimValue - PIECE_VALUES[engine.PIECE_TYPES.index(move.getPieceType())] + 10000
+            if flags & engine.MOVE_FLAG_PROMOTION:
+                score += PIECE_VALUES[4] + 10000
+            elif move.getMoveID() in killerIDs:
+                score += 5000
+            if move.getMoveID() == tableMoveID:
+                score += 100000
+            scoredMoves.append((score, move))
+        scoredMoves.sort(key=lambda scoredMove: scoredMove[0], reverse=True)
+        return [scoredMove[1] for scoredMove in scoredMoves]
+
+    def makeMove(self, move):
+        controller = self._controller
+        if move.getFlags() & engine.MOVE_FLAG_PROMOTION:
+            controller.setPromotionType(PROMOTION_TYPE)
+        controller.makeMove(move)
+        controller.setPromotionType(None)
+        controller.setActiveColor(not controller.getActiveColor())
+        self._movesMade += 1
+
+    def unmakeMove(self):
+        self._controller.setActiveColor(not self._controller.getActiveColor())
+        self._controller.unmakeMove()
+        self._movesMade -= 1
+
+    def countNode(self):
+        self._nodes += 1
+        if self._deadline is not None and self._nodes % TIME_CHECK_INTERVAL == 0 and \
+                time.perf_counter() > self._deadline:
+            raise SearchTimeout
+
+
+def calculateTimeLimit(remainingSeconds, increment, maxSeconds):
+    """
+    Works out how long the computer can think about one move, which is a small part of its remaining time
+    so that it never runs out of time, and never more than the longest time it is allowed to think.
+    """
+    timeLimit = remainingSeconds / 30 + increment / 2
+    return max(0.1, min(maxSeconds, timeLimit, remainingSeconds / 2))
+
+
+def findBestMove(controller: engine.GameController, maxDepth=4, timeLimit=None, table=None) -> SearchResult:
+    """Searches a copy of the game controller for the best move of the player to move."""
+    return Searcher(controller.copy(), maxDepth, timeLimit, table).search()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Searches a position for the best move.")
+    parser.add_argument("--fen", default="rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--time", type=float, default=None, help="seconds to search for")
+    parser.add_argument("--hash", type=float, default=DEFAULT_TABLE_MEGABYTES,
+                        help="megabytes for the transposition table")
+    args = parser.parse_args()
+    searchResult = findBestMove(engine.GameController.fromFen(args.fen, engine.BitboardBoard), args.depth, args.time,
+                                transposition.TranspositionTable(args.hash))
+    print(f"Best move: {searchResult.getMoveString()} score {searchResult.score} depth {searchResult.depth}, "
+          f"{searchResult.nodes} nodes in {searchResult.seconds:.3f}s "
+          f"({searchResult.nodes / max(searchResult.seconds, 1e-9):.0f} nps)")
+    stats = searchResult.tableStats
+    print(f"Transposition table: {stats['entries']} entries ({stats['megabytes']:.1f} MB), "
+          f"{stats['hits']} hits, {stats['misses']} misses ({stats['hitRate']:.1%} hit rate), "
+          f"{stats['collisions']} collisions, {stats['overwrites']} overwrites, {stats['fillRate']:.1%} full")
@@ -0,0 +1,447 @@
+import array
+import asyncio
+import json
+import os
+
+# How long a finished game waits for other games to finish, so their results are written together
+FLUSH_DELAY = 1.0
+# How long a move waits for the moves of other games, so their snapshots are written together.
+# This is also the most that is lost of a game when the bot stops suddenly.
+SNAPSHOT_FLUSH_DELAY = 0.5
+# How long the background tasks wait before writing again after a write failed, for example with a full disk
+RETRY_DELAY = 5.0
+
+
+def writeFileAtomically(path, data: bytes):
+    """
+    Writes the file through a temporary file that replaces it in one step, so a crash in the middle
+    of writing leaves the old file instead of a half written one.
+    """
+    temporaryPath = path + ".tmp"
+    with open(temporaryPath, "wb") as temporaryFile:
+        temporaryFile.write(data)
+        temporaryFile.flush()
+        os.fsync(temporaryFile.fileno())
+    os.replace(temporaryPath, path)
+
+
+class GameStorage:
+    """
+    Saves the finished games and the ratings of the players without blocking the event loop.
+
+    Every finished game is appended as one line to the journal, along with the new ratings of its players,
+    and the journal is never rewritten. The ratings are saved in a small snapshot that also remembers how
+    much of the journal it includes, and it is replaced atomically after every write. Loading reads the
+    snapshot and only replays the games of the journal that came after it.
+
+    Results are gathered for a short time and written together by one background task,
+    the files themselves are written in a thread so the bot keeps responding in the meantime.
+
+    The games are kept on disk, and only an index of where every game starts in the journal and which games
+    every player played is kept in memory. A page of the history only reads the games on that page.
+    """
+
+    def __init__(self, directory=".", flushDelay=FLUSH_DELAY):
+        self._journalPath = os.path.join(directory, "match_history.jsonl")
+        self._snapshotPath = os.path.join(directory, "elo.json")
+        # the old match history, which is moved into the journal the first time the games are loaded
+        self._legacyHistoryPath = os.path.join(directory, "match_history.json")
+        self._flushDelay = flushDelay
+        # the ratings as they are on disk, and the journal position and sequence number of the last saved game
+        self._ratings = {}
+        # the ratings of the old elo file, which are kept so the ratings can be worked out again from them
+        self._legacyRatings = {}
+        self._journalOffset = 0
+        self._sequence = 0
+        # where every game that is on disk starts in the journal, and the numbers of the games of every player,
+        # games are numbered in the order they finished starting from 0
+        self._gameOffsets = array.array("Q")
+        self._playerGames = {}
+        # the games that are waiting to be written, and every game that isn't on disk yet in order
+        self._pending = []
+        self._unwritten = []
+        self._pendingEvent = None
+        self._task = None
+        self._lock = None
+
+    async def load(self):
+        """Reads the ratings and builds the index of the finished games, returning the ratings."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.loadFiles)
+
+    def loadFiles(self):
+        if not os.path.exists(self._journalPath) and os.path.exists(self._legacyHistoryPath):
+            self.migrateLegacyHistory()
+        snapshot = {}
+        try:
+            with open(self._snapshotPath, "r") as snapshotFile:
+                snapshot = dict(json.load(snapshotFile))
+        except FileNotFoundError:
+            pass
+        except json.JSONDecodeError:
+            print("Elo loading error, skipping...")
+        if "ratings" in snapshot:
+            self._ratings = dict(snapshot["ratings"])
+            self._journalOffset = snapshot["journalOffset"]
+            self._sequence = snapshot["sequence"]
+            # the snapshots from before the legacy ratings were kept still have them as the plain numbers
+            self._legacyRatings = snapshot.get("legacyRatings", dict(
+                (playerID, rating) for playerID, rating in self._ratings.items() if not isinstance(rating, list)))
+        else:
+            # the old elo file only has the ratings, so the whole journal is replayed on top of them
+            self._ratings = snapshot
+            self._legacyRatings = dict(snapshot)
+            self._journalOffset = 0
+        self._gameOffsets = array.array("Q")
+        self._playerGames = {}
+        if not os.path.exists(self._journalPath):
+            return dict(self._ratings)
+        with open(self._journalPath, "rb") as journal:
+            validLength = 0
+            for line in journal:
+                if not line.endswith(b"\n"):
+                    # the last game was only partly written when the bot stopped
+                    break
+                record = json.loads(line)
+                self.indexGame(len(self._gameOffsets), record)
+                self._gameOffsets.append(validLength)
+                # the games before the snapshot's position already have their ratings in the snapshot
+                if validLength >= self._journalOffset:
+                    self._ratings.update(record["ratings"])
+                    self._sequence = max(self._sequence, record["sequence"])
+                validLength += len(line)
+        if validLength != os.path.getsize(self._journalPath):
+            with open(self._journalPath, "r+b") as journal:
+                journal.truncate(validLength)
+        self._journalOffset = validLength
+        return dict(self._ratings)
+
+    def getJournalPath(self):
+        return self._journalPath
+
+    def getLegacyRatings(self):
+        return dict(self._legacyRatings)
+
+    def encodeSnapshot(self, sequence):
+        return json.dumps({"sequence": sequence, "journalOffset": self._journalOffset, "ratings": self._ratings,
+                           "legacyRatings": self._legacyRatings}).encode()
+
+    def replaceRatings(self, ratings: dict):
+        """
+        Replaces every saved rating, after they were worked out again from the whole journal.
+        The bot shouldn't be running, since the snapshot is written right away.
+        """
+        self._ratings = dict(ratings)
+        writeFileAtomically(self._snapshotPath, self.encodeSnapshot(self._sequence))
+
+    def indexGame(self, number, record):
+        # the games of the old match history only have a summary and aren't linked to players
+        for playerID in {record.get("white"), record.get("black")}:
+            if playerID is not None:
+                self._playerGames.setdefault(playerID, array.array("I")).append(number)
+
+    def migrateLegacyHistory(self):
+        """Moves the summaries of the old match history file into the journal."""
+        try:
+            with open(self._legacyHistoryPath, "r") as historyFile:
+                summaries = list(json.load(historyFile))
+        except json.JSONDecodeError:
+            print("Game history loading error, skipping...")
+            return
+        lines = [json.dumps({"sequence": sequence, "summary": summary, "ratings": {}}) + "\n"
+                 for sequence, summary in enumerate(summaries, start=1)]
+        writeFileAtomically(self._journalPath, "".join(lines).encode())
+
+    def start(self):
+        """Starts the background task that writes the finished games."""
+        if self._task is None:
+            self._pendingEvent = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.create_task(self.run())
+
+    def isRunning(self):
+        return self._task is not None
+
+    def recordGame(self, record: dict, ratings: dict):
+        """
+        Queues the record of a finished game with the new ratings of its players to be written soon,
+        the game is in the history right away.
+        """
+        self._sequence += 1
+        record = dict(record, sequence=self._sequence,
+                      ratings=dict((str(playerID), rating) for playerID, rating in ratings.items()))
+        self.indexGame(len(self._gameOffsets) + len(self._unwritten), record)
+        self._pending.append(record)
+        self._unwritten.append(record)
+        if self._pendingEvent is not None:
+            self._pendingEvent.set()
+
+    async def run(self):
+        while True:
+            await self._pendingEvent.wait()
+            # the games that finish in the meantime are written along with this one
+            await asyncio.sleep(self._flushDelay)
+            try:
+                await self.flush()
+            except Exception as error:
+                # the games are still queued, so the task keeps going and writes them again later
+                print(f"Saving the finished games failed, trying again in {RETRY_DELAY}s: {error!r}")
+                await asyncio.sleep(RETRY_DELAY)
+                self._pendingEvent.set()
+
+    async def flush(self):
+        """Writes every queued game, and waits until they are on disk."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._pendingEvent is not None:
+                self._pendingEvent.clear()
+            if len(self._pending) == 0:
+                return
+            records = self._pending
+            self._pending = []
+            try:
+                offsets = await asyncio.get_running_loop().run_in_executor(None, self.writeRecords, records)
+            except Exception:
+                # none of the games are in the journal, so they are written again with the games queued since
+                self._pending = records + self._pending
+                raise
+            # the written games are read from the journal from now on
+            self._gameOffsets.extend(offsets)
+            del self._unwritten[:len(records)]
+
+    def writeRecords(self, records):
+        """
+        Appends the games to the journal and then replaces the snapshot, this runs in a thread.
+        Returns where each of the games starts in the journal.
+        """
+        lines = [(json.dumps(record) + "\n").encode() for record in records]
+        offsets = []
+        journalOffset = self._journalOffset
+        for line in lines:
+            offsets.append(journalOffset)
+            journalOffset += len(line)
+        with open(self._journalPath, "ab") as journal:
+            # a write that failed part of the way can leave the start of a line, which is written over
+            journal.truncate(self._journalOffset)
+            journal.write(b"".join(lines))
+            journal.flush()
+            os.fsync(journal.fileno())
+        # the journal only moves on once the games are on disk
+        self._journalOffset = journalOffset
+        for record in records:
+            self._ratings.update(record["ratings"])
+        try:
+            writeFileAtomically(self._snapshotPath, self.encodeSnapshot(records[-1]["sequence"]))
+        except OSError as error:
+            # the games are in the journal already, which is replayed on top of the older snapshot when loading,
+            # so the snapshot is only written again with the next games
+            print(f"Saving the ratings snapshot failed: {error!r}")
+        return offsets
+
+    def getGameCount(self, playerID=None):
+        """Returns how many games have been played in total, or by one player."""
+        if playerID is None:
+            return len(self._gameOffsets) + len(self._unwritten)
+        return len(self._playerGames.get(playerID, ()))
+
+    async def getHistoryPage(self, page, perPage, playerID=None):
+        """
+        Returns the records of one page of the finished games with the newest games first,
+        of every game or only the games of one player. Pages start from 0.
+        """
+        if playerID is None:
+            numbers = range(self.getGameCount())
+        else:
+            numbers = self._playerGames.get(playerID, ())
+        end = max(len(numbers) - page * perPage, 0)
+        pageNumbers = list(reversed(numbers[max(end - perPage, 0):end]))
+        writtenCount = len(self._gameOffsets)
+        offsets = [self._gameOffsets[number] for number in pageNumbers if number < writtenCount]
+        # the games that aren't on disk are taken before waiting, since they can be written in the meantime
+        unwrittenRecords = iter([self._unwritten[number - writtenCount] for number in pageNumbers
+                                 if number >= writtenCount])
+        diskRecords = iter(await asyncio.get_running_loop().run_in_executor(None, self.readRecords, offsets))
+        return [next(diskRecords) if number < writtenCount else next(unwrittenRecords) for number in pageNumbers]
+
+    def readRecords(self, offsets):
+        """Reads the games that start at the offsets of the journal, this runs in a thread."""
+        records = []
+        with open(self._journalPath, "rb") as journal:
+            for offset in offsets:
+                journal.seek(offset)
+                records.append(json.loads(journal.readline()))
+        return records
+
+    async def close(self):
+        """Stops the background task after writing everything that is still queued."""
+        # a write that is already going on finishes first, since flush waits for it
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+
+class ActiveGameStore:
+    """
+    Keeps a snapshot of every game that is going on, so the games can carry on after the bot restarts.
+
+    Every game has its own small file, which is replaced atomically whenever the game changes, so a move only
+    rewrites the snapshot of its own game and a crash leaves either the old or the new snapshot.
+    Like the finished games, the snapshots are gathered for a short time and written by one background task
+    in a thread. Only the newest snapshot of a game is written if it changed more than once in the meantime.
+    """
+
+    def __init__(self, directory=".", flushDelay=SNAPSHOT_FLUSH_DELAY):
+        self._directory = os.path.join(directory, "active_games")
+        self._flushDelay = flushDelay
+        # the newest snapshot of every game that changed since the last write, None for games that have ended
+        self._pending = {}
+        self._pendingEvent = None
+        self._task = None
+        self._lock = None
+
+    async def load(self):
+        """Reads the snapshots of the games that were going on when the bot stopped."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.loadFiles)
+
+    def loadFiles(self):
+        snapshots = {}
+        if not os.path.isdir(self._directory):
+            return snapshots
+        for fileName in os.listdir(self._directory):
+            if not fileName.endswith(".json"):
+                # a temporary file of a write that didn't finish
+                continue
+            try:
+                with open(os.path.join(self._directory, fileName), "r") as snapshotFile:
+                    snapshots[fileName[:-5]] = json.load(snapshotFile)
+            except json.JSONDecodeError:
+                print(f"Game snapshot {fileName} loading error, skipping...")
+        return snapshots
+
+    def start(self):
+        """Starts the background task that writes the snapshots."""
+        if self._task is None:
+            self._pendingEvent = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.create_task(self.run())
+
+    def isRunning(self):
+        return self._task is not None
+
+    def save(self, key, snapshot: dict):
+        """Queues the snapshot of a game to be written soon, replacing its older snapshot."""
+        self._pending[key] = snapshot
+        if self._pendingEvent is not None:
+            self._pendingEvent.set()
+
+    def remove(self, key):
+        """Queues the snapshot of a game that has ended to be deleted."""
+        self.save(key, None)
+
+    async def run(self):
+        while True:
+            await self._pendingEvent.wait()
+            await asyncio.sleep(self._flushDelay)
+            try:
+                await self.flush()
+            except Exception as error:
+                print(f"Saving the game snapshots failed, trying again in {RETRY_DELAY}s: {error!r}")
+                await asyncio.sleep(RETRY_DELAY)
+                self._pendingEvent.set()
+
+    async def flush(self):
+        """Writes every queued snapshot, and waits until they are on disk."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._pendingEvent is not None:
+                self._pendingEvent.clear()
+            if len(self._pending) == 0:
+                return
+            snapshots = self._pending
+            self._pending = {}
+            # the snapshots are turned into json before going to the thread, since the games keep changing
+            files = dict((key, None if snapshot is None else json.dumps(snapshot).encode())
+                         for key, snapshot in snapshots.items())
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.writeSnapshots, files)
+            except Exception:
+                # writing a snapshot again does no harm, but a game that changed since keeps its newer snapshot
+                for key, snapshot in snapshots.items():
+                    self._pending.setdefault(key, snapshot)
+                raise
+
+    def writeSnapshots(self, files):
+        """Replaces or deletes the snapshot files of the games, this runs in a thread."""
+        os.makedirs(self._directory, exist_ok=True)
+        for key, data in files.items():
+            path = os.path.join(self._directory, key + ".json")
+            if data is not None:
+                writeFileAtomically(path, data)
+            elif os.path.exists(path):
+                os.remove(path)
+
+    async def close(self):
+        """Stops the background task after writing everything that is still queued."""
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+    import time
+
+    parser = argparse.ArgumentParser(description="Measures saving finished games and reading pages of the history.")
+    parser.add_argument("--games", type=int, default=20000, help="games already in the history")
+    parser.add_argument("--players", type=int, default=500)
+    args = parser.parse_args()
+
+    async def measure(directory):
+        records = [{"white": number % args.players, "black": (number * 7 + 1) % args.players,
+                    "whiteName": f"Player {number % args.players}",
+                    "blackName": f"Player {(number * 7 + 1) % args.players}", "result": "1-0", "termination": "checkmate", "timeControl": [600, 0], "endedAt": "2022-02-08 20:11",
+                    "moves": ["pf2f3", "pe7e5", "pg2g4", "qd8h4"] * 10} for number in range(args.games)]
+        ratings = dict((str(number), 1000) for number in range(args.players))
+        # the old way rewrote both files on the event loop after every game
+        start = time.perf_counter()
+        for _ in range(5):
+            with open(os.path.join(directory, "old_elo.json"), "w") as eloFile:
+                json.dump(ratings, eloFile)
+            with open(os.path.join(directory, "old_history.json"), "w") as historyFile:
+                json.dump(records, historyFile)
+        oldSeconds = (time.perf_counter() - start) / 5
+
+        gameStorage = GameStorage(directory, flushDelay=0.05)
+        await gameStorage.load()
+        gameStorage.start()
+        start = time.perf_counter()
+        for record in records:
+            gameStorage.recordGame(record, {record["white"]: 1005, record["black"]: 995})
+        loopSeconds = (time.perf_counter() - start) / args.games
+        await gameStorage.close()
+
+        gameStorage = GameStorage(directory)
+        start = time.perf_counter()
+        loadedRatings = await gameStorage.load()
+        loadSeconds = time.perf_counter() - start
+        playerCount = len(set(record["white"] for record in records) | set(record["black"] for record in records))
+        assert gameStorage.getGameCount() == args.games and len(loadedRatings) == playerCount
+        start = time.perf_counter()
+        for page in range(100):
+            assert len(await gameStorage.getHistoryPage(page, 10)) == min(max(args.games - page * 10, 0), 10)
+            playerID = page % args.players
+            # a player can have fewer games than the pages that are read
+            expectedLength = min(max(gameStorage.getGameCount(playerID) - (page % 4) * 10, 0), 10)
+            assert len(await gameStorage.getHistoryPage(page % 4, 10, playerID)) == expectedLength
+        pageSeconds = (time.perf_counter() - start) / 200
+        print(f"Old rewrite on the event loop: {oldSeconds * 1000:.2f}ms per game with {args.games} games saved")
+        print(f"Queuing a game on the event loop: {loopSeconds * 1000000:.1f}us per game")
+        print(f"Loading {args.games} games and {args.players} ratings: {loadSeconds * 1000:.1f}ms")
+        print(f"Reading a page of 10 games: {pageSeconds * 1000:.2f}ms")
+
+    with tempfile.TemporaryDirectory() as temporaryDirectory:
+        asyncio.run(measure(temporaryDirectory))
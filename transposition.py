@@ -0,0 +1,130 @@
+import array
+
+# The bound types of a stored score, 0 is kept for empty entries
+BOUND_EXACT = 1
+# the real score is at least the stored score, since the search was cut off by beta
+BOUND_LOWER = 2
+# the real score is at most the stored score, since no move got above alpha
+BOUND_UPPER = 3
+
+# Each entry is two 64 bit integers, the full position hash and a data word packed as:
+# bits 0-11 the move id of the best move (0 when there isn't one), bits 12-13 the bound type,
+# bits 14-21 the depth, bits 22-29 the generation of the search and bits 30-51 the score.
+ENTRY_BYTES = 16
+SCORE_OFFSET = 1 << 21
+NO_MOVE = 0
+
+
+class TranspositionTable:
+    """
+    A fixed size table of search results keyed by the zobrist hash of the position, so that a position
+    that is reached again through a different order of moves doesn't have to be searched again.
+
+    All of the entries are stored in two preallocated arrays, one for the hashes and one for the packed data,
+    so the table never uses more memory than its budget. Entries come in buckets of two: the first one
+    keeps the deepest result (or the newest one from an older search), and the second one is always replaced.
+    """
+
+    def __init__(self, megabytes=16):
+        # the number of buckets is rounded down to a power of two, so the bucket is a mask of the hash
+        bucketCount = 1
+        while bucketCount * 2 * 2 * ENTRY_BYTES <= megabytes * 1024 * 1024:
+            bucketCount *= 2
+        self._mask = bucketCount - 1
+        self._keys = array.array("Q", bytes(bucketCount * 2 * 8))
+        self._data = array.array("Q", bytes(bucketCount * 2 * 8))
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._collisions = 0
+        self._stores = 0
+        self._overwrites = 0
+
+    def getSize(self):
+        """Returns how many entries the table can hold."""
+        return len(self._keys)
+
+    def getMemoryUsage(self):
+        """Returns the bytes used by the entries."""
+        return len(self._keys) * self._keys.itemsize + len(self._data) * self._data.itemsize
+
+    def newSearch(self):
+        """Starts a new generation, so that the entries of earlier searches are replaced first."""
+        self._generation = (self._generation + 1) & 0xFF
+
+    def clear(self):
+        self._keys = array.array("Q", bytes(len(self._keys) * 8))
+        self._data = array.array("Q", bytes(len(self._data) * 8))
+        self._generation = 0
+
+    def probe(self, positionHash):
+        """
+        Looks up the position, returning (depth, score, bound, move id) for the stored result,
+        or None when the position isn't in the table.
+        """
+        index = (positionHash & self._mask) << 1
+        keys = self._keys
+        if keys[index] == positionHash:
+            data = self._data[index]
+        elif keys[index + 1] == positionHash:
+            data = self._data[index + 1]
+        else:
+            self._misses += 1
+            # the bucket is being used by other positions that share the same bucket
+            if self._data[index] != 0:
+                self._collisions += 1
+            return None
+        self._hits += 1
+        return (data >> 14) & 0xFF, (data >> 30) - SCORE_OFFSET, (data >> 12) & 3, data & 0xFFF
+
+    def store(self, positionHash, depth, score, bound, moveID=NO_MOVE):
+        self._stores += 1
+        index = (positionHash & self._mask) << 1
+        keys = self._keys
+        data = self._data
+        stored = data[index]
+        # the depth preferred entry is replaced by the same position, a result that is at least as deep
+        # or any result once it is left over from an earlier search
+        if keys[index] == positionHash or stored == 0 or depth >= (stored >> 14) & 0xFF or \
+                (stored >> 22) & 0xFF != self._generation:
+            if keys[index] == positionHash and moveID == NO_MOVE:
+                # a result without a best move keeps the best move it already had
+                moveID = stored & 0xFFF
+        else:
+            index += 1
+        if data[index] != 0 and keys[index] != positionHash:
+            self._overwrites += 1
+        keys[index] = positionHash
+        data[index] = ((score + SCORE_OFFSET) << 30) | (self._generation << 22) | (min(depth, 0xFF) << 14) | \
+            (bound << 12) | moveID
+
+    def getFillRate(self, sampleSize=1000):
+        """Estimates the share of entries that are used, from the first entries of the table."""
+        sample = self._data[:min(sampleSize, len(self._data))]
+        return sum(1 for data in sample if data != 0) / max(len(sample), 1)
+
+    def getStats(self):
+        """
+        Returns the counters of the table: probes that found their position (hits), probes that didn't (misses),
+        misses in a bucket that was filled by other positions (collisions), results stored, and stored results
+        that replaced a different position (overwrites).
+        """
+        probes = self._hits + self._misses
+        return {
+            "entries": self.getSize(),
+            "megabytes": self.getMemoryUsage() / (1024 * 1024),
+            "hits": self._hits,
+            "misses": self._misses,
+            "collisions": self._collisions,
+            "stores": self._stores,
+            "overwrites": self._overwrites,
+            "hitRate": self._hits / probes if probes else 0.0,
+            "fillRate": self.getFillRate(),
+        }
+
+    def resetStats(self):
+        self._hits = 0
+        self._misses = 0
+        self._collisions = 0
+        self._stores = 0
+        self._overwrites = 0